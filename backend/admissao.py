@@ -0,0 +1,279 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+from auth import AUTH_HASH_WORKERS
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+# Liga/desliga o controle de admissão (rate limit + limite de concorrência)
+ADMISSAO_HABILITADA = os.getenv("ADMISSAO_HABILITADA", "true").lower() == "true"
+# Requisições que usam o banco ao mesmo tempo neste worker; padrão: capacidade do pool
+ADMISSAO_CONCORRENCIA = int(os.getenv("ADMISSAO_CONCORRENCIA", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+# Logins e cadastros ao mesmo tempo; vagas separadas das do banco (o gargalo deles é o hash da senha)
+ADMISSAO_AUTH_CONCORRENCIA = int(os.getenv("ADMISSAO_AUTH_CONCORRENCIA", str(2 * AUTH_HASH_WORKERS)))
+# Requisições esperando vaga; acima disso são recusadas na hora
+ADMISSAO_FILA_MAX = int(os.getenv("ADMISSAO_FILA_MAX", "100"))
+# Chaves (empresa/cliente) com balde em memória
+ADMISSAO_MAX_CHAVES = int(os.getenv("ADMISSAO_MAX_CHAVES", "50000"))
+
+def _limite(classe: str, nome: str, padrao: float) -> float:
+    return float(os.getenv(f"ADMISSAO_{classe.upper()}_{nome}", str(padrao)))
+
+class LimitesClasse:
+    """Limites de uma classe de rotas; taxas em requisições por segundo, por worker"""
+
+    def __init__(self, classe: str, taxa_empresa: float, rajada_empresa: float,
+                 taxa_cliente: float, rajada_cliente: float, espera_max: float):
+        self.classe = classe
+        self.taxa_empresa = _limite(classe, "TAXA_EMPRESA", taxa_empresa)
+        self.rajada_empresa = _limite(classe, "RAJADA_EMPRESA", rajada_empresa)
+        self.taxa_cliente = _limite(classe, "TAXA_CLIENTE", taxa_cliente)
+        self.rajada_cliente = _limite(classe, "RAJADA_CLIENTE", rajada_cliente)
+        # Espera máxima por uma vaga de concorrência antes de recusar com 503
+        self.espera_max = _limite(classe, "ESPERA_MAX", espera_max)
+
+LIMITES = {
+    limites.classe: limites
+    for limites in (
+        # Checkout espera mais por vaga: é a requisição que vira venda
+        LimitesClasse("checkout", 20, 40, 1, 5, 2.0),
+        LimitesClasse("catalogo", 100, 200, 10, 30, 0.5),
+        LimitesClasse("admin", 30, 60, 10, 20, 1.0),
+        # Login e cadastro: o limite por cliente também freia tentativas de senha
+        LimitesClasse("auth", 30, 60, 2, 10, 3.0),
+    )
+}
+
+def classificar_rota(metodo: str, caminho: str) -> Optional[str]:
+    """Classe de limites da rota; None para rotas isentas (sem banco ou internas)"""
+    if caminho == "/" or caminho.startswith(("/health", "/metrics", "/uploads", "/docs", "/openapi.json")):
+        return None
+    # Stream SSE: fica aberto por horas e não segura conexão do banco
+    if caminho == "/pedidos/eventos":
+        return None
+    if metodo == "POST" and caminho.rstrip("/") == "/pedidos":
+        return "checkout"
+    if metodo == "POST" and caminho in ("/auth/login", "/auth/register"):
+        return "auth"
+    if caminho.startswith("/vitrine") or (metodo == "GET" and caminho.startswith("/produtos")):
+        return "catalogo"
+    return "admin"
+
+class BaldesTokens:
+    """Token buckets por chave, com número máximo de chaves (as menos usadas saem)"""
+
+    def __init__(self, max_chaves: int = ADMISSAO_MAX_CHAVES):
+        self.max_chaves = max_chaves
+        self._baldes: "OrderedDict[Tuple, list]" = OrderedDict()
+
+    def consumir(self, chave: Tuple, taxa: float, capacidade: float) -> float:
+        """Retira um token; retorna 0 se liberado ou os segundos até haver token"""
+        agora = time.monotonic()
+        balde = self._baldes.get(chave)
+        if balde is None:
+            balde = self._baldes[chave] = [capacidade, agora]
+            while len(self._baldes) > self.max_chaves:
+                self._baldes.popitem(last=False)
+        else:
+            self._baldes.move_to_end(chave)
+            balde[0] = min(capacidade, balde[0] + (agora - balde[1]) * taxa)
+            balde[1] = agora
+        if balde[0] >= 1:
+            balde[0] -= 1
+            return 0.0
+        return (1 - balde[0]) / taxa
+
+    def __len__(self):
+        return len(self._baldes)
+
+class LimiteConcorrencia:
+    """Vagas para requisições que usam o banco, com fila FIFO limitada e espera máxima"""
+
+    # Peso da última amostra na média móvel da espera
+    ALFA = 0.2
+
+    def __init__(self, limite: int = ADMISSAO_CONCORRENCIA, fila_max: int = ADMISSAO_FILA_MAX):
+        self.limite = limite
+        self.fila_max = fila_max
+        self.em_uso = 0
+        self.espera_media = 0.0
+        self._fila: Deque[asyncio.Future] = deque()
+
+    @property
+    def aguardando(self) -> int:
+        return len(self._fila)
+
+    def _registrar_espera(self, segundos: float):
+        self.espera_media += self.ALFA * (segundos - self.espera_media)
+
+    async def entrar(self, espera_max: float) -> Optional[str]:
+        """Ocupa uma vaga; retorna o motivo da recusa ou None"""
+        if self.em_uso < self.limite and not self._fila:
+            self.em_uso += 1
+            self._registrar_espera(0.0)
+            return None
+        if len(self._fila) >= self.fila_max:
+            return "fila_cheia"
+        # Fila já espera mais do que esta classe aceita: recusa cedo, sem esperar o timeout
+        if self.espera_media > espera_max:
+            return "espera"
+
+        inicio = time.monotonic()
+        vaga = asyncio.get_running_loop().create_future()
+        self._fila.append(vaga)
+        try:
+            await asyncio.wait_for(vaga, espera_max)
+        except asyncio.TimeoutError:
+            # A vaga pode ter sido entregue junto com o timeout
+            if not (vaga.done() and not vaga.cancelled()):
+                self._registrar_espera(time.monotonic() - inicio)
+                return "espera"
+        except asyncio.CancelledError:
+            # Cliente desconectou esperando: devolve a vaga se ela já tinha chegado
+            if vaga.done() and not vaga.cancelled():
+                self.sair()
+            raise
+        finally:
+            if vaga in self._fila:
+                self._fila.remove(vaga)
+        self._registrar_espera(time.monotonic() - inicio)
+        return None
+
+    def sair(self):
+        """Libera a vaga, passando-a direto para o primeiro da fila"""
+        while self._fila:
+            vaga = self._fila.popleft()
+            if not vaga.done():
+                vaga.set_result(None)
+                return
+        self.em_uso -= 1
+
+class ControleAdmissao:
+    """Decide se a requisição entra: taxa por empresa, taxa por cliente e vaga no pool"""
+
+    def __init__(self):
+        self.baldes = BaldesTokens()
+        self.concorrencia = LimiteConcorrencia()
+        # Uma rajada de logins espera o executor de hash sem tirar vagas do resto do site
+        self.concorrencia_auth = LimiteConcorrencia(ADMISSAO_AUTH_CONCORRENCIA)
+        self.admitidas: Dict[str, int] = {classe: 0 for classe in LIMITES}
+        self.rejeicoes: Dict[Tuple[str, str], int] = {}
+
+    def _rejeitar(self, classe: str, motivo: str):
+        self.rejeicoes[(classe, motivo)] = self.rejeicoes.get((classe, motivo), 0) + 1
+
+    def verificar_taxa(self, classe: str, empresa_id: Optional[int], cliente: str) -> Optional[Tuple[str, float]]:
+        """(motivo, segundos para tentar de novo) se a taxa foi excedida"""
+        limites = LIMITES[classe]
+        # Sem empresa no Host (painel no domínio do sistema) vale só o limite por cliente
+        if empresa_id is not None:
+            espera = self.baldes.consumir(("empresa", classe, empresa_id), limites.taxa_empresa, limites.rajada_empresa)
+            if espera:
+                self._rejeitar(classe, "taxa_empresa")
+                return "taxa_empresa", espera
+        espera = self.baldes.consumir(("cliente", classe, cliente), limites.taxa_cliente, limites.rajada_cliente)
+        if espera:
+            self._rejeitar(classe, "taxa_cliente")
+            return "taxa_cliente", espera
+        return None
+
+    def _vagas(self, classe: str) -> LimiteConcorrencia:
+        return self.concorrencia_auth if classe == "auth" else self.concorrencia
+
+    async def entrar(self, classe: str) -> Optional[str]:
+        motivo = await self._vagas(classe).entrar(LIMITES[classe].espera_max)
+        if motivo:
+            self._rejeitar(classe, motivo)
+        else:
+            self.admitidas[classe] += 1
+        return motivo
+
+    def sair(self, classe: str):
+        self._vagas(classe).sair()
+
+    def stats(self) -> dict:
+        return {
+            "habilitado": ADMISSAO_HABILITADA,
+            "concorrencia_limite": self.concorrencia.limite,
+            "em_uso": self.concorrencia.em_uso,
+            "aguardando": self.concorrencia.aguardando,
+            "espera_media_segundos": round(self.concorrencia.espera_media, 4),
+            "auth": {
+                "concorrencia_limite": self.concorrencia_auth.limite,
+                "em_uso": self.concorrencia_auth.em_uso,
+                "aguardando": self.concorrencia_auth.aguardando,
+                "espera_media_segundos": round(self.concorrencia_auth.espera_media, 4),
+            },
+            "chaves_com_balde": len(self.baldes),
+            "admitidas": dict(self.admitidas),
+            "rejeicoes": {f"{classe}:{motivo}": total for (classe, motivo), total in self.rejeicoes.items()},
+        }
+
+controle_admissao = ControleAdmissao()
+
+MENSAGENS = {
+    "taxa_empresa": "Muitas requisições para esta loja. Tente novamente em instantes.",
+    "taxa_cliente": "Muitas requisições. Tente novamente em instantes.",
+    "fila_cheia": "Servidor sobrecarregado. Tente novamente em instantes.",
+    "espera": "Servidor sobrecarregado. Tente novamente em instantes.",
+}
+
+def _cliente(scope) -> str:
+    """IP do cliente: o nginx informa em X-Real-IP"""
+    for nome, valor in scope["headers"]:
+        if nome == b"x-real-ip":
+            return valor.decode("latin-1")
+    cliente = scope.get("client")
+    return cliente[0] if cliente else ""
+
+async def _recusar(send, status_code: int, motivo: str, retry_after: float):
+    corpo = json.dumps({"detail": MENSAGENS[motivo]}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(corpo)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+class AdmissaoMiddleware:
+    """Recusa cedo (429/503 com Retry-After) o que passaria dos limites.
+
+    Fica depois do TenantMiddleware (usa a empresa resolvida pelo Host) e do
+    CORS (as recusas saem com os cabeçalhos CORS e preflights não contam).
+    """
+
+    def __init__(self, app, controle: ControleAdmissao = controle_admissao):
+        self.app = app
+        self.controle = controle
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSAO_HABILITADA:
+            await self.app(scope, receive, send)
+            return
+        classe = classificar_rota(scope["method"], scope["path"])
+        if classe is None:
+            await self.app(scope, receive, send)
+            return
+
+        empresa = scope.get("state", {}).get("empresa")
+        recusa = self.controle.verificar_taxa(classe, empresa.id if empresa else None, _cliente(scope))
+        if recusa:
+            motivo, espera = recusa
+            await _recusar(send, 429, motivo, espera)
+            return
+
+        motivo = await self.controle.entrar(classe)
+        if motivo:
+            await _recusar(send, 503, motivo, 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controle.sair(classe)
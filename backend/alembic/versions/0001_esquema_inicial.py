@@ -0,0 +1,161 @@
+"""esquema inicial
+
+Estado do banco que antes era criado por Base.metadata.create_all no boot,
+já com as colunas dos scripts de migrations/*.sql.
+
+Bancos criados antes do Alembic: aplique os scripts de migrations/ (todos são
+idempotentes), marque a versão que eles cobrem com `alembic stamp 0002` e rode
+`alembic upgrade head` para as revisões seguintes. Não use `stamp head`: as
+revisões a partir da 0003 não têm script em migrations/ e seriam puladas.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+STATUS_PEDIDO = ("PENDENTE", "CONFIRMADO", "EM_PREPARO", "PRONTO", "ENTREGUE", "CANCELADO")
+STATUS_NOTIFICACAO = ("PENDENTE", "ENVIADA", "FALHA")
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("full_name", sa.String(), nullable=True),
+        sa.Column("hashed_password", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "empresas",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nome", sa.String(), nullable=True),
+        sa.Column("slug", sa.String(), nullable=True),
+        sa.Column("dominio", sa.String(), nullable=True),
+        sa.Column("ssl_status", sa.String(), nullable=True),
+        sa.Column("ssl_ultima_atualizacao", sa.DateTime(), nullable=True),
+        sa.Column("cnpj", sa.String(), nullable=True),
+        sa.Column("endereco", sa.String(), nullable=True),
+        sa.Column("cidade", sa.String(), nullable=True),
+        sa.Column("estado", sa.String(), nullable=True),
+        sa.Column("cep", sa.String(), nullable=True),
+        sa.Column("telefone", sa.String(), nullable=True),
+        sa.Column("logo_url", sa.String(), nullable=True),
+        sa.Column("logo_variantes", sa.JSON(), nullable=True),
+        sa.Column("whatsapp_instancia", sa.String(), nullable=True),
+        sa.Column("whatsapp_api_key", sa.String(), nullable=True),
+        sa.Column("catalogo_versao", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("usuario_id", sa.Integer(), nullable=True),
+        sa.Column("data_criacao", sa.DateTime(), nullable=True),
+        sa.Column("ativo", sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(["usuario_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("cnpj"),
+    )
+    op.create_index("ix_empresas_id", "empresas", ["id"])
+    op.create_index("ix_empresas_nome", "empresas", ["nome"])
+    op.create_index("ix_empresas_slug", "empresas", ["slug"], unique=True)
+    op.create_index("ix_empresas_dominio", "empresas", ["dominio"], unique=True)
+
+    op.create_table(
+        "produtos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("nome", sa.String(), nullable=True),
+        sa.Column("descricao", sa.String(), nullable=True),
+        sa.Column("preco", sa.Float(), nullable=True),
+        sa.Column("quantidade_estoque", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("imagem_url", sa.String(), nullable=True),
+        sa.Column("empresa_id", sa.Integer(), nullable=True),
+        sa.Column("ativo", sa.Boolean(), nullable=True),
+        sa.Column("data_criacao", sa.DateTime(), nullable=True),
+        sa.Column("data_atualizacao", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_produtos_id", "produtos", ["id"])
+    op.create_index("ix_produtos_nome", "produtos", ["nome"])
+    op.create_index("ix_produtos_empresa_ativo_nome_id", "produtos", ["empresa_id", "ativo", "nome", "id"])
+
+    op.create_table(
+        "pedidos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.Enum(*STATUS_PEDIDO, name="statuspedido"), nullable=True),
+        sa.Column("data_criacao", sa.DateTime(), nullable=True),
+        sa.Column("empresa_id", sa.Integer(), nullable=True),
+        sa.Column("usuario_id", sa.Integer(), nullable=True),
+        sa.Column("cliente_telefone", sa.String(), nullable=True),
+        sa.Column("valor_total", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.ForeignKeyConstraint(["usuario_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_pedidos_id", "pedidos", ["id"])
+
+    op.create_table(
+        "pedido_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quantidade", sa.Integer(), nullable=True),
+        sa.Column("preco_unitario", sa.Float(), nullable=True),
+        sa.Column("pedido_id", sa.Integer(), nullable=True),
+        sa.Column("produto_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["pedido_id"], ["pedidos.id"]),
+        sa.ForeignKeyConstraint(["produto_id"], ["produtos.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_pedido_items_id", "pedido_items", ["id"])
+    op.create_index("ix_pedido_items_pedido_id", "pedido_items", ["pedido_id"])
+    op.create_index("ix_pedido_items_produto_id", "pedido_items", ["produto_id"])
+
+    op.create_table(
+        "notificacoes_whatsapp",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("empresa_id", sa.Integer(), nullable=True),
+        sa.Column("pedido_id", sa.Integer(), nullable=True),
+        sa.Column("numero", sa.String(), nullable=False),
+        sa.Column("mensagem", sa.String(), nullable=False),
+        sa.Column("status", sa.Enum(*STATUS_NOTIFICACAO, name="statusnotificacao"), nullable=False),
+        sa.Column("tentativas", sa.Integer(), nullable=False),
+        sa.Column("proxima_tentativa", sa.DateTime(), nullable=False),
+        sa.Column("ultimo_erro", sa.String(), nullable=True),
+        sa.Column("data_criacao", sa.DateTime(), nullable=True),
+        sa.Column("data_envio", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.ForeignKeyConstraint(["pedido_id"], ["pedidos.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_notificacoes_whatsapp_id", "notificacoes_whatsapp", ["id"])
+    op.create_index("ix_notificacoes_whatsapp_fila", "notificacoes_whatsapp", ["status", "proxima_tentativa"])
+
+    op.create_table(
+        "vendas_diarias",
+        sa.Column("empresa_id", sa.Integer(), nullable=False),
+        sa.Column("data", sa.Date(), nullable=False),
+        sa.Column("total_pedidos", sa.Integer(), nullable=False),
+        sa.Column("valor_total", sa.Float(), nullable=False),
+        sa.Column("cancelamentos", sa.Integer(), nullable=False),
+        sa.Column("valor_cancelado", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.PrimaryKeyConstraint("empresa_id", "data"),
+    )
+
+def downgrade():
+    op.drop_table("vendas_diarias")
+    op.drop_table("notificacoes_whatsapp")
+    op.drop_table("pedido_items")
+    op.drop_table("pedidos")
+    op.drop_table("produtos")
+    op.drop_table("empresas")
+    op.drop_table("users")
+    sa.Enum(name="statusnotificacao").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="statuspedido").drop(op.get_bind(), checkfirst=True)
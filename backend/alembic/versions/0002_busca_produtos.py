@@ -0,0 +1,56 @@
+"""busca de produtos
+
+Texto completo em português sem acentos + trigramas (ver busca.py).
+CREATE EXTENSION exige um usuário com permissão no banco.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portugues_sem_acento') THEN
+                CREATE TEXT SEARCH CONFIGURATION portugues_sem_acento (COPY = portuguese);
+                ALTER TEXT SEARCH CONFIGURATION portugues_sem_acento
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+            END IF;
+        END
+        $$
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION normalizar_busca(texto text) RETURNS text
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, texto)) $$
+    """)
+    # As expressões precisam ser idênticas às de busca.py
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_produtos_busca_texto ON produtos USING gin (
+            empresa_id,
+            (setweight(to_tsvector('portugues_sem_acento'::regconfig, coalesce(nome, '')), 'A') ||
+             setweight(to_tsvector('portugues_sem_acento'::regconfig, coalesce(descricao, '')), 'B'))
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_produtos_busca_nome_trgm ON produtos USING gin (
+            empresa_id,
+            normalizar_busca(nome) gin_trgm_ops
+        )
+    """)
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_produtos_busca_nome_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_produtos_busca_texto")
+    op.execute("DROP FUNCTION IF EXISTS normalizar_busca(text)")
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS portugues_sem_acento")
@@ -0,0 +1,21 @@
+"""sku dos produtos
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("produtos", sa.Column("sku", sa.String(), nullable=True))
+    op.create_index("ix_produtos_empresa_sku", "produtos", ["empresa_id", "sku"], unique=True)
+
+def downgrade():
+    op.drop_index("ix_produtos_empresa_sku", table_name="produtos")
+    op.drop_column("produtos", "sku")
@@ -0,0 +1,31 @@
+"""índices da listagem de pedidos
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# Tabela mais movimentada: CREATE INDEX CONCURRENTLY não bloqueia as escritas durante a
+# construção, mas não roda dentro de transação (autocommit_block). Se falhar no meio, o
+# índice fica INVALID: apague-o com DROP INDEX CONCURRENTLY e rode o upgrade de novo.
+INDICES = [
+    ("ix_pedidos_empresa_data_id", ["empresa_id", "data_criacao", "id"]),
+    ("ix_pedidos_empresa_status_data_id", ["empresa_id", "status", "data_criacao", "id"]),
+    ("ix_pedidos_usuario_data_id", ["usuario_id", "data_criacao", "id"]),
+]
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for nome, colunas in INDICES:
+            op.create_index(nome, "pedidos", colunas, postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nome, _ in reversed(INDICES):
+            op.drop_index(nome, table_name="pedidos", postgresql_concurrently=True)
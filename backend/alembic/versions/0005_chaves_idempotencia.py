@@ -0,0 +1,30 @@
+"""chaves de idempotência
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "chaves_idempotencia",
+        sa.Column("usuario_id", sa.Integer(), nullable=False),
+        sa.Column("chave", sa.String(length=255), nullable=False),
+        sa.Column("hash_requisicao", sa.String(length=64), nullable=False),
+        sa.Column("resposta", sa.JSON(), nullable=True),
+        sa.Column("data_criacao", sa.DateTime(), nullable=False),
+        sa.Column("expira_em", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["usuario_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("usuario_id", "chave"),
+    )
+    op.create_index("ix_chaves_idempotencia_expira_em", "chaves_idempotencia", ["expira_em"])
+
+def downgrade():
+    op.drop_table("chaves_idempotencia")
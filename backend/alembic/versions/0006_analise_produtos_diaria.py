@@ -0,0 +1,50 @@
+"""resumo diário da análise de produtos
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Dias já existentes entram pendentes: a primeira atualização em background calcula o histórico
+    op.add_column(
+        "vendas_diarias",
+        sa.Column("analise_pendente", sa.Boolean(), server_default=sa.true(), nullable=False)
+    )
+    op.create_index(
+        "ix_vendas_diarias_analise_pendente", "vendas_diarias", ["data"],
+        postgresql_where=sa.text("analise_pendente")
+    )
+    op.create_table(
+        "vendas_produtos_diarias",
+        sa.Column("empresa_id", sa.Integer(), nullable=False),
+        sa.Column("data", sa.Date(), nullable=False),
+        sa.Column("produto_id", sa.Integer(), nullable=False),
+        sa.Column("quantidade", sa.Integer(), nullable=False),
+        sa.Column("receita", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.PrimaryKeyConstraint("empresa_id", "data", "produto_id"),
+    )
+    op.create_table(
+        "pares_produtos_diarios",
+        sa.Column("empresa_id", sa.Integer(), nullable=False),
+        sa.Column("data", sa.Date(), nullable=False),
+        sa.Column("produto_a", sa.Integer(), nullable=False),
+        sa.Column("produto_b", sa.Integer(), nullable=False),
+        sa.Column("pedidos", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["empresa_id"], ["empresas.id"]),
+        sa.PrimaryKeyConstraint("empresa_id", "data", "produto_a", "produto_b"),
+    )
+
+def downgrade():
+    op.drop_table("pares_produtos_diarios")
+    op.drop_table("vendas_produtos_diarias")
+    op.drop_index("ix_vendas_diarias_analise_pendente", table_name="vendas_diarias")
+    op.drop_column("vendas_diarias", "analise_pendente")
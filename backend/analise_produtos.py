@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, delete, func, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import aliased
+from database import async_engine
+from models import ItemPedido, ParProdutosDiario, Pedido, Produto, StatusPedido, VendaDiaria, VendaProdutoDiaria
+from metricas import registrar_tarefa
+
+logger = logging.getLogger("analise_produtos")
+
+# Idade máxima dos agregados: intervalo da atualização em background (segundos)
+ANALISE_MAX_STALENESS = float(os.getenv("ANALISE_MAX_STALENESS", "300"))
+# Dias (empresa + data) recalculados por transação na atualização
+ANALISE_DIAS_POR_LOTE = int(os.getenv("ANALISE_DIAS_POR_LOTE", "90"))
+
+# Advisory lock do recálculo: um worker por vez refaz os resumos (dois refazendo o mesmo dia
+# colidiriam no delete + insert)
+_LOCK_ATUALIZACAO = 0x616E616C
+
+Dia = Tuple[int, date]
+
+def _periodo(coluna, inicio: date, fim: date):
+    return (
+        coluna >= datetime.combine(inicio, datetime.min.time()),
+        coluna < datetime.combine(fim + timedelta(days=1), datetime.min.time()),
+    )
+
+async def _recalcular_dias(conn: AsyncConnection, dias: List[Dia]):
+    """Refaz as vendas por produto e os pares dos dias informados (na transação do chamador)"""
+    empresas = {empresa_id for empresa_id, _ in dias}
+    datas = [dia for _, dia in dias]
+    dia_pedido = func.date(Pedido.data_criacao)
+    # O índice (empresa_id, data_criacao) restringe o período; o IN de tuplas fica só com os dias pedidos
+    filtros = (
+        Pedido.empresa_id.in_(empresas),
+        *_periodo(Pedido.data_criacao, min(datas), max(datas)),
+        tuple_(Pedido.empresa_id, dia_pedido).in_(dias),
+        Pedido.status != StatusPedido.CANCELADO,
+    )
+
+    await conn.execute(
+        delete(VendaProdutoDiaria)
+        .where(tuple_(VendaProdutoDiaria.empresa_id, VendaProdutoDiaria.data).in_(dias))
+    )
+    await conn.execute(
+        insert(VendaProdutoDiaria).from_select(
+            ["empresa_id", "data", "produto_id", "quantidade", "receita"],
+            select(
+                Pedido.empresa_id,
+                dia_pedido,
+                ItemPedido.produto_id,
+                func.sum(ItemPedido.quantidade),
+                func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario)
+            )
+            .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+            .where(*filtros)
+            .where(ItemPedido.produto_id.is_not(None))
+            .group_by(Pedido.empresa_id, dia_pedido, ItemPedido.produto_id)
+        )
+    )
+
+    # Pares de produtos no mesmo pedido (a < b para contar cada par uma vez)
+    item_a = aliased(ItemPedido)
+    item_b = aliased(ItemPedido)
+    await conn.execute(
+        delete(ParProdutosDiario)
+        .where(tuple_(ParProdutosDiario.empresa_id, ParProdutosDiario.data).in_(dias))
+    )
+    await conn.execute(
+        insert(ParProdutosDiario).from_select(
+            ["empresa_id", "data", "produto_a", "produto_b", "pedidos"],
+            select(
+                Pedido.empresa_id,
+                dia_pedido,
+                item_a.produto_id,
+                item_b.produto_id,
+                func.count(func.distinct(item_a.pedido_id))
+            )
+            .join(item_b, and_(item_a.pedido_id == item_b.pedido_id, item_a.produto_id < item_b.produto_id))
+            .join(Pedido, Pedido.id == item_a.pedido_id)
+            .where(*filtros)
+            .group_by(Pedido.empresa_id, dia_pedido, item_a.produto_id, item_b.produto_id)
+        )
+    )
+
+async def atualizar_pendentes(conn: AsyncConnection, lote: int = ANALISE_DIAS_POR_LOTE) -> Optional[int]:
+    """Recalcula os dias marcados por pedidos novos e cancelamentos; retorna quantos dias,
+    ou None se outro worker já estava recalculando.
+
+    Cada lote é reservado numa transação curta (a linha do dia em vendas_diarias
+    não fica travada para o checkout durante o recálculo) e recalculado em outra.
+    Um pedido que chegar durante o recálculo marca o dia de novo e ele entra na
+    próxima rodada. Se o recálculo falhar, os dias voltam a ficar pendentes.
+
+    O advisory lock é da transação do recálculo, não da sessão: atrás do PgBouncer
+    em modo transaction cada commit pode trocar a conexão do servidor, e um lock de
+    sessão ficaria preso na conexão antiga.
+    """
+    total = 0
+    while True:
+        reservados = (
+            select(VendaDiaria.empresa_id, VendaDiaria.data)
+            .where(VendaDiaria.analise_pendente.is_(True))
+            .order_by(VendaDiaria.data.desc())
+            .limit(lote)
+            .with_for_update(skip_locked=True)
+        )
+        result = await conn.execute(
+            update(VendaDiaria)
+            .where(tuple_(VendaDiaria.empresa_id, VendaDiaria.data).in_(reservados))
+            .values(analise_pendente=False)
+            .returning(VendaDiaria.empresa_id, VendaDiaria.data)
+        )
+        dias = [tuple(linha) for linha in result.all()]
+        await conn.commit()
+        if not dias:
+            return total
+        try:
+            if not await conn.scalar(select(func.pg_try_advisory_xact_lock(_LOCK_ATUALIZACAO))):
+                # O outro worker segue até a fila esvaziar e pega estes dias
+                await conn.rollback()
+                await _devolver_pendentes(conn, dias)
+                return total or None
+            await _recalcular_dias(conn, dias)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            await asyncio.shield(_devolver_pendentes(conn, dias))
+            raise
+        total += len(dias)
+
+async def _devolver_pendentes(conn: AsyncConnection, dias: List[Dia]):
+    try:
+        await conn.execute(
+            update(VendaDiaria)
+            .where(tuple_(VendaDiaria.empresa_id, VendaDiaria.data).in_(dias))
+            .values(analise_pendente=True)
+        )
+        await conn.commit()
+    except Exception as e:
+        logger.error("Erro ao devolver dias pendentes da análise de produtos: %s", e)
+
+async def consultar_analise(db: AsyncSession, empresa_id: int, inicio: date, fim: date, limite: int) -> dict:
+    """Ranking, participação na receita e pares comprados juntos no período, lidos dos resumos diários"""
+    # Vendas por produto somadas dia a dia; o left join mantém os produtos sem venda
+    vendas = (
+        select(
+            VendaProdutoDiaria.produto_id,
+            func.sum(VendaProdutoDiaria.quantidade).label("quantidade"),
+            func.sum(VendaProdutoDiaria.receita).label("receita")
+        )
+        .where(VendaProdutoDiaria.empresa_id == empresa_id)
+        .where(VendaProdutoDiaria.data.between(inicio, fim))
+        .group_by(VendaProdutoDiaria.produto_id)
+        .subquery()
+    )
+    result = await db.execute(
+        select(
+            Produto.id,
+            Produto.nome,
+            Produto.ativo,
+            func.coalesce(vendas.c.quantidade, 0).label("quantidade"),
+            func.coalesce(vendas.c.receita, 0).label("receita")
+        )
+        .outerjoin(vendas, vendas.c.produto_id == Produto.id)
+        .where(Produto.empresa_id == empresa_id)
+    )
+    produtos = result.all()
+    receita_total = sum(float(p.receita) for p in produtos)
+    nomes = {p.id: p.nome for p in produtos}
+
+    def resumo(p):
+        return {
+            "produto_id": p.id,
+            "nome": p.nome,
+            "quantidade": int(p.quantidade),
+            "receita": float(p.receita),
+            "participacao_receita": float(p.receita) / receita_total if receita_total else 0.0,
+        }
+
+    mais_vendidos = sorted(
+        (p for p in produtos if p.quantidade > 0),
+        key=lambda p: (p.receita, p.quantidade),
+        reverse=True
+    )[:limite]
+    menos_vendidos = sorted(
+        (p for p in produtos if p.ativo),
+        key=lambda p: (p.quantidade, p.receita)
+    )[:limite]
+
+    # Cada pedido pertence a um único dia: somar os dias dá o total de pedidos com o par
+    total_pedidos = func.sum(ParProdutosDiario.pedidos)
+    result = await db.execute(
+        select(ParProdutosDiario.produto_a, ParProdutosDiario.produto_b, total_pedidos.label("pedidos"))
+        .where(ParProdutosDiario.empresa_id == empresa_id)
+        .where(ParProdutosDiario.data.between(inicio, fim))
+        .group_by(ParProdutosDiario.produto_a, ParProdutosDiario.produto_b)
+        .order_by(total_pedidos.desc())
+        .limit(limite)
+    )
+    pares = [
+        {
+            "produtos": [
+                {"produto_id": par.produto_a, "nome": nomes.get(par.produto_a)},
+                {"produto_id": par.produto_b, "nome": nomes.get(par.produto_b)},
+            ],
+            "pedidos": int(par.pedidos),
+        }
+        for par in result.all()
+    ]
+
+    # Dias do período ainda não recalculados (no máximo ANALISE_MAX_STALENESS atrás dos pedidos)
+    pendente = await db.scalar(
+        select(literal(True))
+        .where(VendaDiaria.empresa_id == empresa_id)
+        .where(VendaDiaria.data.between(inicio, fim))
+        .where(VendaDiaria.analise_pendente.is_(True))
+        .limit(1)
+    )
+
+    return {
+        "inicio": inicio.isoformat(),
+        "fim": fim.isoformat(),
+        "receita_total": receita_total,
+        "mais_vendidos": [resumo(p) for p in mais_vendidos],
+        "menos_vendidos": [resumo(p) for p in menos_vendidos],
+        "comprados_juntos": pares,
+        "gerado_em": datetime.utcnow().isoformat(),
+        "atualizacao_pendente": bool(pendente),
+        "max_staleness_segundos": ANALISE_MAX_STALENESS,
+    }
+
+class AtualizadorAnalise:
+    """Mantém vendas_produtos_diarias e pares_produtos_diarios em dia, em background.
+
+    Todos os workers rodam a tarefa; o advisory lock de atualizar_pendentes deixa só um recalcular por vez.
+    """
+
+    def __init__(self, intervalo: float = ANALISE_MAX_STALENESS):
+        self.intervalo = intervalo
+        self.dias_atualizados = 0
+        self.erros = 0
+        self.ultima_atualizacao: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def atualizar(self) -> Optional[int]:
+        """Uma rodada; None se outro worker já estava atualizando"""
+        async with async_engine.connect() as conn:
+            dias = await atualizar_pendentes(conn)
+        if dias is None:
+            return None
+        self.dias_atualizados += dias
+        self.ultima_atualizacao = datetime.utcnow()
+        return dias
+
+    async def executar(self):
+        while True:
+            inicio = time.perf_counter()
+            try:
+                dias = await self.atualizar()
+                if dias:
+                    registrar_tarefa("analise_produtos", time.perf_counter() - inicio)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.erros += 1
+                registrar_tarefa("analise_produtos", time.perf_counter() - inicio, "erro")
+                logger.error("Erro ao atualizar a análise de produtos: %s", e)
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.executar())
+
+    async def parar(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "intervalo_segundos": self.intervalo,
+            "dias_atualizados": self.dias_atualizados,
+            "erros": self.erros,
+            "ultima_atualizacao": self.ultima_atualizacao.isoformat() if self.ultima_atualizacao else None,
+        }
+
+atualizador_analise = AtualizadorAnalise()
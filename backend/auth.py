@@ -1,21 +1,113 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import os
+import time
 import models
-from database import get_db
-from schemas import TokenData
+from database import get_async_db
 
 # Configurações
 SECRET_KEY = "sua_chave_secreta_muito_segura_aqui"  # Em produção, use variável de ambiente
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+# Ticket do stream de pedidos: vai na URL (e nos logs de acesso), então só vale até o EventSource conectar
+EVENTOS_TICKET_TTL = int(os.getenv("EVENTOS_TICKET_TTL", "30"))
+ESCOPO_EVENTOS = "eventos"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Custo do bcrypt; hashes com outro custo são refeitos no próximo login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads dedicadas ao hash de senhas (limita quantos rodam ao mesmo tempo)
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="hash-senha")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
+# Cache do usuário autenticado (por worker)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "10000"))
+
+class EmpresaResumo:
+    """Dados da empresa do usuário que ficam junto do principal em cache"""
+
+    def __init__(self, empresa: models.Empresa):
+        self.id = empresa.id
+        self.nome = empresa.nome
+        self.slug = empresa.slug
+        self.cnpj = empresa.cnpj
+
+class Principal:
+    """Usuário autenticado, desacoplado da sessão do banco"""
+
+    def __init__(self, user: models.User, empresas: Tuple[EmpresaResumo, ...]):
+        self.id = user.id
+        self.email = user.email
+        self.full_name = user.full_name
+        self.is_active = user.is_active
+        self.is_admin = bool(user.is_admin)
+        self.empresas = empresas
+
+    @property
+    def empresa_ids(self) -> Tuple[int, ...]:
+        return tuple(empresa.id for empresa in self.empresas)
+
+class PrincipalCache:
+    """Cache LRU com TTL dos principais, indexado pelo subject do token"""
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_itens: int = AUTH_CACHE_MAX):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._itens: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        item = self._itens.get(subject)
+        if item is None or item[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._itens.move_to_end(subject)
+        self.hits += 1
+        return item[1]
+
+    def set(self, subject: str, principal: Principal):
+        self._itens[subject] = (time.monotonic() + self.ttl, principal)
+        self._itens.move_to_end(subject)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    def invalidar(self, email: Optional[str] = None, usuario_id: Optional[int] = None):
+        """Remove o principal após mudanças no usuário ou nas empresas dele"""
+        for subject, (_, principal) in list(self._itens.items()):
+            if subject == email or principal.id == usuario_id:
+                del self._itens[subject]
+                self.invalidacoes += 1
+
+    def stats(self) -> dict:
+        return {
+            "itens": len(self._itens),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidacoes": self.invalidacoes,
+        }
+
+principal_cache = PrincipalCache()
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -23,12 +115,32 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def get_password_hash_async(password: str) -> str:
+    """Gera o hash fora do event loop, no executor dedicado"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Confere a senha fora do event loop; retorna (válida, novo_hash ou None)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        hash_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    user = result.scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # Encerra a leitura: a conexão volta ao pool enquanto a senha é conferida
+    await db.commit()
+    valida, novo_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valida:
         return False
+    if novo_hash:
+        # Custo configurado mudou: atualiza o hash aproveitando a senha em claro
+        user.hashed_password = novo_hash
+        await db.commit()
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -41,7 +153,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def create_stream_ticket(email: str) -> str:
+    """Token curto que só abre o stream de eventos; não serve como token de acesso"""
+    return create_access_token({"sub": email, "escopo": ESCOPO_EVENTOS}, timedelta(seconds=EVENTOS_TICKET_TTL))
+
+def _email_do_token(token: str, escopo: Optional[str] = None) -> str:
+    """Subject do token; o escopo precisa ser o esperado (tokens de acesso não têm escopo)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciais inválidas",
@@ -49,13 +166,58 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    email: str = payload.get("sub")
+    if email is None or payload.get("escopo") != escopo:
+        raise credentials_exception
+    return email
+
+async def _carregar_principal(email: str, db: AsyncSession) -> Principal:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Credenciais inválidas",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
+
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
-    return user
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.usuario_id == user.id)
+        .order_by(models.Empresa.id)
+    )
+    empresas = tuple(EmpresaResumo(empresa) for empresa in result.scalars().all())
+    principal = Principal(user, empresas)
+    # Usuário ainda sem empresa não entra no cache: a empresa pode ser criada
+    # em outro worker e o dashboard não deve ficar em 404 até o TTL expirar
+    if empresas:
+        principal_cache.set(email, principal)
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await _carregar_principal(_email_do_token(token), db)
+
+async def get_current_user_stream(
+    token_cabecalho: Optional[str] = Depends(oauth2_scheme_opcional),
+    ticket: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Como get_current_user, aceitando também ?ticket= de POST /pedidos/eventos/ticket
+    (o EventSource do navegador não envia cabeçalhos)"""
+    if token_cabecalho:
+        email = _email_do_token(token_cabecalho)
+    elif ticket:
+        email = _email_do_token(ticket, ESCOPO_EVENTOS)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Não autenticado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await _carregar_principal(email, db)
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, func, select, text
+from sqlalchemy.orm import aliased
+from database import AsyncSessionLocal, async_engine
+from models import (
+    Empresa, ItemPedido, ParProdutosDiario, Pedido, Produto, StatusPedido, User, VendaDiaria, VendaProdutoDiaria
+)
+from analise_produtos import atualizar_pendentes, consultar_analise
+from vendas_diarias import registrar_pedido
+
+PERIODOS = [7, 30, 90, 366]
+
+PRODUTOS_SQL = text("""
+    INSERT INTO produtos (empresa_id, nome, descricao, preco, quantidade_estoque, ativo, data_criacao, data_atualizacao)
+    SELECT :empresa_id, 'Produto ' || i, '-', round((5 + random() * 95)::numeric, 2), 100, i % 10 <> 0, now(), now()
+    FROM generate_series(1, :total) AS i
+""")
+
+# Pedidos espalhados pelo período; 1 em 20 cancelado
+PEDIDOS_SQL = text("""
+    INSERT INTO pedidos (status, data_criacao, empresa_id, usuario_id, valor_total)
+    SELECT
+        CASE WHEN i % 20 = 0 THEN 'CANCELADO' ELSE 'ENTREGUE' END::statuspedido,
+        now() - random() * make_interval(days => :dias),
+        :empresa_id, :usuario_id, 0
+    FROM generate_series(1, :total) AS i
+""")
+
+# Itens com popularidade desigual (random()^3 concentra as vendas nos primeiros produtos)
+ITENS_SQL = text("""
+    INSERT INTO pedido_items (quantidade, preco_unitario, pedido_id, produto_id)
+    SELECT 1 + (random() * 3)::int, round((5 + random() * 95)::numeric, 2), p.id,
+           ids[1 + floor(power(random(), 3) * array_length(ids, 1))::int]
+    FROM pedidos p
+    CROSS JOIN generate_series(1, :itens_por_pedido)
+    CROSS JOIN (SELECT array_agg(id ORDER BY id) AS ids FROM produtos WHERE empresa_id = :empresa_id) produtos
+    WHERE p.empresa_id = :empresa_id
+""")
+
+# Resumo diário como o backfill de vendas_diarias faz (todos os dias entram pendentes)
+VENDAS_DIARIAS_SQL = text("""
+    INSERT INTO vendas_diarias (empresa_id, data, total_pedidos, valor_total, cancelamentos, valor_cancelado)
+    SELECT empresa_id, date(data_criacao), count(*), 0, count(*) FILTER (WHERE status = 'CANCELADO'), 0
+    FROM pedidos WHERE empresa_id = :empresa_id
+    GROUP BY empresa_id, date(data_criacao)
+""")
+
+def _consultas_diretas(empresa_id: int, inicio, fim, limite: int):
+    """O que cada requisição fazia antes dos resumos diários: agregação e self-join sobre pedido_items"""
+    filtros = (
+        Pedido.empresa_id == empresa_id,
+        Pedido.data_criacao >= datetime.combine(inicio, datetime.min.time()),
+        Pedido.data_criacao < datetime.combine(fim + timedelta(days=1), datetime.min.time()),
+        Pedido.status != StatusPedido.CANCELADO,
+    )
+    vendas = (
+        select(
+            ItemPedido.produto_id,
+            func.sum(ItemPedido.quantidade).label("quantidade"),
+            func.sum(ItemPedido.quantidade * ItemPedido.preco_unitario).label("receita")
+        )
+        .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+        .where(*filtros)
+        .group_by(ItemPedido.produto_id)
+        .subquery()
+    )
+    ranking = (
+        select(Produto.id, Produto.nome, func.coalesce(vendas.c.quantidade, 0), func.coalesce(vendas.c.receita, 0))
+        .outerjoin(vendas, vendas.c.produto_id == Produto.id)
+        .where(Produto.empresa_id == empresa_id)
+    )
+    item_a = aliased(ItemPedido)
+    item_b = aliased(ItemPedido)
+    pares = (
+        select(item_a.produto_id, item_b.produto_id, func.count(func.distinct(item_a.pedido_id)))
+        .join(item_b, and_(item_a.pedido_id == item_b.pedido_id, item_a.produto_id < item_b.produto_id))
+        .join(Pedido, Pedido.id == item_a.pedido_id)
+        .where(*filtros)
+        .group_by(item_a.produto_id, item_b.produto_id)
+        .order_by(func.count(func.distinct(item_a.pedido_id)).desc())
+        .limit(limite)
+    )
+    return ranking, pares
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    def p(q):
+        return tempos[min(len(tempos) - 1, int(q * len(tempos)))] * 1000
+    return f"p50={p(0.50):.1f}ms p95={p(0.95):.1f}ms media={statistics.mean(tempos) * 1000:.1f}ms"
+
+async def _criar_dados(db, linhas: int, itens_por_pedido: int, produtos: int, dias: int):
+    usuario = User(email="benchmark-analise@exemplo.com", full_name="Benchmark", hashed_password="-")
+    db.add(usuario)
+    await db.flush()
+    empresa = Empresa(
+        nome="Benchmark", slug="benchmark-analise", cnpj="00000000000000", endereco="-",
+        cidade="-", estado="SP", cep="00000000", telefone="0000000000", usuario_id=usuario.id
+    )
+    db.add(empresa)
+    await db.flush()
+    parametros = {"empresa_id": empresa.id, "usuario_id": usuario.id}
+
+    inicio = time.perf_counter()
+    await db.execute(PRODUTOS_SQL, {**parametros, "total": produtos})
+    await db.execute(PEDIDOS_SQL, {**parametros, "total": linhas // itens_por_pedido, "dias": dias})
+    await db.execute(ITENS_SQL, {**parametros, "itens_por_pedido": itens_por_pedido})
+    await db.execute(VENDAS_DIARIAS_SQL, parametros)
+    await db.commit()
+    for tabela in ("produtos", "pedidos", "pedido_items", "vendas_diarias"):
+        await db.execute(text(f"ANALYZE {tabela}"))
+    await db.commit()
+    print(f"{linhas} itens em {linhas // itens_por_pedido} pedidos ({dias} dias) inseridos em {time.perf_counter() - inicio:.1f}s")
+    return usuario.id, empresa.id
+
+async def _apagar_dados(db, usuario_id: int, empresa_id: int):
+    pedidos = select(Pedido.id).where(Pedido.empresa_id == empresa_id)
+    for stmt in (
+        delete(ParProdutosDiario).where(ParProdutosDiario.empresa_id == empresa_id),
+        delete(VendaProdutoDiaria).where(VendaProdutoDiaria.empresa_id == empresa_id),
+        delete(VendaDiaria).where(VendaDiaria.empresa_id == empresa_id),
+        delete(ItemPedido).where(ItemPedido.pedido_id.in_(pedidos)),
+        delete(Pedido).where(Pedido.empresa_id == empresa_id),
+        delete(Produto).where(Produto.empresa_id == empresa_id),
+        delete(Empresa).where(Empresa.id == empresa_id),
+        delete(User).where(User.id == usuario_id),
+    ):
+        await db.execute(stmt)
+    await db.commit()
+
+async def benchmark(linhas: int, itens_por_pedido: int, produtos: int, dias: int, repeticoes: int):
+    """Mede a atualização dos resumos e a consulta por período; os dados sintéticos são apagados no final"""
+    async with AsyncSessionLocal() as db:
+        usuario_id, empresa_id = await _criar_dados(db, linhas, itens_por_pedido, produtos, dias)
+        try:
+            # Histórico inteiro pendente: o que a primeira atualização após a migração faz
+            inicio = time.perf_counter()
+            async with async_engine.connect() as conn:
+                recalculados = await atualizar_pendentes(conn)
+            print(f"atualização completa: {recalculados} dias em {time.perf_counter() - inicio:.1f}s")
+
+            # Um pedido novo: só o dia dele é recalculado na próxima rodada
+            pedido = Pedido(
+                empresa_id=empresa_id, usuario_id=usuario_id, status=StatusPedido.PENDENTE,
+                data_criacao=datetime.utcnow(), valor_total=0
+            )
+            db.add(pedido)
+            await db.flush()
+            await registrar_pedido(db, pedido)
+            await db.commit()
+            inicio = time.perf_counter()
+            async with async_engine.connect() as conn:
+                recalculados = await atualizar_pendentes(conn)
+            print(f"atualização incremental: {recalculados} dia(s) em {(time.perf_counter() - inicio) * 1000:.1f}ms")
+
+            fim = datetime.utcnow().date()
+            for periodo in PERIODOS:
+                inicio_periodo = fim - timedelta(days=periodo)
+                ranking, pares = _consultas_diretas(empresa_id, inicio_periodo, fim, 10)
+                tempos_diretos, tempos_resumo = [], []
+                for _ in range(repeticoes):
+                    inicio = time.perf_counter()
+                    (await db.execute(ranking)).all()
+                    (await db.execute(pares)).all()
+                    tempos_diretos.append(time.perf_counter() - inicio)
+                    inicio = time.perf_counter()
+                    await consultar_analise(db, empresa_id, inicio_periodo, fim, 10)
+                    tempos_resumo.append(time.perf_counter() - inicio)
+                await db.rollback()
+                print(f"{periodo:>3} dias  direto:  {_percentis(tempos_diretos)}")
+                print(f"{periodo:>3} dias  resumos: {_percentis(tempos_resumo)}")
+        finally:
+            await db.rollback()
+            await _apagar_dados(db, usuario_id, empresa_id)
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark da análise de produtos (requer alembic/versions/0006_analise_produtos_diaria.py). "
+                    "Compara a agregação direta sobre pedido_items com a leitura dos resumos diários."
+    )
+    parser.add_argument("--linhas", type=int, default=1000000, help="Itens de pedido sintéticos")
+    parser.add_argument("--itens-por-pedido", type=int, default=4, help="Itens em cada pedido")
+    parser.add_argument("--produtos", type=int, default=2000, help="Tamanho do catálogo sintético")
+    parser.add_argument("--dias", type=int, default=730, help="Período coberto pelos pedidos")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Rodadas de cada consulta")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.linhas, args.itens_por_pedido, args.produtos, args.dias, args.repeticoes))
@@ -0,0 +1,96 @@
+import argparse
+import statistics
+import time
+from sqlalchemy import text
+from database import SessionLocal
+from models import Empresa, User
+from busca import consulta_busca, consulta_sugestoes
+
+# Termos medidos: palavra exata, plural/radical, sem acento, erro de digitação, frase e prefixos
+TERMOS_BUSCA = ["café", "cafes", "acucar", "chocolte", "pão de queijo", "integral sem lactose", "xyzw"]
+PREFIXOS = ["ca", "cho", "pao", "quei", "requeij"]
+
+PRODUTOS_SQL = text("""
+    INSERT INTO produtos (empresa_id, nome, descricao, preco, quantidade_estoque, ativo, data_criacao, data_atualizacao)
+    SELECT
+        :empresa_id,
+        (ARRAY['Café', 'Açúcar', 'Chocolate', 'Pão', 'Queijo', 'Requeijão', 'Biscoito', 'Macarrão',
+               'Feijão', 'Arroz', 'Suco', 'Iogurte', 'Manteiga', 'Farinha', 'Leite', 'Geleia'])[1 + i % 16]
+        || ' ' ||
+        (ARRAY['Integral', 'Orgânico', 'Tradicional', 'Light', 'Premium', 'Caseiro', 'de Minas',
+               'sem Lactose', 'Zero', 'Especial', 'Artesanal'])[1 + (i / 16) % 11]
+        || ' ' || i,
+        (ARRAY['Produto selecionado, ideal para o café da manhã',
+               'Receita da casa com ingredientes naturais',
+               'Embalagem econômica para a família toda',
+               'Sabor marcante, feito em pequenos lotes',
+               'Sem conservantes e sem corantes artificiais'])[1 + i % 5]
+        || ' (lote ' || i || ')',
+        round((random() * 100)::numeric, 2),
+        (random() * 50)::int,
+        true,
+        now(),
+        now()
+    FROM generate_series(1, :total) AS i
+""")
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    def p(q):
+        return tempos[min(len(tempos) - 1, int(q * len(tempos)))] * 1000
+    return f"p50={p(0.50):.1f}ms p95={p(0.95):.1f}ms p99={p(0.99):.1f}ms media={statistics.mean(tempos) * 1000:.1f}ms"
+
+def _medir(db, consultas, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            db.execute(consulta).all()
+            tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+def benchmark(total: int, repeticoes: int, explicar: bool):
+    """Mede a busca num catálogo sintético; tudo é desfeito com rollback no final"""
+    db = SessionLocal()
+    try:
+        usuario = User(email="benchmark-busca@exemplo.com", full_name="Benchmark", hashed_password="-")
+        db.add(usuario)
+        db.flush()
+        empresa = Empresa(
+            nome="Benchmark", slug="benchmark-busca", cnpj="00000000000000", endereco="-",
+            cidade="-", estado="SP", cep="00000000", telefone="0000000000", usuario_id=usuario.id
+        )
+        db.add(empresa)
+        db.flush()
+
+        inicio = time.perf_counter()
+        db.execute(PRODUTOS_SQL, {"empresa_id": empresa.id, "total": total})
+        db.execute(text("ANALYZE produtos"))
+        print(f"{total} produtos inseridos em {time.perf_counter() - inicio:.1f}s")
+
+        buscas = [consulta_busca(empresa.id, termo, 20) for termo in TERMOS_BUSCA]
+        sugestoes = [consulta_sugestoes(empresa.id, prefixo, 8) for prefixo in PREFIXOS]
+        _medir(db, buscas + sugestoes, 1)  # aquece o cache do banco
+
+        print(f"busca:      {_percentis(_medir(db, buscas, repeticoes))}")
+        print(f"sugestoes:  {_percentis(_medir(db, sugestoes, repeticoes))}")
+
+        if explicar:
+            for titulo, consulta in (("busca", buscas[3]), ("sugestoes", sugestoes[1])):
+                compilada = consulta.compile(dialect=db.get_bind().dialect)
+                plano = db.connection().exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {compilada}", compilada.params
+                ).scalars().all()
+                print(f"\n-- plano: {titulo}")
+                print("\n".join(plano))
+    finally:
+        db.rollback()
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da busca de produtos (requer alembic/versions/0002_busca_produtos.py)")
+    parser.add_argument("--produtos", type=int, default=100000, help="Tamanho do catálogo sintético")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Rodadas de cada conjunto de consultas")
+    parser.add_argument("--explain", action="store_true", help="Mostra o plano das consultas (confere o uso dos índices)")
+    args = parser.parse_args()
+    benchmark(args.produtos, args.repeticoes, args.explain)
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List
+import aiohttp
+from sqlalchemy import delete, select, text
+from auth import create_access_token
+from database import SessionLocal
+from models import (
+    Empresa, ItemPedido, NotificacaoWhatsApp, ParProdutosDiario, Pedido, Produto, User, VendaDiaria, VendaProdutoDiaria
+)
+
+# Estoque alto: a carga mede o checkout que dá certo, não a recusa por falta de produto
+PRODUTOS_SQL = text("""
+    INSERT INTO produtos (empresa_id, nome, descricao, preco, quantidade_estoque, ativo, data_criacao, data_atualizacao)
+    SELECT :empresa_id, 'Produto ' || i, 'Produto sintético ' || i, round((5 + random() * 95)::numeric, 2),
+           1000000, true, now(), now()
+    FROM generate_series(1, :total) AS i
+    RETURNING id
+""")
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    def p(q):
+        return tempos[min(len(tempos) - 1, int(q * len(tempos)))] * 1000
+    return f"p50={p(0.50):.1f}ms p95={p(0.95):.1f}ms p99={p(0.99):.1f}ms media={statistics.mean(tempos) * 1000:.1f}ms"
+
+def _criar_dados(produtos: int):
+    with SessionLocal() as db:
+        usuario = User(email="benchmark-carga@exemplo.com", full_name="Benchmark", hashed_password="-", is_admin=True)
+        db.add(usuario)
+        db.flush()
+        empresa = Empresa(
+            nome="Benchmark", slug="benchmark-carga", cnpj="00000000000001", endereco="-",
+            cidade="-", estado="SP", cep="00000000", telefone="0000000000", usuario_id=usuario.id
+        )
+        db.add(empresa)
+        db.flush()
+        produto_ids = db.execute(PRODUTOS_SQL, {"empresa_id": empresa.id, "total": produtos}).scalars().all()
+        db.commit()
+        return usuario.id, usuario.email, empresa.id, produto_ids
+
+def _apagar_dados(usuario_id: int, empresa_id: int):
+    pedidos = select(Pedido.id).where(Pedido.empresa_id == empresa_id)
+    with SessionLocal() as db:
+        for stmt in (
+            delete(NotificacaoWhatsApp).where(NotificacaoWhatsApp.empresa_id == empresa_id),
+            delete(ParProdutosDiario).where(ParProdutosDiario.empresa_id == empresa_id),
+            delete(VendaProdutoDiaria).where(VendaProdutoDiaria.empresa_id == empresa_id),
+            delete(VendaDiaria).where(VendaDiaria.empresa_id == empresa_id),
+            delete(ItemPedido).where(ItemPedido.pedido_id.in_(pedidos)),
+            delete(Pedido).where(Pedido.empresa_id == empresa_id),
+            delete(Produto).where(Produto.empresa_id == empresa_id),
+            delete(Empresa).where(Empresa.id == empresa_id),
+            delete(User).where(User.id == usuario_id),
+        ):
+            db.execute(stmt)
+        db.commit()
+
+async def _carga(base: str, token: str, empresa_id: int, produto_ids: List[int],
+                 clientes: int, duracao: float, proporcao_checkout: float):
+    tempos: Dict[str, List[float]] = {"checkout": [], "catalogo": []}
+    status: Dict[str, Counter] = {"checkout": Counter(), "catalogo": Counter()}
+    fim = time.perf_counter() + duracao
+
+    async def cliente(sessao, numero: int):
+        # IP próprio por cliente: o limite por cliente do controle de admissão vale para cada um
+        cabecalhos = {"Authorization": f"Bearer {token}", "X-Real-IP": f"10.0.{numero // 256}.{numero % 256}"}
+        while time.perf_counter() < fim:
+            if random.random() < proporcao_checkout:
+                tipo = "checkout"
+                itens = [
+                    {"produto_id": produto_id, "quantidade": random.randint(1, 3), "preco_unitario": 0}
+                    for produto_id in random.sample(produto_ids, random.randint(1, 5))
+                ]
+                requisicao = sessao.post(f"{base}/pedidos/", json={"itens": itens}, headers=cabecalhos)
+            else:
+                tipo = "catalogo"
+                requisicao = sessao.get(f"{base}/produtos/empresa/{empresa_id}?limit=50", headers=cabecalhos)
+            inicio = time.perf_counter()
+            async with requisicao as resposta:
+                await resposta.read()
+            tempos[tipo].append(time.perf_counter() - inicio)
+            status[tipo][resposta.status] += 1
+
+    conector = aiohttp.TCPConnector(limit=clientes)
+    async with aiohttp.ClientSession(connector=conector) as sessao:
+        await asyncio.gather(*(cliente(sessao, i) for i in range(clientes)))
+    return tempos, status
+
+def benchmark(base: str, clientes: int, duracao: float, proporcao_checkout: float, produtos: int):
+    """Checkout e catálogo simultâneos contra um backend rodando; os dados sintéticos são apagados no final"""
+    usuario_id, email, empresa_id, produto_ids = _criar_dados(produtos)
+    try:
+        token = create_access_token({"sub": email})
+        tempos, status = asyncio.run(_carga(
+            base.rstrip("/"), token, empresa_id, produto_ids, clientes, duracao, proporcao_checkout
+        ))
+        print(f"{clientes} clientes por {duracao:.0f}s, {proporcao_checkout:.0%} checkout")
+        for tipo in ("checkout", "catalogo"):
+            if not tempos[tipo]:
+                continue
+            ok = status[tipo][200]
+            outros = ", ".join(f"{codigo}: {total}" for codigo, total in sorted(status[tipo].items()) if codigo != 200)
+            print(f"{tipo:<9} {ok / duracao:7.1f} ok/s  {_percentis(tempos[tipo])}" + (f"  ({outros})" if outros else ""))
+    finally:
+        _apagar_dados(usuario_id, empresa_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Vazão de checkout e catálogo sob carga concorrente. Usa o mesmo banco do backend "
+                    "(DATABASE_URL) para criar a loja sintética; rode antes e depois de uma mudança e compare."
+    )
+    parser.add_argument("--url", default="http://localhost:8000", help="Endereço do backend")
+    parser.add_argument("--clientes", type=int, default=50, help="Clientes simultâneos")
+    parser.add_argument("--duracao", type=float, default=30, help="Duração da carga em segundos")
+    parser.add_argument("--checkout", type=float, default=0.2, help="Fração das requisições que são checkout")
+    parser.add_argument("--produtos", type=int, default=500, help="Tamanho do catálogo sintético")
+    args = parser.parse_args()
+    benchmark(args.url, args.clientes, args.duracao, args.checkout, args.produtos)
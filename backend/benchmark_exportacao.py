@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import time
+from typing import Optional
+import aiohttp
+
+def _memoria_kb(pid: int, campo: str) -> Optional[int]:
+    """VmRSS (atual) ou VmHWM (pico) do processo, lido de /proc"""
+    try:
+        with open(f"/proc/{pid}/status") as arquivo:
+            for linha in arquivo:
+                if linha.startswith(campo + ":"):
+                    return int(linha.split()[1])
+    except FileNotFoundError:
+        pass
+    return None
+
+async def _baixar(url: str, token: str, pid: Optional[int]):
+    total = 0
+    pico_rss = 0
+    inicio = time.perf_counter()
+    async with aiohttp.ClientSession(headers={"Authorization": f"Bearer {token}"}) as sessao:
+        async with sessao.get(url) as resposta:
+            resposta.raise_for_status()
+            # Lê em blocos e descarta: o cliente não deve ser o gargalo de memória
+            async for bloco in resposta.content.iter_chunked(256 * 1024):
+                total += len(bloco)
+                if pid:
+                    pico_rss = max(pico_rss, _memoria_kb(pid, "VmRSS") or 0)
+    return total, time.perf_counter() - inicio, pico_rss
+
+def benchmark(url: str, token: str, pid: Optional[int]):
+    """Baixa uma exportação e acompanha a memória do worker que a atende"""
+    rss_antes = _memoria_kb(pid, "VmRSS") if pid else None
+    total, duracao, pico_rss = asyncio.run(_baixar(url, token, pid))
+    print(f"{total / 1024 / 1024:.1f} MB em {duracao:.1f}s ({total / 1024 / 1024 / duracao:.1f} MB/s)")
+    if pid:
+        print(f"RSS do worker: antes={rss_antes / 1024:.0f}MB pico durante o download={pico_rss / 1024:.0f}MB")
+        print(f"VmHWM (pico desde o início do processo): {_memoria_kb(pid, 'VmHWM') / 1024:.0f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memória do worker durante a exportação de pedidos. Rode com um único worker "
+                    "(uvicorn sem --workers) e compare períodos de tamanhos diferentes: o pico deve ficar estável."
+    )
+    parser.add_argument("url", help="Ex.: http://localhost:8000/pedidos/exportar?inicio=2024-01-01&compactar=true")
+    parser.add_argument("--token", required=True, help="Token de um administrador")
+    parser.add_argument("--pid", type=int, help="PID do worker do backend")
+    args = parser.parse_args()
+    benchmark(args.url, args.token, args.pid)
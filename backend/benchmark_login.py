@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import List
+import aiohttp
+from sqlalchemy import delete, text
+from auth import BCRYPT_ROUNDS, get_password_hash
+from database import SessionLocal
+from models import Empresa, Produto, User
+
+SENHA = "senha-do-benchmark"
+
+PRODUTOS_SQL = text("""
+    INSERT INTO produtos (empresa_id, nome, descricao, preco, quantidade_estoque, ativo, data_criacao, data_atualizacao)
+    SELECT :empresa_id, 'Produto ' || i, '-', round((5 + random() * 95)::numeric, 2), 100, true, now(), now()
+    FROM generate_series(1, :total) AS i
+""")
+
+def _percentis(tempos):
+    tempos = sorted(tempos)
+    def p(q):
+        return tempos[min(len(tempos) - 1, int(q * len(tempos)))] * 1000
+    return f"p50={p(0.50):.1f}ms p95={p(0.95):.1f}ms p99={p(0.99):.1f}ms media={statistics.mean(tempos) * 1000:.1f}ms"
+
+def _resumo(tempos, status: Counter) -> str:
+    """Percentis e, se houver, as respostas que não foram 200 (ex.: 503 da admissão)"""
+    outros = ", ".join(f"{codigo}: {total}" for codigo, total in sorted(status.items()) if codigo != 200)
+    return _percentis(tempos) + (f"  ({outros})" if outros else "")
+
+def _criar_dados():
+    with SessionLocal() as db:
+        usuario = User(email="benchmark-login@exemplo.com", full_name="Benchmark", hashed_password=get_password_hash(SENHA))
+        db.add(usuario)
+        db.flush()
+        empresa = Empresa(
+            nome="Benchmark", slug="benchmark-login", cnpj="00000000000002", endereco="-",
+            cidade="-", estado="SP", cep="00000000", telefone="0000000000", usuario_id=usuario.id
+        )
+        db.add(empresa)
+        db.flush()
+        db.execute(PRODUTOS_SQL, {"empresa_id": empresa.id, "total": 200})
+        db.commit()
+        return usuario.id, usuario.email, empresa.id
+
+def _apagar_dados(usuario_id: int, empresa_id: int):
+    with SessionLocal() as db:
+        db.execute(delete(Produto).where(Produto.empresa_id == empresa_id))
+        db.execute(delete(Empresa).where(Empresa.id == empresa_id))
+        db.execute(delete(User).where(User.id == usuario_id))
+        db.commit()
+
+async def _rodada(base: str, email: str, empresa_id: int, duracao: float, sondas: int, intervalo: float, logins: int):
+    """Sondas pedem uma página do catálogo a cada intervalo; os clientes de login disparam sem pausa"""
+    tempos_sonda: List[float] = []
+    tempos_login: List[float] = []
+    status_sonda: Counter = Counter()
+    status_login: Counter = Counter()
+    fim = time.perf_counter() + duracao
+
+    async def sonda(sessao, numero: int):
+        cabecalhos = {"X-Real-IP": f"10.1.0.{numero}"}
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            async with sessao.get(f"{base}/produtos/empresa/{empresa_id}?limit=50", headers=cabecalhos) as resposta:
+                await resposta.read()
+            tempos_sonda.append(time.perf_counter() - inicio)
+            status_sonda[resposta.status] += 1
+            await asyncio.sleep(max(0.0, intervalo - (time.perf_counter() - inicio)))
+
+    async def login(sessao, numero: int):
+        # IP próprio por cliente: o limite por cliente do controle de admissão vale para cada um
+        cabecalhos = {"X-Real-IP": f"10.2.{numero // 256}.{numero % 256}"}
+        corpo = {"email": email, "password": SENHA}
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            async with sessao.post(f"{base}/auth/login", json=corpo, headers=cabecalhos) as resposta:
+                await resposta.read()
+            tempos_login.append(time.perf_counter() - inicio)
+            status_login[resposta.status] += 1
+
+    conector = aiohttp.TCPConnector(limit=sondas + logins)
+    async with aiohttp.ClientSession(connector=conector) as sessao:
+        await asyncio.gather(
+            *(sonda(sessao, i) for i in range(sondas)),
+            *(login(sessao, i) for i in range(logins))
+        )
+    return tempos_sonda, status_sonda, tempos_login, status_login
+
+def benchmark(base: str, duracao: float, sondas: int, intervalo: float, logins: int):
+    """Latência do catálogo sem e com uma rajada de logins; os dados sintéticos são apagados no final"""
+    usuario_id, email, empresa_id = _criar_dados()
+    try:
+        base = base.rstrip("/")
+        rodada_base = asyncio.run(_rodada(base, email, empresa_id, duracao, sondas, intervalo, 0))
+        rodada_logins = asyncio.run(_rodada(base, email, empresa_id, duracao, sondas, intervalo, logins))
+        print(f"bcrypt com custo {BCRYPT_ROUNDS} (o do servidor vale no primeiro login; depois o hash é refeito)")
+        print(f"catálogo sem logins:     {_resumo(*rodada_base[:2])}")
+        print(f"catálogo durante logins: {_resumo(*rodada_logins[:2])}")
+        tempos_login, status_login = rodada_logins[2:]
+        print(f"logins ({logins} clientes): {status_login[200] / duracao:.1f} ok/s  {_resumo(tempos_login, status_login)}")
+    finally:
+        _apagar_dados(usuario_id, empresa_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rajada de logins contra um backend rodando, medindo a latência de outra rota ao mesmo tempo. "
+                    "Com o hash fora do event loop, o catálogo deve manter a latência durante a rajada. "
+                    "Usa o mesmo banco do backend (DATABASE_URL) e o mesmo BCRYPT_ROUNDS."
+    )
+    parser.add_argument("--url", default="http://localhost:8000", help="Endereço do backend")
+    parser.add_argument("--duracao", type=float, default=20, help="Duração de cada fase em segundos")
+    parser.add_argument("--sondas", type=int, default=5, help="Clientes medindo a latência do catálogo")
+    parser.add_argument("--intervalo", type=float, default=0.2, help="Pausa entre as requisições de cada sonda")
+    parser.add_argument("--logins", type=int, default=50, help="Clientes fazendo login sem pausa")
+    args = parser.parse_args()
+    benchmark(args.url, args.duracao, args.sondas, args.intervalo, args.logins)
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List, Optional
+import aiohttp
+
+def _cpu_segundos(pids: List[int]) -> Optional[float]:
+    """Tempo de CPU (usuário + sistema) dos processos, lido de /proc"""
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as arquivo:
+                campos = arquivo.read().rsplit(")", 1)[1].split()
+            total += int(campos[11]) + int(campos[12])
+    except (FileNotFoundError, IndexError):
+        return None
+    return total / os.sysconf("SC_CLK_TCK")
+
+async def _carga(base: str, caminhos: List[str], total: int, concorrencia: int) -> List[float]:
+    tempos = []
+    fila = asyncio.Queue()
+    for i in range(total):
+        fila.put_nowait(caminhos[i % len(caminhos)])
+
+    async def cliente(sessao):
+        while not fila.empty():
+            caminho = fila.get_nowait()
+            inicio = time.perf_counter()
+            async with sessao.get(base + caminho) as resposta:
+                await resposta.read()
+                resposta.raise_for_status()
+            tempos.append(time.perf_counter() - inicio)
+
+    conector = aiohttp.TCPConnector(limit=concorrencia, ssl=False)
+    async with aiohttp.ClientSession(connector=conector) as sessao:
+        await asyncio.gather(*(cliente(sessao) for _ in range(concorrencia)))
+    return tempos
+
+def benchmark(base: str, caminhos: List[str], total: int, concorrencia: int, pids: List[int]):
+    """Tráfego de vitrine só de imagens; compara a CPU gasta pelos workers do backend"""
+    cpu_antes = _cpu_segundos(pids) if pids else None
+    inicio = time.perf_counter()
+    tempos = asyncio.run(_carga(base.rstrip("/"), caminhos, total, concorrencia))
+    duracao = time.perf_counter() - inicio
+    cpu_depois = _cpu_segundos(pids) if pids else None
+
+    tempos.sort()
+    print(f"{len(tempos)} requisições em {duracao:.1f}s ({len(tempos) / duracao:.0f} req/s)")
+    print(
+        f"latência: p50={tempos[len(tempos) // 2] * 1000:.1f}ms "
+        f"p95={tempos[int(len(tempos) * 0.95)] * 1000:.1f}ms "
+        f"media={statistics.mean(tempos) * 1000:.1f}ms"
+    )
+    if cpu_antes is not None and cpu_depois is not None:
+        print(f"CPU dos workers do backend: {cpu_depois - cpu_antes:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Carga de imagens em /uploads. Rode contra o backend (SERVIR_UPLOADS=true) "
+                    "e contra o nginx, passando os PIDs dos workers do uvicorn nas duas rodadas."
+    )
+    parser.add_argument("base", help="Ex.: http://localhost:8000 ou https://loja.exemplo.com")
+    parser.add_argument("caminhos", nargs="+", help="Caminhos das imagens, ex.: /uploads/logos/1/<hash>-160.webp")
+    parser.add_argument("--total", type=int, default=5000)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    parser.add_argument("--pid", type=int, action="append", default=[], help="PID de um worker do backend (repetível)")
+    args = parser.parse_args()
+    benchmark(args.base, args.caminhos, args.total, args.concorrencia, args.pid)
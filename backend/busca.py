@@ -0,0 +1,114 @@
+import html
+from typing import List
+from sqlalchemy import func, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from models import Produto as ProdutoModel
+from schemas import Produto, ProdutoBusca, SugestaoProduto
+
+# Configuração criada em alembic/versions/0002_busca_produtos.py (português, sem acentos).
+# As expressões abaixo são literais de propósito: precisam ser idênticas às dos
+# índices para o planner usá-los (parâmetros no lugar de '' ou 'A' não casariam).
+BUSCA_CONFIG = literal_column("'portugues_sem_acento'::regconfig")
+
+# Marcadores do trecho destacado; viram <mark> depois do escape do HTML
+_INICIO_DESTAQUE = "\x02"
+_FIM_DESTAQUE = "\x03"
+_OPCOES_DESTAQUE = (
+    f'StartSel="{_INICIO_DESTAQUE}", StopSel="{_FIM_DESTAQUE}", '
+    'MaxWords=25, MinWords=8, MaxFragments=2, FragmentDelimiter=" ... "'
+)
+
+def vetor_busca():
+    """Vetor de texto do produto: nome com peso A, descrição com peso B"""
+    nome = func.setweight(
+        func.to_tsvector(BUSCA_CONFIG, func.coalesce(ProdutoModel.nome, literal_column("''"))),
+        literal_column("'A'")
+    )
+    descricao = func.setweight(
+        func.to_tsvector(BUSCA_CONFIG, func.coalesce(ProdutoModel.descricao, literal_column("''"))),
+        literal_column("'B'")
+    )
+    return nome.op("||")(descricao)
+
+def nome_normalizado():
+    return func.normalizar_busca(ProdutoModel.nome)
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+def consulta_busca(empresa_id: int, termo: str, limite: int):
+    """Produtos que casam pelo texto (com radical) ou por semelhança no nome (erros de digitação)"""
+    consulta = func.websearch_to_tsquery(BUSCA_CONFIG, termo)
+    termo_normalizado = func.normalizar_busca(termo)
+    relevancia = (
+        func.ts_rank_cd(vetor_busca(), consulta)
+        + func.word_similarity(termo_normalizado, nome_normalizado())
+    ).label("relevancia")
+
+    encontrados = (
+        select(ProdutoModel, relevancia)
+        .where(ProdutoModel.empresa_id == empresa_id)
+        .where(ProdutoModel.ativo.is_(True))
+        .where(or_(
+            vetor_busca().op("@@")(consulta),
+            nome_normalizado().op("%>")(termo_normalizado)
+        ))
+        .order_by(relevancia.desc(), ProdutoModel.id)
+        .limit(limite)
+        .subquery()
+    )
+    # ts_headline é caro: só roda nas linhas que sobraram depois do limite
+    produto = aliased(ProdutoModel, encontrados)
+    destaque = func.ts_headline(
+        BUSCA_CONFIG,
+        func.concat_ws(" - ", produto.nome, produto.descricao),
+        consulta,
+        _OPCOES_DESTAQUE
+    )
+    return (
+        select(produto, encontrados.c.relevancia, destaque.label("destaque"))
+        .order_by(encontrados.c.relevancia.desc(), produto.id)
+    )
+
+def consulta_sugestoes(empresa_id: int, prefixo: str, limite: int):
+    """Nomes para o autocompletar: começa com o prefixo primeiro, depois os parecidos"""
+    prefixo_normalizado = func.normalizar_busca(prefixo)
+    comeca_com = nome_normalizado().like(
+        func.normalizar_busca(_escapar_like(prefixo)).op("||")(literal_column("'%'")),
+        escape="!"
+    )
+    return (
+        select(ProdutoModel.id, ProdutoModel.nome)
+        .where(ProdutoModel.empresa_id == empresa_id)
+        .where(ProdutoModel.ativo.is_(True))
+        .where(or_(comeca_com, nome_normalizado().op("%>")(prefixo_normalizado)))
+        .order_by(
+            comeca_com.desc(),
+            func.word_similarity(prefixo_normalizado, nome_normalizado()).desc(),
+            ProdutoModel.nome
+        )
+        .limit(limite)
+    )
+
+def _destacar(trecho: str) -> str:
+    return (
+        html.escape(trecho)
+        .replace(_INICIO_DESTAQUE, "<mark>")
+        .replace(_FIM_DESTAQUE, "</mark>")
+    )
+
+async def buscar_produtos(db: AsyncSession, empresa_id: int, termo: str, limite: int) -> List[ProdutoBusca]:
+    result = await db.execute(consulta_busca(empresa_id, termo, limite))
+    return [
+        ProdutoBusca(
+            **Produto.model_validate(produto).model_dump(),
+            relevancia=round(float(relevancia), 4),
+            destaque=_destacar(destaque or "")
+        )
+        for produto, relevancia, destaque in result.all()
+    ]
+
+async def sugerir_produtos(db: AsyncSession, empresa_id: int, prefixo: str, limite: int) -> List[SugestaoProduto]:
+    result = await db.execute(consulta_sugestoes(empresa_id, prefixo, limite))
+    return [SugestaoProduto(id=row.id, nome=row.nome) for row in result.all()]
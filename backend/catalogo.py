@@ -0,0 +1,230 @@
+import asyncio
+import base64
+import gzip
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException, Request, Response, status
+from pydantic import TypeAdapter
+from sqlalchemy import event, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import Empresa, Produto as ProdutoModel
+from schemas import Produto
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, só gzip
+    brotli = None
+
+# Memória máxima das páginas de catálogo pré-serializadas (por worker)
+CATALOGO_CACHE_MAX_BYTES = int(os.getenv("CATALOGO_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Por quanto tempo uma página em cache é servida sem reconferir a versão no banco
+CATALOGO_VERSAO_TTL = float(os.getenv("CATALOGO_VERSAO_TTL", "2"))
+
+ChavePagina = Tuple[int, bool, int, str]
+
+_produtos_json = TypeAdapter(List[Produto])
+
+async def incrementar_versao_catalogo(db: AsyncSession, empresa_id: int):
+    """Marca o catálogo da empresa como alterado (na transação do chamador).
+
+    Trava a linha da empresa até o commit: chame logo antes de fazer commit.
+    As alterações pendentes da sessão vão para o banco antes, para que os
+    produtos sejam sempre travados antes da empresa, na mesma ordem do checkout
+    (a ordem inversa trava em deadlock com pedidos simultâneos).
+    """
+    await db.flush()
+    await db.execute(
+        update(Empresa)
+        .where(Empresa.id == empresa_id)
+        .values(catalogo_versao=Empresa.catalogo_versao + 1)
+        .execution_options(synchronize_session=False)
+    )
+    # As páginas em cache deste worker caem assim que a transação fizer commit
+    db.info.setdefault("catalogos_alterados", set()).add(empresa_id)
+
+async def obter_versao_catalogo(db: AsyncSession, empresa_id: int) -> Optional[int]:
+    """Versão atual do catálogo, ou None se a empresa não existe ou está inativa"""
+    return await db.scalar(
+        select(Empresa.catalogo_versao)
+        .where(Empresa.id == empresa_id)
+        .where(Empresa.ativo.is_(True))
+    )
+
+def codificar_cursor(produto) -> str:
+    return base64.urlsafe_b64encode(json.dumps([produto.nome, produto.id]).encode()).decode()
+
+def decodificar_cursor(cursor: str):
+    try:
+        nome, produto_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return nome, int(produto_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+class PaginaCatalogo:
+    """Página do catálogo já serializada e comprimida"""
+
+    def __init__(self, versao: int, etag: str, corpo: bytes, proximo_cursor: Optional[str]):
+        self.versao = versao
+        self.etag = etag
+        self.proximo_cursor = proximo_cursor
+        self.corpos = {"identity": corpo, "gzip": gzip.compress(corpo, 6)}
+        if brotli is not None:
+            self.corpos["br"] = brotli.compress(corpo, quality=5)
+        self.verificada_em = time.monotonic()
+
+    @property
+    def tamanho(self) -> int:
+        return sum(len(corpo) for corpo in self.corpos.values())
+
+    def corpo(self, accept_encoding: str) -> Tuple[str, bytes]:
+        aceitas = {parte.split(";")[0].strip() for parte in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in aceitas and encoding in self.corpos:
+                return encoding, self.corpos[encoding]
+        return "identity", self.corpos["identity"]
+
+class CacheCatalogo:
+    """LRU das páginas do catálogo, limitado pelo total de bytes em memória"""
+
+    def __init__(self, max_bytes: int = CATALOGO_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._paginas: "OrderedDict[ChavePagina, PaginaCatalogo]" = OrderedDict()
+        self._por_empresa: Dict[int, Set[ChavePagina]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, chave: ChavePagina) -> Optional[PaginaCatalogo]:
+        pagina = self._paginas.get(chave)
+        if pagina is not None:
+            self._paginas.move_to_end(chave)
+        return pagina
+
+    def set(self, chave: ChavePagina, pagina: PaginaCatalogo):
+        self._remover(chave)
+        if pagina.tamanho > self.max_bytes:
+            return
+        self._paginas[chave] = pagina
+        self._por_empresa.setdefault(chave[0], set()).add(chave)
+        self.bytes += pagina.tamanho
+        while self.bytes > self.max_bytes:
+            self._remover(next(iter(self._paginas)))
+
+    def _remover(self, chave: ChavePagina):
+        pagina = self._paginas.pop(chave, None)
+        if pagina is None:
+            return
+        self.bytes -= pagina.tamanho
+        chaves = self._por_empresa.get(chave[0])
+        if chaves is not None:
+            chaves.discard(chave)
+            if not chaves:
+                del self._por_empresa[chave[0]]
+
+    def invalidar(self, empresa_id: int):
+        for chave in list(self._por_empresa.get(empresa_id, ())):
+            self._remover(chave)
+
+    def stats(self) -> dict:
+        return {
+            "paginas": len(self._paginas),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+cache_catalogo = CacheCatalogo()
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_catalogos_alterados(session):
+    for empresa_id in session.info.pop("catalogos_alterados", ()):
+        cache_catalogo.invalidar(empresa_id)
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_catalogos_alterados(session):
+    session.info.pop("catalogos_alterados", None)
+
+async def _montar_pagina(
+    db: AsyncSession,
+    empresa_id: int,
+    versao: int,
+    em_estoque: bool,
+    limit: int,
+    cursor: str
+) -> PaginaCatalogo:
+    query = (
+        select(ProdutoModel)
+        .where(ProdutoModel.empresa_id == empresa_id)
+        .where(ProdutoModel.ativo.is_(True))
+    )
+    if em_estoque:
+        query = query.where(ProdutoModel.quantidade_estoque > 0)
+    if cursor:
+        query = query.where(tuple_(ProdutoModel.nome, ProdutoModel.id) > decodificar_cursor(cursor))
+    result = await db.execute(
+        query.order_by(ProdutoModel.nome, ProdutoModel.id).limit(limit + 1)
+    )
+    produtos = result.scalars().all()
+
+    proximo_cursor = None
+    if len(produtos) > limit:
+        produtos = produtos[:limit]
+        proximo_cursor = codificar_cursor(produtos[-1])
+
+    corpo = _produtos_json.dump_json(
+        _produtos_json.validate_python(produtos, from_attributes=True)
+    )
+    etag = f'W/"{empresa_id}-{versao}-{int(em_estoque)}-{limit}-{cursor}"'
+    # Compressão fora do event loop (catálogos grandes)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, PaginaCatalogo, versao, etag, corpo, proximo_cursor)
+
+async def obter_pagina_catalogo(
+    db: AsyncSession,
+    empresa_id: int,
+    em_estoque: bool,
+    limit: int,
+    cursor: Optional[str]
+) -> PaginaCatalogo:
+    """Página da vitrine, servida da memória enquanto a versão do catálogo não mudar.
+
+    Dentro de CATALOGO_VERSAO_TTL a página é servida sem tocar no banco; depois
+    disso a versão é reconferida com uma consulta pela chave primária.
+    """
+    chave = (empresa_id, em_estoque, limit, cursor or "")
+    pagina = cache_catalogo.get(chave)
+    if pagina is not None and time.monotonic() - pagina.verificada_em < CATALOGO_VERSAO_TTL:
+        cache_catalogo.hits += 1
+        return pagina
+
+    versao = await obter_versao_catalogo(db, empresa_id)
+    if versao is None:
+        cache_catalogo.invalidar(empresa_id)
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    if pagina is not None and pagina.versao == versao:
+        pagina.verificada_em = time.monotonic()
+        cache_catalogo.hits += 1
+        return pagina
+
+    cache_catalogo.misses += 1
+    pagina = await _montar_pagina(db, empresa_id, versao, em_estoque, limit, cursor or "")
+    cache_catalogo.set(chave, pagina)
+    return pagina
+
+def resposta_pagina(request: Request, pagina: PaginaCatalogo) -> Response:
+    """Resposta HTTP da página: 304 se o ETag bate, senão o corpo já comprimido"""
+    cabecalhos = {"ETag": pagina.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if pagina.proximo_cursor:
+        cabecalhos["X-Proximo-Cursor"] = pagina.proximo_cursor
+    if request.headers.get("if-none-match") == pagina.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabecalhos)
+
+    encoding, corpo = pagina.corpo(request.headers.get("accept-encoding", ""))
+    if encoding != "identity":
+        cabecalhos["Content-Encoding"] = encoding
+    return Response(content=corpo, media_type="application/json", headers=cabecalhos)
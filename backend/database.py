@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
+from bisect import bisect_left
+from threading import Lock
+from uuid import uuid4
+import time
 import os
 
 load_dotenv()
@@ -11,9 +17,124 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
     "postgresql://postgres:postgres@db:5432/testenota"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# URL do driver assíncrono (asyncpg), derivada da URL síncrona se não informada
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+# Configurações do pool de conexões (por engine, por worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Modo PgBouncer (pool_mode=transaction): sem prepared statements no servidor
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+class PoolStats:
+    """Estatísticas de espera por conexão de um pool"""
+
+    # Limites (em segundos) dos buckets do histograma de espera
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = Lock()
+        self.contagem_buckets = [0] * (len(self.BUCKETS) + 1)
+        self.total_checkouts = 0
+        self.tempo_espera_total = 0.0
+        self.timeouts = 0
+
+    def registrar_espera(self, segundos: float):
+        with self._lock:
+            self.contagem_buckets[bisect_left(self.BUCKETS, segundos)] += 1
+            self.total_checkouts += 1
+            self.tempo_espera_total += segundos
+
+    def registrar_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            acumulado = 0
+            histograma = {}
+            for limite, quantidade in zip(self.BUCKETS + ("+Inf",), self.contagem_buckets):
+                acumulado += quantidade
+                histograma[str(limite)] = acumulado
+            return {
+                "tamanho": pool.size(),
+                "em_uso": pool.checkedout(),
+                "livres": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checkouts": self.total_checkouts,
+                "espera_total_segundos": self.tempo_espera_total,
+                "espera_histograma": histograma,
+                "timeouts": self.timeouts,
+            }
+
+class _PoolInstrumentadoMixin:
+    """Mede o tempo que cada checkout espera por uma conexão livre"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.registrar_timeout()
+            raise
+        self.stats.registrar_espera(time.perf_counter() - inicio)
+        return conexao
+
+class PoolInstrumentado(_PoolInstrumentadoMixin, QueuePool):
+    stats = PoolStats()
+
+class AsyncPoolInstrumentado(_PoolInstrumentadoMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+def _opcoes_pool() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def _connect_args_async() -> dict:
+    if not DB_PGBOUNCER:
+        return {}
+    # PgBouncer em modo transaction não mantém estado por sessão: desliga o
+    # cache de statements do asyncpg e usa nomes únicos para os que restarem
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+# Engine síncrona: usada por scripts (init_db) e rotinas fora do event loop
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=PoolInstrumentado,
+    **_opcoes_pool()
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrona: usada pelas rotas async def para não bloquear o event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncPoolInstrumentado,
+    connect_args=_connect_args_async(),
+    **_opcoes_pool()
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -22,3 +143,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_pool_stats() -> dict:
+    """Estado atual dos pools de conexão deste worker"""
+    return {
+        "pgbouncer": DB_PGBOUNCER,
+        "sync": PoolInstrumentado.stats.snapshot(engine.pool),
+        "async": AsyncPoolInstrumentado.stats.snapshot(async_engine.sync_engine.pool),
+    }
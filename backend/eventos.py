@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+import asyncpg
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import SQLALCHEMY_DATABASE_URL
+
+# "postgres": LISTEN/NOTIFY, entrega entre workers e servidores; "memoria": só neste processo (um nó, um worker)
+EVENTOS_BACKEND = os.getenv("EVENTOS_BACKEND", "postgres").lower()
+# Conexão direta ao Postgres para o LISTEN (o PgBouncer em modo transaction não repassa LISTEN)
+EVENTOS_DATABASE_URL = os.getenv("EVENTOS_DATABASE_URL", SQLALCHEMY_DATABASE_URL).replace("+asyncpg", "", 1)
+# Intervalo do heartbeat enviado aos clientes e do ping na conexão do LISTEN (segundos)
+EVENTOS_HEARTBEAT = float(os.getenv("EVENTOS_HEARTBEAT", "15"))
+# Eventos pendentes por cliente; quem ficar para trás é desconectado e recarrega pela API
+EVENTOS_FILA_MAX = int(os.getenv("EVENTOS_FILA_MAX", "100"))
+# Conexões SSE simultâneas por worker
+EVENTOS_MAX_CONEXOES = int(os.getenv("EVENTOS_MAX_CONEXOES", "1000"))
+
+CANAL = "pedidos_eventos"
+# O payload do NOTIFY é limitado a 8000 bytes: lotes grandes viram vários eventos
+PEDIDOS_POR_EVENTO = 100
+
+def _quadro(tipo: str, dados: str) -> str:
+    return f"event: {tipo}\ndata: {dados}\n\n"
+
+async def publicar_evento(db: AsyncSession, empresa_id: int, tipo: str, dados: dict):
+    """Publica o evento na transação do chamador: só chega aos clientes após o commit"""
+    payload = json.dumps({"tipo": tipo, "empresa_id": empresa_id, **dados}, separators=(",", ":"))
+    if EVENTOS_BACKEND == "memoria":
+        db.info.setdefault("eventos_pendentes", []).append(payload)
+    else:
+        await db.execute(select(func.pg_notify(CANAL, payload)))
+
+@event.listens_for(Session, "after_commit")
+def _entregar_pendentes(session):
+    for payload in session.info.pop("eventos_pendentes", ()):
+        barramento_pedidos.distribuir(payload)
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendentes(session):
+    session.info.pop("eventos_pendentes", None)
+
+class Assinatura:
+    """Um cliente conectado: fila limitada de quadros SSE já formatados"""
+
+    __slots__ = ("empresa_ids", "fila")
+
+    def __init__(self, empresa_ids: Iterable[int]):
+        self.empresa_ids = tuple(empresa_ids)
+        self.fila: asyncio.Queue = asyncio.Queue(maxsize=EVENTOS_FILA_MAX)
+
+class BarramentoPedidos:
+    """Distribui os eventos de pedidos aos clientes SSE deste worker.
+
+    Uma única conexão LISTEN por worker; cada evento é formatado uma vez e o
+    mesmo quadro vai para a fila de todos os clientes da empresa.
+    """
+
+    def __init__(self):
+        self._assinaturas: Dict[int, Set[Assinatura]] = {}
+        self.conexoes = 0
+        self.recebidos = 0
+        self.entregues = 0
+        self.desconectados_por_atraso = 0
+        self.reconexoes = 0
+        self.escutando = False
+        self._task: Optional[asyncio.Task] = None
+
+    def lotado(self) -> bool:
+        return self.conexoes >= EVENTOS_MAX_CONEXOES
+
+    def _assinar(self, empresa_ids: Iterable[int]) -> Assinatura:
+        assinatura = Assinatura(empresa_ids)
+        for empresa_id in assinatura.empresa_ids:
+            self._assinaturas.setdefault(empresa_id, set()).add(assinatura)
+        self.conexoes += 1
+        return assinatura
+
+    def _cancelar(self, assinatura: Assinatura):
+        for empresa_id in assinatura.empresa_ids:
+            assinaturas = self._assinaturas.get(empresa_id)
+            if assinaturas is None:
+                continue
+            assinaturas.discard(assinatura)
+            if not assinaturas:
+                del self._assinaturas[empresa_id]
+        self.conexoes -= 1
+
+    def _encerrar(self, assinatura: Assinatura):
+        """Descarta o que estava pendente e sinaliza o fim da transmissão"""
+        while not assinatura.fila.empty():
+            assinatura.fila.get_nowait()
+        assinatura.fila.put_nowait(None)
+
+    def _enviar(self, assinaturas: Iterable[Assinatura], quadro: str):
+        for assinatura in assinaturas:
+            try:
+                assinatura.fila.put_nowait(quadro)
+                self.entregues += 1
+            except asyncio.QueueFull:
+                self.desconectados_por_atraso += 1
+                self._encerrar(assinatura)
+
+    def distribuir(self, payload: str):
+        """Entrega um evento publicado (JSON) aos clientes da empresa"""
+        self.recebidos += 1
+        try:
+            evento = json.loads(payload)
+            assinaturas = self._assinaturas.get(evento["empresa_id"])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Evento de pedido inválido: {e}")
+            return
+        if assinaturas:
+            self._enviar(list(assinaturas), _quadro(evento["tipo"], payload))
+
+    def _ressincronizar(self):
+        """Eventos podem ter se perdido enquanto o LISTEN esteve fora: os clientes recarregam pela API"""
+        todas = {assinatura for assinaturas in self._assinaturas.values() for assinatura in assinaturas}
+        self._enviar(todas, _quadro("ressincronizar", "{}"))
+
+    async def transmitir(self, empresa_ids: Iterable[int]) -> AsyncIterator[str]:
+        """Corpo da resposta SSE de um cliente; termina quando ele desconecta ou fica para trás"""
+        assinatura = self._assinar(empresa_ids)
+        try:
+            # Enviado também a cada reconexão do EventSource: o cliente recarrega o estado pela API
+            yield "retry: 3000\n" + _quadro("conectado", json.dumps({"empresa_ids": list(assinatura.empresa_ids)}))
+            while True:
+                try:
+                    quadro = await asyncio.wait_for(assinatura.fila.get(), EVENTOS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comentário SSE: mantém a conexão viva em proxies e detecta clientes que sumiram
+                    yield ": ping\n\n"
+                    continue
+                if quadro is None:
+                    return
+                yield quadro
+        finally:
+            self._cancelar(assinatura)
+
+    def _notificacao(self, conexao, pid, canal, payload):
+        self.distribuir(payload)
+
+    async def _escutar(self):
+        while True:
+            conexao = None
+            try:
+                conexao = await asyncpg.connect(EVENTOS_DATABASE_URL)
+                perdida = asyncio.Event()
+                conexao.add_termination_listener(lambda _: perdida.set())
+                await conexao.add_listener(CANAL, self._notificacao)
+                if self.reconexoes:
+                    self._ressincronizar()
+                self.escutando = True
+                while not perdida.is_set():
+                    try:
+                        await asyncio.wait_for(perdida.wait(), EVENTOS_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        # Conexão que caiu sem aviso (rede) só é percebida ao usá-la
+                        await asyncio.wait_for(conexao.execute("SELECT 1"), EVENTOS_HEARTBEAT)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"Erro na conexão LISTEN de eventos de pedidos: {e}")
+            finally:
+                self.escutando = False
+                if conexao is not None:
+                    conexao.terminate()
+            self.reconexoes += 1
+            await asyncio.sleep(5)
+
+    def iniciar(self):
+        if EVENTOS_BACKEND != "memoria" and self._task is None:
+            self._task = asyncio.create_task(self._escutar())
+
+    async def parar(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Encerra as transmissões abertas para o uvicorn conseguir finalizar o worker
+        for assinaturas in list(self._assinaturas.values()):
+            for assinatura in list(assinaturas):
+                self._encerrar(assinatura)
+
+    def stats(self) -> dict:
+        return {
+            "backend": EVENTOS_BACKEND,
+            "escutando": self.escutando,
+            "conexoes": self.conexoes,
+            "empresas": len(self._assinaturas),
+            "recebidos": self.recebidos,
+            "entregues": self.entregues,
+            "desconectados_por_atraso": self.desconectados_por_atraso,
+            "reconexoes": self.reconexoes,
+        }
+
+barramento_pedidos = BarramentoPedidos()
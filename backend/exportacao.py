@@ -0,0 +1,91 @@
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Pedido, ItemPedido, Produto
+
+# Linhas buscadas por vez no cursor do servidor (e escritas por bloco da resposta)
+EXPORTACAO_LOTE = int(os.getenv("EXPORTACAO_LOTE", "2000"))
+# Nível do gzip quando a exportação é compactada (1 = mais rápido, 9 = menor)
+EXPORTACAO_GZIP_NIVEL = int(os.getenv("EXPORTACAO_GZIP_NIVEL", "6"))
+
+COLUNAS_PEDIDOS = [
+    "pedido_id", "data_criacao", "status", "cliente_telefone", "valor_total",
+    "item_id", "produto_id", "produto_nome", "sku", "quantidade", "preco_unitario", "subtotal",
+]
+
+def _consulta_pedidos(empresa_id: int, inicio: Optional[date], fim: Optional[date]):
+    """Uma linha por item (pedidos sem itens também aparecem), na ordem do índice da empresa"""
+    query = (
+        select(
+            Pedido.id, Pedido.data_criacao, Pedido.status, Pedido.cliente_telefone, Pedido.valor_total,
+            ItemPedido.id, ItemPedido.produto_id, Produto.nome, Produto.sku,
+            ItemPedido.quantidade, ItemPedido.preco_unitario
+        )
+        .select_from(Pedido)
+        .outerjoin(ItemPedido, ItemPedido.pedido_id == Pedido.id)
+        .outerjoin(Produto, Produto.id == ItemPedido.produto_id)
+        .where(Pedido.empresa_id == empresa_id)
+    )
+    # Datas em UTC, fim inclusivo
+    if inicio:
+        query = query.where(Pedido.data_criacao >= datetime.combine(inicio, datetime.min.time()))
+    if fim:
+        query = query.where(Pedido.data_criacao < datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+    return query.order_by(Pedido.data_criacao, Pedido.id, ItemPedido.id)
+
+def _valores(linha, excel: bool) -> list:
+    (pedido_id, data_criacao, status, telefone, valor_total,
+     item_id, produto_id, nome, sku, quantidade, preco_unitario) = linha
+    subtotal = quantidade * preco_unitario if quantidade is not None and preco_unitario is not None else None
+    valores = [
+        pedido_id,
+        data_criacao.isoformat(sep=" ", timespec="seconds") if data_criacao else None,
+        status.value if status else None,
+        telefone, valor_total, item_id, produto_id, nome, sku, quantidade, preco_unitario, subtotal,
+    ]
+    if excel:
+        # Excel em português: decimal com vírgula
+        valores = [str(valor).replace(".", ",") if isinstance(valor, float) else valor for valor in valores]
+    return valores
+
+async def exportar_pedidos(
+    empresa_id: int,
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    formato: str = "csv"
+) -> AsyncIterator[bytes]:
+    """Pedidos e itens da empresa em CSV, lidos do banco com cursor no servidor.
+
+    Só um lote de linhas fica em memória por vez, qualquer que seja o período.
+    formato="excel": separador ";", decimal com vírgula e BOM, como o Excel em
+    português abre sem assistente de importação.
+    """
+    excel = formato == "excel"
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=";" if excel else ",")
+    escritor.writerow(COLUNAS_PEDIDOS)
+    yield buffer.getvalue().encode("utf-8-sig" if excel else "utf-8")
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            _consulta_pedidos(empresa_id, inicio, fim).execution_options(yield_per=EXPORTACAO_LOTE)
+        )
+        async for linhas in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(_valores(linha, excel) for linha in linhas)
+            yield buffer.getvalue().encode()
+
+async def compactar_gzip(partes: AsyncIterator[bytes], nivel: int = EXPORTACAO_GZIP_NIVEL) -> AsyncIterator[bytes]:
+    """Compacta um stream em gzip bloco a bloco, sem acumular o arquivo"""
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for parte in partes:
+        dados = compressor.compress(parte)
+        if dados:
+            yield dados
+    yield compressor.flush()
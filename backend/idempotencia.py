@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import ChaveIdempotencia
+
+# Por quanto tempo uma Idempotency-Key devolve a resposta gravada (segundos)
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", str(24 * 3600)))
+# Respostas recentes mantidas em memória por worker
+IDEMPOTENCIA_CACHE_MAX = int(os.getenv("IDEMPOTENCIA_CACHE_MAX", "10000"))
+# Intervalo da limpeza das chaves expiradas no banco (segundos)
+IDEMPOTENCIA_LIMPEZA_INTERVALO = float(os.getenv("IDEMPOTENCIA_LIMPEZA_INTERVALO", "3600"))
+
+class RequisicaoIdempotente:
+    """Chave enviada pelo cliente, com o escopo do usuário e o hash do corpo"""
+
+    __slots__ = ("usuario_id", "chave", "hash")
+
+    def __init__(self, usuario_id: int, chave: str, corpo: dict):
+        self.usuario_id = usuario_id
+        self.chave = chave
+        self.hash = hashlib.sha256(
+            json.dumps(corpo, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+
+    @property
+    def id(self) -> Tuple[int, str]:
+        return (self.usuario_id, self.chave)
+
+def _conferir_hash(req: RequisicaoIdempotente, hash_gravado: str):
+    if hash_gravado != req.hash:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key já usada com outro corpo de requisição"
+        )
+
+class RespostasIdempotentes:
+    """Respostas de requisições com Idempotency-Key.
+
+    O banco é a fonte da verdade entre workers; a memória evita até a consulta
+    quando a repetição cai no mesmo worker.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCIA_TTL, max_itens: int = IDEMPOTENCIA_CACHE_MAX):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._itens: "OrderedDict[Tuple[int, str], Tuple[float, str, dict]]" = OrderedDict()
+        self._em_andamento: Dict[Tuple[int, str], List] = {}
+        self.repeticoes_memoria = 0
+        self.repeticoes_banco = 0
+        self.esperas = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def exclusivo(self, req: RequisicaoIdempotente):
+        """Repetições simultâneas neste worker esperam a primeira sem ocupar conexão do banco"""
+        entrada = self._em_andamento.setdefault(req.id, [asyncio.Lock(), 0])
+        if entrada[0].locked():
+            self.esperas += 1
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                yield
+        finally:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self._em_andamento[req.id]
+
+    def obter(self, req: RequisicaoIdempotente) -> Optional[dict]:
+        item = self._itens.get(req.id)
+        if item is None or item[0] < time.monotonic():
+            return None
+        _conferir_hash(req, item[1])
+        self._itens.move_to_end(req.id)
+        self.repeticoes_memoria += 1
+        return item[2]
+
+    def guardar(self, req: RequisicaoIdempotente, resposta: dict):
+        """Chamado após o commit da transação que gravou a resposta"""
+        self._itens[req.id] = (time.monotonic() + self.ttl, req.hash, resposta)
+        self._itens.move_to_end(req.id)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    async def reservar(self, db: AsyncSession, req: RequisicaoIdempotente) -> Optional[dict]:
+        """Registra a chave na transação do chamador; se ela já foi usada, retorna a resposta gravada.
+
+        Com a mesma chave em andamento em outro worker, o INSERT espera no índice
+        único até aquela transação terminar: após o commit devolve a resposta
+        dela; após um rollback a chave fica livre e esta requisição segue.
+        """
+        agora = datetime.utcnow()
+        stmt = insert(ChaveIdempotencia).values(
+            usuario_id=req.usuario_id,
+            chave=req.chave,
+            hash_requisicao=req.hash,
+            data_criacao=agora,
+            expira_em=agora + timedelta(seconds=self.ttl)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChaveIdempotencia.usuario_id, ChaveIdempotencia.chave],
+            set_={
+                "hash_requisicao": stmt.excluded.hash_requisicao,
+                "resposta": None,
+                "data_criacao": stmt.excluded.data_criacao,
+                "expira_em": stmt.excluded.expira_em,
+            },
+            # Chave expirada (ainda não limpa) vale como nova
+            where=ChaveIdempotencia.expira_em < agora
+        ).returning(ChaveIdempotencia.chave)
+        if await db.scalar(stmt) is not None:
+            return None
+
+        result = await db.execute(
+            select(ChaveIdempotencia.hash_requisicao, ChaveIdempotencia.resposta)
+            .where(ChaveIdempotencia.usuario_id == req.usuario_id)
+            .where(ChaveIdempotencia.chave == req.chave)
+        )
+        gravada = result.one()
+        _conferir_hash(req, gravada.hash_requisicao)
+        self.repeticoes_banco += 1
+        self.guardar(req, gravada.resposta)
+        return gravada.resposta
+
+    async def gravar(self, db: AsyncSession, req: RequisicaoIdempotente, resposta: dict):
+        """Grava a resposta na transação do chamador, antes do commit"""
+        await db.execute(
+            update(ChaveIdempotencia)
+            .where(ChaveIdempotencia.usuario_id == req.usuario_id)
+            .where(ChaveIdempotencia.chave == req.chave)
+            .values(resposta=resposta)
+        )
+
+    async def _limpar_periodicamente(self):
+        while True:
+            await asyncio.sleep(IDEMPOTENCIA_LIMPEZA_INTERVALO)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        delete(ChaveIdempotencia).where(ChaveIdempotencia.expira_em < datetime.utcnow())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"Erro ao limpar chaves de idempotência: {e}")
+
+    def iniciar(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._limpar_periodicamente())
+
+    async def parar(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "itens": len(self._itens),
+            "em_andamento": len(self._em_andamento),
+            "repeticoes_memoria": self.repeticoes_memoria,
+            "repeticoes_banco": self.repeticoes_banco,
+            "esperas": self.esperas,
+        }
+
+respostas_idempotentes = RespostasIdempotentes()
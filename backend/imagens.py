@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException, Request, status
+from fastapi.staticfiles import StaticFiles
+from multipart.multipart import MultipartParser, parse_options_header
+from PIL import Image, ImageOps
+
+# Tamanho máximo do arquivo enviado (bytes)
+IMAGEM_MAX_BYTES = int(os.getenv("IMAGEM_MAX_BYTES", str(5 * 1024 * 1024)))
+# Larguras das variantes geradas (px)
+IMAGEM_LARGURAS = [int(largura) for largura in os.getenv("IMAGEM_LARGURAS", "160,480,1080").split(",")]
+# Threads para decodificar/redimensionar (o Pillow libera o GIL nessas etapas)
+IMAGEM_WORKERS = int(os.getenv("IMAGEM_WORKERS", "2"))
+
+# Recusa "bombas de descompressão" (arquivo pequeno com milhões de pixels)
+Image.MAX_IMAGE_PIXELS = int(os.getenv("IMAGEM_MAX_PIXELS", str(40 * 1000 * 1000)))
+
+CHUNK = 64 * 1024
+
+# Variantes gravadas por _gravar: <hash do conteúdo>-<largura>.<ext>
+NOME_IMUTAVEL = re.compile(r"[0-9a-f]{20}-\d+\.(webp|jpg)$")
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+
+imagem_executor = ThreadPoolExecutor(max_workers=IMAGEM_WORKERS, thread_name_prefix="imagem")
+
+# Folga para cabeçalhos e boundaries do multipart além do tamanho da imagem
+MULTIPART_FOLGA = 64 * 1024
+
+def _muito_grande(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Imagem maior que o limite de {max_bytes // (1024 * 1024)} MB"
+    )
+
+class _ArquivoMultipart:
+    """Callbacks do parser de multipart: guarda só os bytes do campo pedido"""
+
+    def __init__(self, campo: str):
+        self.campo = campo.encode()
+        self.encontrado = False
+        self.content_type: Optional[str] = None
+        self.tamanho = 0
+        self.blocos: List[bytes] = []
+        self._no_campo = False
+        self._cabecalhos: Dict[bytes, bytes] = {}
+        self._nome_cabecalho = b""
+        self._valor_cabecalho = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._inicio_parte,
+            "on_header_field": self._nome,
+            "on_header_value": self._valor,
+            "on_header_end": self._fim_cabecalho,
+            "on_headers_finished": self._fim_cabecalhos,
+            "on_part_data": self._dados,
+            "on_part_end": self._fim_parte,
+        }
+
+    def _inicio_parte(self):
+        self._cabecalhos = {}
+
+    def _nome(self, dados: bytes, inicio: int, fim: int):
+        self._nome_cabecalho += dados[inicio:fim]
+
+    def _valor(self, dados: bytes, inicio: int, fim: int):
+        self._valor_cabecalho += dados[inicio:fim]
+
+    def _fim_cabecalho(self):
+        self._cabecalhos[self._nome_cabecalho.lower()] = self._valor_cabecalho
+        self._nome_cabecalho = self._valor_cabecalho = b""
+
+    def _fim_cabecalhos(self):
+        _, opcoes = parse_options_header(self._cabecalhos.get(b"content-disposition", b""))
+        # Só a primeira parte com o nome do campo e um arquivo; o resto do corpo é descartado
+        self._no_campo = not self.encontrado and opcoes.get(b"name") == self.campo and b"filename" in opcoes
+        if self._no_campo:
+            self.encontrado = True
+            self.content_type = self._cabecalhos.get(b"content-type", b"").decode("latin-1").strip()
+
+    def _dados(self, dados: bytes, inicio: int, fim: int):
+        if self._no_campo:
+            self.tamanho += fim - inicio
+            self.blocos.append(dados[inicio:fim])
+
+    def _fim_parte(self):
+        self._no_campo = False
+
+async def receber_upload(request: Request, campo: str, max_bytes: int = IMAGEM_MAX_BYTES) -> str:
+    """Lê o multipart direto do corpo da requisição e grava só a imagem num arquivo temporário.
+
+    O limite vale enquanto o corpo chega: acima dele a requisição é recusada
+    sem receber o resto (com Content-Length grande, antes de ler o primeiro
+    byte), e nada além da própria imagem vai para o disco.
+    """
+    max_corpo = max_bytes + MULTIPART_FOLGA
+    tamanho_declarado = request.headers.get("content-length")
+    if tamanho_declarado and tamanho_declarado.isdigit() and int(tamanho_declarado) > max_corpo:
+        raise _muito_grande(max_bytes)
+    tipo, opcoes = parse_options_header(request.headers.get("content-type", ""))
+    if tipo != b"multipart/form-data" or b"boundary" not in opcoes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Envie a imagem como multipart/form-data")
+
+    arquivo = _ArquivoMultipart(campo)
+    parser = MultipartParser(opcoes[b"boundary"], arquivo.callbacks())
+    loop = asyncio.get_running_loop()
+    fd, caminho = tempfile.mkstemp(prefix="upload-")
+    recebido = 0
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            async for bloco in request.stream():
+                recebido += len(bloco)
+                if recebido > max_corpo:
+                    raise _muito_grande(max_bytes)
+                parser.write(bloco)
+                if arquivo.tamanho > max_bytes:
+                    raise _muito_grande(max_bytes)
+                if arquivo.encontrado and not (arquivo.content_type or "").startswith("image/"):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Arquivo deve ser uma imagem")
+                if arquivo.blocos:
+                    dados, arquivo.blocos = b"".join(arquivo.blocos), []
+                    await loop.run_in_executor(imagem_executor, destino.write, dados)
+            parser.finalize()
+        if not arquivo.encontrado:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Envie a imagem no campo {campo}"
+            )
+    except BaseException:
+        os.unlink(caminho)
+        raise
+    return caminho
+
+def _gravar(diretorio: Path, conteudo: bytes, largura: int, extensao: str) -> str:
+    # Nome pelo hash do conteúdo: a URL muda quando a imagem muda (cache imutável)
+    nome = f"{hashlib.sha256(conteudo).hexdigest()[:20]}-{largura}.{extensao}"
+    destino = diretorio / nome
+    if not destino.exists():
+        temporario = diretorio / f".{nome}.tmp"
+        temporario.write_bytes(conteudo)
+        os.replace(temporario, destino)
+    return nome
+
+def _gerar_variantes(caminho: str, diretorio: Path, larguras: Iterable[int]) -> Dict[str, Dict[str, str]]:
+    try:
+        with Image.open(caminho) as original:
+            original.load()
+            imagem = ImageOps.exif_transpose(original)
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Arquivo de imagem inválido")
+
+    com_transparencia = imagem.mode in ("RGBA", "LA") or "transparency" in imagem.info
+    imagem = imagem.convert("RGBA" if com_transparencia else "RGB")
+
+    diretorio.mkdir(parents=True, exist_ok=True)
+    variantes = {}
+    # Não amplia: larguras acima da original viram uma única variante do tamanho original
+    for largura in sorted({min(largura, imagem.width) for largura in larguras}):
+        copia = imagem.copy()
+        copia.thumbnail((largura, largura * 4), Image.LANCZOS)
+
+        webp = io.BytesIO()
+        copia.save(webp, "WEBP", quality=80, method=4)
+        jpeg = io.BytesIO()
+        fundo = copia
+        if com_transparencia:
+            fundo = Image.new("RGB", copia.size, (255, 255, 255))
+            fundo.paste(copia, mask=copia.getchannel("A"))
+        fundo.save(jpeg, "JPEG", quality=82, optimize=True, progressive=True)
+
+        variantes[str(largura)] = {
+            "webp": _gravar(diretorio, webp.getvalue(), largura, "webp"),
+            "jpeg": _gravar(diretorio, jpeg.getvalue(), largura, "jpg"),
+        }
+    return variantes
+
+async def processar_imagem(
+    request: Request,
+    campo: str,
+    diretorio: Path,
+    url_base: str,
+    larguras: Iterable[int] = IMAGEM_LARGURAS
+) -> Dict[str, Dict[str, str]]:
+    """Recebe o upload (campo multipart) e gera as variantes WebP/JPEG fora do event loop.
+
+    Retorna {largura: {"webp": url, "jpeg": url}}.
+    """
+    caminho = await receber_upload(request, campo)
+    try:
+        loop = asyncio.get_running_loop()
+        nomes = await loop.run_in_executor(
+            imagem_executor, _gerar_variantes, caminho, diretorio, list(larguras)
+        )
+    finally:
+        os.unlink(caminho)
+    return {
+        largura: {formato: f"{url_base}/{nome}" for formato, nome in arquivos.items()}
+        for largura, arquivos in nomes.items()
+    }
+
+def url_padrao(variantes: Dict[str, Dict[str, str]]) -> str:
+    """URL em JPEG da variante do meio, para quem só lê um campo de imagem"""
+    larguras = sorted(variantes, key=int)
+    return variantes[larguras[len(larguras) // 2]]["jpeg"]
+
+def remover_variantes(variantes: Dict[str, Dict[str, str]], diretorio: Path, manter: Dict[str, Dict[str, str]] = None):
+    """Apaga os arquivos de variantes antigas que não são usados pelas novas"""
+    em_uso = {url for arquivos in (manter or {}).values() for url in arquivos.values()}
+    for arquivos in variantes.values():
+        for url in arquivos.values():
+            if url in em_uso:
+                continue
+            try:
+                (diretorio / url.rsplit("/", 1)[-1]).unlink()
+            except FileNotFoundError:
+                pass
+
+class ArquivosEnviados(StaticFiles):
+    """/uploads servido pelo worker (desenvolvimento); em produção quem serve é o nginx"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if NOME_IMUTAVEL.search(str(full_path)):
+            response.headers["Cache-Control"] = CACHE_IMUTAVEL
+        else:
+            response.headers["Cache-Control"] = "public, no-cache"
+        return response
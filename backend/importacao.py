@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import literal_column, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import Produto as ProdutoModel
+from schemas import ProdutoImportacao
+from catalogo import incrementar_versao_catalogo
+
+# Linhas validadas e gravadas por INSERT (uma transação por lote)
+IMPORTACAO_LOTE = int(os.getenv("IMPORTACAO_LOTE", "1000"))
+# Máximo de erros detalhados no relatório (o total é sempre informado)
+IMPORTACAO_MAX_ERROS = int(os.getenv("IMPORTACAO_MAX_ERROS", "1000"))
+
+COLUNAS_EXPORTACAO = ["id", "sku", "nome", "descricao", "preco", "quantidade_estoque", "imagem_url", "ativo"]
+
+# Campos em que a célula vazia do CSV significa "sem valor"
+_OPCIONAIS = {nome for nome, campo in ProdutoImportacao.model_fields.items() if not campo.is_required()}
+
+async def _linhas(corpo: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Quebra o corpo da requisição em linhas conforme os blocos chegam"""
+    resto = b""
+    async for bloco in corpo:
+        resto += bloco
+        *linhas, resto = resto.split(b"\n")
+        for linha in linhas:
+            yield linha.decode("utf-8-sig").rstrip("\r")
+    if resto:
+        yield resto.decode("utf-8-sig").rstrip("\r")
+
+async def registros_csv(corpo: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, dict]]:
+    """(número da linha, campos) de um CSV com cabeçalho; aceita quebras de linha entre aspas"""
+    cabecalho = None
+    pendente = ""
+    numero = inicio = 0
+    async for linha in _linhas(corpo):
+        numero += 1
+        if not pendente:
+            inicio = numero
+        pendente = f"{pendente}\n{linha}" if pendente else linha
+        # Registro só termina com um número par de aspas (aspas escapadas vêm em pares)
+        if pendente.count('"') % 2:
+            continue
+        registro, pendente = pendente, ""
+        if not registro.strip():
+            continue
+        valores = next(csv.reader([registro]))
+        if cabecalho is None:
+            cabecalho = [coluna.strip().lower() for coluna in valores]
+            continue
+        yield inicio, {
+            coluna: (None if valor == "" and coluna in _OPCIONAIS else valor)
+            for coluna, valor in zip(cabecalho, valores)
+        }
+    if pendente:
+        yield inicio, {"_erro": "Aspas sem fechamento"}
+
+async def registros_ndjson(corpo: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, dict]]:
+    """(número da linha, objeto) de um arquivo com um JSON por linha"""
+    numero = 0
+    async for linha in _linhas(corpo):
+        numero += 1
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except ValueError as e:
+            registro = {"_erro": f"JSON inválido: {e}"}
+        if not isinstance(registro, dict):
+            registro = {"_erro": "Cada linha deve ser um objeto JSON"}
+        yield numero, registro
+
+class RelatorioImportacao:
+    def __init__(self):
+        self.linhas = 0
+        self.inseridos = 0
+        self.atualizados = 0
+        self.total_erros = 0
+        self.erros: List[dict] = []
+
+    def erro(self, linha: int, mensagens: List[str]):
+        self.total_erros += 1
+        if len(self.erros) < IMPORTACAO_MAX_ERROS:
+            self.erros.append({"linha": linha, "erros": mensagens})
+
+    def resumo(self) -> dict:
+        return {
+            "linhas": self.linhas,
+            "inseridos": self.inseridos,
+            "atualizados": self.atualizados,
+            "total_erros": self.total_erros,
+            "erros": self.erros,
+        }
+
+Linha = Tuple[int, dict]
+
+async def _atualizar_por_id(db: AsyncSession, empresa_id: int, por_id: Dict[int, Linha], relatorio: RelatorioImportacao):
+    """Linhas com id (ex.: de /produtos/exportar) atualizam o produto; ids de outra empresa e SKUs
+    de outro produto vão para o relatório"""
+    skus = [valores["sku"] for _, valores in por_id.values() if valores["sku"]]
+    result = await db.execute(
+        select(ProdutoModel.id, ProdutoModel.sku)
+        .where(ProdutoModel.empresa_id == empresa_id)
+        .where(or_(ProdutoModel.id.in_(por_id), ProdutoModel.sku.in_(skus)))
+    )
+    existentes = set()
+    dono_sku: Dict[str, int] = {}
+    for produto_id, sku in result.all():
+        if produto_id in por_id:
+            existentes.add(produto_id)
+        if sku:
+            dono_sku[sku] = produto_id
+
+    agora = datetime.utcnow()
+    alteracoes = []
+    for produto_id, (linha, valores) in por_id.items():
+        sku = valores["sku"]
+        if produto_id not in existentes:
+            relatorio.erro(linha, [f"id: produto {produto_id} não encontrado nesta empresa"])
+            continue
+        if sku and dono_sku.setdefault(sku, produto_id) != produto_id:
+            relatorio.erro(linha, [f"sku: {sku} já é do produto {dono_sku[sku]}"])
+            continue
+        # ativo vazio mantém o valor atual
+        alteracoes.append({
+            **{coluna: valor for coluna, valor in valores.items() if not (coluna == "ativo" and valor is None)},
+            "data_atualizacao": agora,
+        })
+    if alteracoes:
+        # UPDATE por chave primária em executemany
+        await db.execute(update(ProdutoModel), alteracoes)
+    relatorio.atualizados += len(alteracoes)
+
+async def _inserir_ou_atualizar_por_sku(db: AsyncSession, empresa_id: int, novos: List[dict], com_ativo: bool) -> int:
+    """Um INSERT multi-linha; produtos com SKU já cadastrado são atualizados. Retorna quantos foram inseridos"""
+    stmt = insert(ProdutoModel).values([
+        {**{coluna: valor for coluna, valor in valores.items() if coluna != "id"},
+         "ativo": valores["ativo"] if com_ativo else True, "empresa_id": empresa_id}
+        for valores in novos
+    ])
+    atualizar = {
+        "nome": stmt.excluded.nome,
+        "descricao": stmt.excluded.descricao,
+        "preco": stmt.excluded.preco,
+        "quantidade_estoque": stmt.excluded.quantidade_estoque,
+        "imagem_url": stmt.excluded.imagem_url,
+        "data_atualizacao": stmt.excluded.data_atualizacao,
+    }
+    # Sem a coluna ativo no arquivo, o produto existente fica como está
+    if com_ativo:
+        atualizar["ativo"] = stmt.excluded.ativo
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ProdutoModel.empresa_id, ProdutoModel.sku],
+        set_=atualizar
+    ).returning(literal_column("xmax = 0").label("inserido"))
+    result = await db.execute(stmt)
+    return sum(1 for (inserido,) in result.all() if inserido)
+
+async def _gravar_lote(empresa_id: int, lote: Dict[object, Linha], relatorio: RelatorioImportacao):
+    """Grava um lote numa transação: por id, ou por SKU para as linhas sem id.
+
+    A versão do catálogo sobe na mesma transação: se a importação parar no
+    meio, os lotes já gravados não ficam escondidos atrás do cache e do ETag.
+    """
+    por_id = {valores["id"]: (linha, valores) for linha, valores in lote.values() if valores["id"] is not None}
+    novos = [valores for _, valores in lote.values() if valores["id"] is None]
+
+    async with AsyncSessionLocal() as db:
+        if por_id:
+            await _atualizar_por_id(db, empresa_id, por_id, relatorio)
+        for com_ativo in (True, False):
+            grupo = [valores for valores in novos if (valores["ativo"] is not None) == com_ativo]
+            if grupo:
+                inseridos = await _inserir_ou_atualizar_por_sku(db, empresa_id, grupo, com_ativo)
+                relatorio.inseridos += inseridos
+                relatorio.atualizados += len(grupo) - inseridos
+        await incrementar_versao_catalogo(db, empresa_id)
+        await db.commit()
+
+async def importar_produtos(empresa_id: int, registros: AsyncIterator[Tuple[int, dict]]) -> dict:
+    """Valida com ProdutoImportacao e grava em lotes conforme o arquivo chega.
+
+    Cada lote é uma transação: linhas inválidas vão para o relatório e não
+    impedem as demais. Linhas com id (o arquivo de /produtos/exportar) atualizam
+    aquele produto; sem id, o SKU decide entre atualizar e inserir. Dentro de um
+    lote, id ou SKU repetido fica com a última linha.
+    """
+    relatorio = RelatorioImportacao()
+    lote: Dict[object, Linha] = {}
+    async for linha, registro in registros:
+        relatorio.linhas += 1
+        if "_erro" in registro:
+            relatorio.erro(linha, [registro["_erro"]])
+            continue
+        try:
+            produto = ProdutoImportacao(**registro)
+        except ValidationError as e:
+            relatorio.erro(linha, [
+                f"{'.'.join(str(parte) for parte in erro['loc'])}: {erro['msg']}"
+                for erro in e.errors()
+            ])
+            continue
+        if produto.id is not None:
+            chave = ("id", produto.id)
+        else:
+            chave = produto.sku or ("linha", linha)
+        lote[chave] = (linha, produto.model_dump())
+        if len(lote) >= IMPORTACAO_LOTE:
+            await _gravar_lote(empresa_id, lote, relatorio)
+            lote = {}
+    if lote:
+        await _gravar_lote(empresa_id, lote, relatorio)
+    return relatorio.resumo()
+
+async def exportar_produtos(empresa_id: int, formato: str) -> AsyncIterator[bytes]:
+    """Catálogo da empresa em CSV ou NDJSON, lido do banco com cursor no servidor"""
+    if formato == "csv":
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        yield buffer.getvalue().encode()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(*(getattr(ProdutoModel, coluna) for coluna in COLUNAS_EXPORTACAO))
+            .where(ProdutoModel.empresa_id == empresa_id)
+            .order_by(ProdutoModel.id)
+            .execution_options(yield_per=IMPORTACAO_LOTE)
+        )
+        async for linhas in result.partitions():
+            if formato == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(linhas)
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(COLUNAS_EXPORTACAO, linha)), ensure_ascii=False) + "\n"
+                    for linha in linhas
+                ).encode()
@@ -1,13 +1,16 @@
-from database import engine, Base
-from models import User, Empresa, Produto, Pedido, ItemPedido
+from alembic import command
+from alembic.config import Config
+from startup import ALEMBIC_INI
 
 def init_db():
-    print("Criando tabelas no banco de dados...")
+    """Aplica as migrações pendentes (equivale a `alembic upgrade head`)"""
+    print("Aplicando migrações do banco de dados...")
     try:
-        Base.metadata.create_all(bind=engine)
-        print("Tabelas criadas com sucesso!")
+        command.upgrade(Config(ALEMBIC_INI), "head")
+        print("Banco de dados atualizado com sucesso!")
     except Exception as e:
-        print(f"Erro ao criar tabelas: {str(e)}")
+        print(f"Erro ao aplicar migrações: {str(e)}")
+        raise
 
 if __name__ == "__main__":
     init_db()
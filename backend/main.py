@@ -1,17 +1,33 @@
+from startup import perfil_inicializacao, verificar_esquema
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from database import engine, Base
-from routers import auth, produtos, pedidos, empresas, estatisticas, dominios
+import os
+from database import async_engine, get_pool_stats
+from routers import auth, produtos, pedidos, empresas, estatisticas, dominios, vitrine
+from notificacoes import OutboxWorker
+from whatsapp import fechar_sessao, get_whatsapp_stats
+from auth import principal_cache
+from catalogo import cache_catalogo
+from tenants import TenantMiddleware, indice_tenants
+from imagens import ArquivosEnviados
+from eventos import barramento_pedidos
+from idempotencia import respostas_idempotentes
+from admissao import AdmissaoMiddleware, controle_admissao
+from metricas import MetricasMiddleware, registro
+from analise_produtos import atualizador_analise
 
-# Cria as tabelas no banco de dados
-print("Criando tabelas no banco de dados...")
-Base.metadata.create_all(bind=engine)
-print("Tabelas criadas com sucesso!")
+# O esquema do banco é criado/atualizado pelo Alembic (alembic upgrade head), uma vez por deploy
+perfil_inicializacao.marcar("imports")
 
 app = FastAPI(title="Sistema de Vendas Online")
 
+# Middlewares: o último adicionado roda primeiro (Métricas -> Tenant -> CORS -> Admissão -> rotas)
+
+# Limites por empresa/cliente e concorrência ligada ao pool do banco; recusa com 429/503
+app.add_middleware(AdmissaoMiddleware)
+
 # Configuração do CORS
 app.add_middleware(
     CORSMiddleware,
@@ -19,15 +35,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Proximo-Cursor", "Idempotent-Replayed", "Retry-After", "X-Consultas-SQL"],
 )
 
+# Resolve a loja pelo Host (domínio próprio ou subdomínio do slug) sem consultar o banco
+app.add_middleware(TenantMiddleware)
+
+# Latência, requisições em andamento e consultas SQL por rota (inclui as recusadas pela admissão)
+app.add_middleware(MetricasMiddleware, rotas=app.router.routes)
+
 # Criar diretório de uploads se não existir
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 (UPLOAD_DIR / "logos").mkdir(exist_ok=True)
 
-# Montar diretório de uploads
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# O nginx serve /uploads direto do disco; o mount fica para o desenvolvimento
+# sem nginx na frente (SERVIR_UPLOADS=true no docker-compose.yml)
+if os.getenv("SERVIR_UPLOADS", "false").lower() in ("1", "true", "yes"):
+    app.mount("/uploads", ArquivosEnviados(directory="uploads"), name="uploads")
 
 # Incluindo os routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -36,6 +61,35 @@ app.include_router(pedidos.router, prefix="/pedidos", tags=["pedidos"])
 app.include_router(empresas.router, prefix="/empresas", tags=["empresas"])
 app.include_router(dominios.router, prefix="/dominios", tags=["dominios"])
 app.include_router(estatisticas.router, prefix="/estatisticas", tags=["estatisticas"])
+app.include_router(vitrine.router, prefix="/vitrine", tags=["vitrine"])
+
+# Worker que envia as notificações de WhatsApp gravadas no outbox
+outbox_worker = OutboxWorker()
+
+perfil_inicializacao.marcar("app")
+
+@app.on_event("startup")
+async def startup():
+    perfil_inicializacao.esquema = await verificar_esquema(async_engine)
+    perfil_inicializacao.marcar("verificar_esquema")
+    outbox_worker.iniciar()
+    await indice_tenants.iniciar()
+    perfil_inicializacao.marcar("indice_tenants")
+    barramento_pedidos.iniciar()
+    respostas_idempotentes.iniciar()
+    atualizador_analise.iniciar()
+    perfil_inicializacao.concluir()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await outbox_worker.parar()
+    await indice_tenants.parar()
+    await barramento_pedidos.parar()
+    await respostas_idempotentes.parar()
+    await atualizador_analise.parar()
+    await fechar_sessao()
+    # Fecha as conexões do pool assíncrono
+    await async_engine.dispose()
 
 @app.get("/")
 async def read_root():
@@ -45,6 +99,56 @@ async def read_root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Endpoint interno: métricas deste worker no formato do Prometheus
+    return PlainTextResponse(registro.texto(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/pool", include_in_schema=False)
+async def pool_stats():
+    # Endpoint interno: uso do pool de conexões do worker
+    return get_pool_stats()
+
+@app.get("/health/whatsapp", include_in_schema=False)
+async def whatsapp_stats():
+    # Endpoint interno: reuso de conexões e latência da Evolution API
+    return get_whatsapp_stats()
+
+@app.get("/health/auth-cache", include_in_schema=False)
+async def auth_cache_stats():
+    # Endpoint interno: hits/misses do cache de usuários autenticados
+    return principal_cache.stats()
+
+@app.get("/health/catalogo", include_in_schema=False)
+async def catalogo_stats():
+    # Endpoint interno: páginas da vitrine em memória
+    return cache_catalogo.stats()
+
+@app.get("/health/eventos", include_in_schema=False)
+async def eventos_stats():
+    # Endpoint interno: clientes conectados ao feed de pedidos neste worker
+    return barramento_pedidos.stats()
+
+@app.get("/health/idempotencia", include_in_schema=False)
+async def idempotencia_stats():
+    # Endpoint interno: repetições de pedidos respondidas pela chave de idempotência
+    return respostas_idempotentes.stats()
+
+@app.get("/health/analise", include_in_schema=False)
+async def analise_stats():
+    # Endpoint interno: atualização em background dos resumos da análise de produtos
+    return atualizador_analise.stats()
+
+@app.get("/health/admissao", include_in_schema=False)
+async def admissao_stats():
+    # Endpoint interno: requisições admitidas e recusadas por classe de rota
+    return controle_admissao.stats()
+
+@app.get("/health/startup", include_in_schema=False)
+async def startup_stats():
+    # Endpoint interno: tempo de inicialização (cold start) deste worker
+    return perfil_inicializacao.relatorio()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
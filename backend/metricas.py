@@ -0,0 +1,396 @@
+import logging
+import os
+import re
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from starlette.routing import Match
+from database import engine, async_engine, PoolInstrumentado, AsyncPoolInstrumentado
+from whatsapp import metricas as metricas_whatsapp
+from admissao import controle_admissao
+from eventos import barramento_pedidos
+
+# Consultas acima deste tempo vão para o log de consultas lentas (milissegundos)
+DB_CONSULTA_LENTA_MS = float(os.getenv("DB_CONSULTA_LENTA_MS", "200"))
+# Desenvolvimento: guarda o SQL de cada requisição e responde X-Consultas-SQL / X-Orcamento-Consultas
+DB_CONSULTAS_DEV = os.getenv("DB_CONSULTAS_DEV", "false").lower() == "true"
+
+# Consultas lentas e orçamentos excedidos saem como WARNING: filtráveis e com nível no agregador de logs
+logger = logging.getLogger("metricas")
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+BUCKETS_TAREFAS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+
+    def cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+class Contador(Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, *valores_rotulos, valor: float = 1):
+        self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + valor
+
+    def linhas(self) -> List[str]:
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+            for chave, valor in self._valores.items()
+        ]
+
+class Medidor(Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple, float] = {}
+
+    def inc(self, *valores_rotulos, valor: float = 1):
+        self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + valor
+
+    def dec(self, *valores_rotulos, valor: float = 1):
+        self.inc(*valores_rotulos, valor=-valor)
+
+    def linhas(self) -> List[str]:
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+            for chave, valor in self._valores.items()
+        ]
+
+class Histograma(Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), buckets: Tuple = BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = buckets
+        # Por combinação de rótulos: [contagem por bucket (não acumulada), soma]
+        self._series: Dict[Tuple, list] = {}
+
+    def observar(self, valor: float, *valores_rotulos):
+        serie = self._series.get(valores_rotulos)
+        if serie is None:
+            serie = self._series[valores_rotulos] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+    def linhas(self) -> List[str]:
+        linhas = self.cabecalho()
+        for chave, (contagens, soma) in self._series.items():
+            linhas += linhas_histograma(self.nome, self.rotulos, chave, self.buckets, contagens, soma)
+        return linhas
+
+def linhas_histograma(nome: str, rotulos: Tuple[str, ...], valores: Tuple, buckets: Iterable,
+                      contagens: Iterable[int], soma: float) -> List[str]:
+    """Série de histograma a partir das contagens por bucket (não acumuladas, com o +Inf no fim)"""
+    linhas = []
+    acumulado = 0
+    for limite, quantidade in zip(tuple(buckets) + ("+Inf",), contagens):
+        acumulado += quantidade
+        le = 'le="%s"' % limite
+        linhas.append(f"{nome}_bucket{_rotulos(rotulos, valores, le)} {acumulado}")
+    linhas.append(f"{nome}_sum{_rotulos(rotulos, valores)} {_numero(soma)}")
+    linhas.append(f"{nome}_count{_rotulos(rotulos, valores)} {acumulado}")
+    return linhas
+
+class Registro:
+    """Métricas deste worker no formato de texto do Prometheus"""
+
+    def __init__(self):
+        self._metricas: List[Metrica] = []
+        # Funções chamadas a cada coleta, para estatísticas que já existem em outros módulos
+        self._coletores: List[Callable[[], List[str]]] = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def coletor(self, funcao: Callable[[], List[str]]):
+        self._coletores.append(funcao)
+        return funcao
+
+    def texto(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas += metrica.linhas()
+        for coletor in self._coletores:
+            try:
+                linhas += coletor()
+            except Exception as e:
+                logger.error("Erro ao coletar métricas (%s): %s", coletor.__name__, e)
+        return "\n".join(linhas) + "\n"
+
+registro = Registro()
+
+requisicoes_duracao = registro.registrar(Histograma(
+    "http_requisicao_duracao_segundos", "Latência das requisições HTTP", ("metodo", "rota", "status")
+))
+requisicoes_em_andamento = registro.registrar(Medidor(
+    "http_requisicoes_em_andamento", "Requisições HTTP sendo atendidas", ("metodo", "rota")
+))
+consultas_por_requisicao = registro.registrar(Histograma(
+    "db_consultas_por_requisicao", "Consultas SQL emitidas por requisição", ("rota",), BUCKETS_CONSULTAS
+))
+tempo_consultas_requisicao = registro.registrar(Histograma(
+    "db_tempo_consultas_por_requisicao_segundos", "Tempo somado das consultas SQL de cada requisição", ("rota",)
+))
+consultas_duracao = registro.registrar(Histograma(
+    "db_consulta_duracao_segundos", "Duração de cada consulta SQL (requisições e tarefas em background)", ("operacao",)
+))
+consultas_lentas = registro.registrar(Contador(
+    "db_consultas_lentas_total", "Consultas acima de DB_CONSULTA_LENTA_MS", ("rota",)
+))
+orcamentos_excedidos = registro.registrar(Contador(
+    "db_orcamento_consultas_excedido_total", "Requisições que passaram do orçamento de consultas da rota", ("rota",)
+))
+tarefas_duracao = registro.registrar(Histograma(
+    "tarefa_duracao_segundos", "Duração das tarefas em background", ("tarefa", "resultado"), BUCKETS_TAREFAS
+))
+
+class ConsultasRequisicao:
+    """Consultas SQL da requisição em andamento (acumuladas pelos eventos da engine)"""
+
+    __slots__ = ("rota", "quantidade", "tempo", "orcamento", "instrucoes")
+
+    def __init__(self, rota: str, registrar_instrucoes: bool = DB_CONSULTAS_DEV):
+        self.rota = rota
+        self.quantidade = 0
+        self.tempo = 0.0
+        self.orcamento: Optional[int] = None
+        # SQL normalizado de cada consulta, só quando pedido (desenvolvimento e testes)
+        self.instrucoes: Optional[List[str]] = [] if registrar_instrucoes else None
+
+    def excedeu(self) -> bool:
+        return self.orcamento is not None and self.quantidade > self.orcamento
+
+    def resumo(self) -> str:
+        linhas = [f"{self.quantidade} consultas em {self.rota} (orçamento: {self.orcamento})"]
+        linhas += [f"  {i}. {sql}" for i, sql in enumerate(self.instrucoes or (), 1)]
+        return "\n".join(linhas)
+
+# O SQLAlchemy async repassa o contexto ao greenlet da consulta, então os eventos enxergam a requisição
+requisicao_atual: ContextVar[Optional[ConsultasRequisicao]] = ContextVar("requisicao_atual", default=None)
+
+_LISTA_PARAMETROS = re.compile(r"\((?:\s*(?:%\(\w+\)s|\$\d+|\?)\s*,)+\s*(?:%\(\w+\)s|\$\d+|\?)\s*\)")
+_ESPACOS = re.compile(r"\s+")
+
+def normalizar_consulta(sql: str, limite: int = 500) -> str:
+    """SQL em uma linha, com listas de parâmetros (IN, VALUES) resumidas"""
+    sql = _LISTA_PARAMETROS.sub("(...)", _ESPACOS.sub(" ", sql).strip())
+    return sql if len(sql) <= limite else sql[:limite] + "..."
+
+def _antes_consulta(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._inicio_metricas = time.perf_counter()
+
+def _depois_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_inicio_metricas", None)
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    consultas_duracao.observar(segundos, statement.lstrip().split(" ", 1)[0].upper())
+    requisicao = requisicao_atual.get()
+    if requisicao is not None:
+        requisicao.quantidade += 1
+        requisicao.tempo += segundos
+        if requisicao.instrucoes is not None:
+            requisicao.instrucoes.append(normalizar_consulta(statement))
+    if segundos * 1000 >= DB_CONSULTA_LENTA_MS:
+        rota = requisicao.rota if requisicao is not None else "background"
+        consultas_lentas.inc(rota)
+        logger.warning("Consulta lenta (%.0fms) em %s: %s", segundos * 1000, rota, normalizar_consulta(statement))
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _antes_consulta)
+    event.listen(_engine, "after_cursor_execute", _depois_consulta)
+
+def orcamento_consultas(maximo: int):
+    """Dependência de rota: máximo de consultas SQL da requisição, autenticação incluída.
+
+    O número não pode crescer com o tamanho da página ou do pedido; quem passar
+    aparece em db_orcamento_consultas_excedido_total e no log (com o SQL, em dev).
+    """
+    async def definir_orcamento():
+        requisicao = requisicao_atual.get()
+        if requisicao is not None:
+            requisicao.orcamento = maximo
+    return definir_orcamento
+
+@contextmanager
+def contar_consultas(maximo: Optional[int] = None):
+    """Para testes e scripts: conta e guarda as consultas do bloco; com maximo, falha se passar.
+
+        with contar_consultas(maximo=4) as consultas:
+            await listar_pedidos(...)
+
+    Para requisições via cliente HTTP, use DB_CONSULTAS_DEV=true e o cabeçalho X-Consultas-SQL.
+    """
+    consultas = ConsultasRequisicao("contar_consultas", registrar_instrucoes=True)
+    consultas.orcamento = maximo
+    token = requisicao_atual.set(consultas)
+    try:
+        yield consultas
+    finally:
+        requisicao_atual.reset(token)
+    if consultas.excedeu():
+        raise AssertionError(consultas.resumo())
+
+def registrar_tarefa(tarefa: str, segundos: float, resultado: str = "ok"):
+    tarefas_duracao.observar(segundos, tarefa, resultado)
+
+class MetricasMiddleware:
+    """Latência, requisições em andamento e consultas SQL por rota.
+
+    A rota é o template (/pedidos/{pedido_id}), não o caminho, para não
+    criar uma série por id; caminhos sem rota contam como "desconhecida".
+    """
+
+    def __init__(self, app, rotas: List):
+        self.app = app
+        self.rotas = rotas
+
+    def _rota(self, scope) -> str:
+        # Como o roteador do Starlette: a primeira correspondência completa vence; a parcial
+        # (caminho certo, método errado) só conta se nenhuma rota aceitar o método
+        parcial = None
+        for rota in self.rotas:
+            correspondencia, _ = rota.matches(scope)
+            if correspondencia == Match.FULL:
+                return rota.path
+            if correspondencia == Match.PARTIAL and parcial is None:
+                parcial = rota.path
+        return parcial or "desconhecida"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metodo = scope["method"]
+        rota = self._rota(scope)
+        requisicao = ConsultasRequisicao(rota)
+        token = requisicao_atual.set(requisicao)
+        status_code = 500
+
+        async def enviar(mensagem):
+            nonlocal status_code
+            if mensagem["type"] == "http.response.start":
+                status_code = mensagem["status"]
+                if DB_CONSULTAS_DEV:
+                    # Consultas até o início da resposta (streams podem fazer mais depois)
+                    cabecalhos = list(mensagem.get("headers", []))
+                    cabecalhos.append((b"x-consultas-sql", str(requisicao.quantidade).encode()))
+                    if requisicao.orcamento is not None:
+                        cabecalhos.append((b"x-orcamento-consultas", str(requisicao.orcamento).encode()))
+                    mensagem = {**mensagem, "headers": cabecalhos}
+            await send(mensagem)
+
+        requisicoes_em_andamento.inc(metodo, rota)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            requisicoes_duracao.observar(time.perf_counter() - inicio, metodo, rota, status_code)
+            requisicoes_em_andamento.dec(metodo, rota)
+            consultas_por_requisicao.observar(requisicao.quantidade, rota)
+            tempo_consultas_requisicao.observar(requisicao.tempo, rota)
+            if requisicao.excedeu():
+                orcamentos_excedidos.inc(rota)
+                logger.warning("Orçamento de consultas excedido: %s", requisicao.resumo())
+            requisicao_atual.reset(token)
+
+@registro.coletor
+def _metricas_pool() -> List[str]:
+    linhas = [
+        "# HELP db_pool_conexoes Conexões do pool por estado",
+        "# TYPE db_pool_conexoes gauge",
+    ]
+    espera = [
+        "# HELP db_pool_espera_segundos Espera por uma conexão livre no checkout",
+        "# TYPE db_pool_espera_segundos histogram",
+    ]
+    timeouts = [
+        "# HELP db_pool_timeouts_total Checkouts que estouraram DB_POOL_TIMEOUT",
+        "# TYPE db_pool_timeouts_total counter",
+    ]
+    for nome, classe, pool in (
+        ("sync", PoolInstrumentado, engine.pool),
+        ("async", AsyncPoolInstrumentado, async_engine.sync_engine.pool),
+    ):
+        stats = classe.stats.snapshot(pool)
+        for estado in ("em_uso", "livres", "overflow"):
+            linhas.append(f'db_pool_conexoes{{engine="{nome}",estado="{estado}"}} {stats[estado]}')
+        espera += linhas_histograma(
+            "db_pool_espera_segundos", ("engine",), (nome,), classe.stats.BUCKETS,
+            classe.stats.contagem_buckets, stats["espera_total_segundos"]
+        )
+        timeouts.append(f'db_pool_timeouts_total{{engine="{nome}"}} {stats["timeouts"]}')
+    return linhas + espera + timeouts
+
+@registro.coletor
+def _metricas_whatsapp() -> List[str]:
+    return [
+        "# HELP whatsapp_envio_duracao_segundos Latência dos envios à Evolution API",
+        "# TYPE whatsapp_envio_duracao_segundos histogram",
+        *linhas_histograma(
+            "whatsapp_envio_duracao_segundos", (), (), metricas_whatsapp.BUCKETS,
+            metricas_whatsapp.latencia_buckets, metricas_whatsapp.latencia_total
+        ),
+        "# HELP whatsapp_envios_erros_total Envios à Evolution API que falharam",
+        "# TYPE whatsapp_envios_erros_total counter",
+        f"whatsapp_envios_erros_total {metricas_whatsapp.erros}",
+        "# HELP whatsapp_rejeitados_circuito_total Envios barrados pelo circuit breaker",
+        "# TYPE whatsapp_rejeitados_circuito_total counter",
+        f"whatsapp_rejeitados_circuito_total {metricas_whatsapp.rejeitados_circuito}",
+    ]
+
+@registro.coletor
+def _metricas_admissao() -> List[str]:
+    stats = controle_admissao.stats()
+    linhas = [
+        "# HELP admissao_rejeicoes_total Requisições recusadas pelo controle de admissão",
+        "# TYPE admissao_rejeicoes_total counter",
+    ]
+    for (classe, motivo), total in controle_admissao.rejeicoes.items():
+        linhas.append(f'admissao_rejeicoes_total{{classe="{classe}",motivo="{motivo}"}} {total}')
+    linhas += [
+        "# HELP admissao_aguardando Requisições na fila por uma vaga de concorrência",
+        "# TYPE admissao_aguardando gauge",
+        f"admissao_aguardando {stats['aguardando']}",
+    ]
+    return linhas
+
+@registro.coletor
+def _metricas_eventos() -> List[str]:
+    return [
+        "# HELP sse_conexoes Clientes conectados ao feed de pedidos",
+        "# TYPE sse_conexoes gauge",
+        f"sse_conexoes {barramento_pedidos.conexoes}",
+        "# HELP sse_desconectados_por_atraso_total Clientes desconectados por ficarem para trás",
+        "# TYPE sse_desconectados_por_atraso_total counter",
+        f"sse_desconectados_por_atraso_total {barramento_pedidos.desconectados_por_atraso}",
+    ]
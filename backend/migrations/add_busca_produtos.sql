@@ -0,0 +1,31 @@
+-- Busca de produtos: texto completo em português sem acentos + trigramas para erros de digitação
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Permite colocar empresa_id no mesmo índice GIN (uma busca por loja usa um único índice)
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portugues_sem_acento') THEN
+        CREATE TEXT SEARCH CONFIGURATION portugues_sem_acento (COPY = portuguese);
+        ALTER TEXT SEARCH CONFIGURATION portugues_sem_acento
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+    END IF;
+END
+$$;
+
+-- unaccent() não é IMMUTABLE; esta versão com dicionário fixo pode ser indexada
+CREATE OR REPLACE FUNCTION normalizar_busca(texto text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, texto)) $$;
+
+-- As expressões precisam ser idênticas às de backend/busca.py
+CREATE INDEX IF NOT EXISTS ix_produtos_busca_texto ON produtos USING gin (
+    empresa_id,
+    (setweight(to_tsvector('portugues_sem_acento'::regconfig, coalesce(nome, '')), 'A') ||
+     setweight(to_tsvector('portugues_sem_acento'::regconfig, coalesce(descricao, '')), 'B'))
+);
+CREATE INDEX IF NOT EXISTS ix_produtos_busca_nome_trgm ON produtos USING gin (
+    empresa_id,
+    normalizar_busca(nome) gin_trgm_ops
+);
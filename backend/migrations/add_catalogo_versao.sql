@@ -0,0 +1,5 @@
+-- Colunas usadas pelo catálogo da vitrine e índice da listagem paginada
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE;
+ALTER TABLE produtos ADD COLUMN IF NOT EXISTS imagem_url VARCHAR;
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS catalogo_versao INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS ix_produtos_empresa_ativo_nome_id ON produtos (empresa_id, ativo, nome, id);
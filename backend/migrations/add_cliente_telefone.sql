@@ -0,0 +1,2 @@
+-- Telefone do cliente para as notificações de WhatsApp do pedido
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cliente_telefone VARCHAR;
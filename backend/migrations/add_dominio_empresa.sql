@@ -0,0 +1,5 @@
+-- Domínio próprio da empresa e status do certificado SSL
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS dominio VARCHAR;
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS ssl_status VARCHAR;
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS ssl_ultima_atualizacao TIMESTAMP;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_empresas_dominio ON empresas (dominio);
@@ -0,0 +1,3 @@
+-- Estoque dos produtos e usuário que fez o pedido
+ALTER TABLE produtos ADD COLUMN IF NOT EXISTS quantidade_estoque INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS usuario_id INTEGER REFERENCES users(id);
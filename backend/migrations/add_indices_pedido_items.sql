@@ -0,0 +1,3 @@
+-- Índices usados pelas análises de produtos (join com pedidos e pares de itens)
+CREATE INDEX IF NOT EXISTS ix_pedido_items_pedido_id ON pedido_items (pedido_id);
+CREATE INDEX IF NOT EXISTS ix_pedido_items_produto_id ON pedido_items (produto_id);
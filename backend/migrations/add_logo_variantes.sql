@@ -0,0 +1,2 @@
+-- Variantes redimensionadas da logo (WebP/JPEG por largura)
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS logo_variantes JSON;
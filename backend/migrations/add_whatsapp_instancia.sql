@@ -0,0 +1,3 @@
+-- Instância da Evolution API de cada empresa
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS whatsapp_instancia VARCHAR;
+ALTER TABLE empresas ADD COLUMN IF NOT EXISTS whatsapp_api_key VARCHAR;
@@ -1,5 +1,5 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, DateTime, Enum, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Date, DateTime, Enum, Float, Index, JSON, true
+from sqlalchemy.orm import relationship, synonym
 from database import Base
 import enum
 from datetime import datetime
@@ -12,6 +12,11 @@ class StatusPedido(str, enum.Enum):
     ENTREGUE = "ENTREGUE"
     CANCELADO = "CANCELADO"
 
+class StatusNotificacao(str, enum.Enum):
+    PENDENTE = "PENDENTE"
+    ENVIADA = "ENVIADA"
+    FALHA = "FALHA"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -20,6 +25,7 @@ class User(Base):
     full_name = Column(String)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    is_admin = Column(Boolean, default=False)
     empresas = relationship("Empresa", back_populates="usuario")
 
 class Empresa(Base):
@@ -28,6 +34,9 @@ class Empresa(Base):
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String, index=True)
     slug = Column(String, unique=True, index=True)
+    dominio = Column(String, unique=True, index=True, nullable=True)
+    ssl_status = Column(String, nullable=True)
+    ssl_ultima_atualizacao = Column(DateTime, nullable=True)
     cnpj = Column(String, unique=True)
     endereco = Column(String)
     cidade = Column(String)
@@ -35,6 +44,12 @@ class Empresa(Base):
     cep = Column(String)
     telefone = Column(String)
     logo_url = Column(String, nullable=True)
+    # {largura: {"webp": url, "jpeg": url}} gerado no upload da logo
+    logo_variantes = Column(JSON, nullable=True)
+    whatsapp_instancia = Column(String, nullable=True)
+    whatsapp_api_key = Column(String, nullable=True)
+    # Incrementada a cada mudança no catálogo (produtos ou estoque); vira o ETag da vitrine
+    catalogo_versao = Column(Integer, default=0, nullable=False)
     usuario_id = Column(Integer, ForeignKey("users.id"))
     usuario = relationship("User", back_populates="empresas")
     produtos = relationship("Produto", back_populates="empresa")
@@ -44,11 +59,20 @@ class Empresa(Base):
 
 class Produto(Base):
     __tablename__ = "produtos"
+    __table_args__ = (
+        # Listagem paginada da vitrine: empresa, ativos, ordenados por nome/id
+        Index("ix_produtos_empresa_ativo_nome_id", "empresa_id", "ativo", "nome", "id"),
+        # SKU único por empresa (chave do upsert na importação); vários NULL são permitidos
+        Index("ix_produtos_empresa_sku", "empresa_id", "sku", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    sku = Column(String, nullable=True)
     nome = Column(String, index=True)
     descricao = Column(String)
     preco = Column(Float)
+    quantidade_estoque = Column(Integer, nullable=False, default=0)
+    imagem_url = Column(String, nullable=True)
     empresa_id = Column(Integer, ForeignKey("empresas.id"))
     empresa = relationship("Empresa", back_populates="produtos")
     pedido_items = relationship("ItemPedido", back_populates="produto")
@@ -58,13 +82,23 @@ class Produto(Base):
 
 class Pedido(Base):
     __tablename__ = "pedidos"
+    __table_args__ = (
+        # Listagem por empresa paginada por (data_criacao, id), com ou sem filtro de status
+        Index("ix_pedidos_empresa_data_id", "empresa_id", "data_criacao", "id"),
+        Index("ix_pedidos_empresa_status_data_id", "empresa_id", "status", "data_criacao", "id"),
+        # "Meus pedidos" de clientes
+        Index("ix_pedidos_usuario_data_id", "usuario_id", "data_criacao", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     status = Column(Enum(StatusPedido), default=StatusPedido.PENDENTE)
     data_criacao = Column(DateTime, default=datetime.utcnow)
     empresa_id = Column(Integer, ForeignKey("empresas.id"))
+    usuario_id = Column(Integer, ForeignKey("users.id"))
+    cliente_telefone = Column(String, nullable=True)
     empresa = relationship("Empresa", back_populates="pedidos")
     items = relationship("ItemPedido", back_populates="pedido")
+    itens = synonym("items")
     valor_total = Column(Float, default=0.0)
 
 class ItemPedido(Base):
@@ -73,7 +107,74 @@ class ItemPedido(Base):
     id = Column(Integer, primary_key=True, index=True)
     quantidade = Column(Integer)
     preco_unitario = Column(Float)
-    pedido_id = Column(Integer, ForeignKey("pedidos.id"))
-    produto_id = Column(Integer, ForeignKey("produtos.id"))
+    pedido_id = Column(Integer, ForeignKey("pedidos.id"), index=True)
+    produto_id = Column(Integer, ForeignKey("produtos.id"), index=True)
     pedido = relationship("Pedido", back_populates="items")
     produto = relationship("Produto", back_populates="pedido_items")
+
+class NotificacaoWhatsApp(Base):
+    """Outbox de mensagens de WhatsApp, gravado na mesma transação do pedido"""
+    __tablename__ = "notificacoes_whatsapp"
+    __table_args__ = (
+        Index("ix_notificacoes_whatsapp_fila", "status", "proxima_tentativa"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id"))
+    pedido_id = Column(Integer, ForeignKey("pedidos.id"), nullable=True)
+    numero = Column(String, nullable=False)
+    mensagem = Column(String, nullable=False)
+    status = Column(Enum(StatusNotificacao), default=StatusNotificacao.PENDENTE, nullable=False)
+    tentativas = Column(Integer, default=0, nullable=False)
+    proxima_tentativa = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ultimo_erro = Column(String, nullable=True)
+    data_criacao = Column(DateTime, default=datetime.utcnow)
+    data_envio = Column(DateTime, nullable=True)
+
+class VendaDiaria(Base):
+    """Resumo de vendas por empresa e dia, mantido a cada pedido e mudança de status"""
+    __tablename__ = "vendas_diarias"
+    __table_args__ = (
+        # Dias à espera da atualização da análise de produtos
+        Index("ix_vendas_diarias_analise_pendente", "data", postgresql_where="analise_pendente"),
+    )
+
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), primary_key=True)
+    data = Column(Date, primary_key=True)
+    total_pedidos = Column(Integer, default=0, nullable=False)
+    valor_total = Column(Float, default=0.0, nullable=False)
+    cancelamentos = Column(Integer, default=0, nullable=False)
+    valor_cancelado = Column(Float, default=0.0, nullable=False)
+    # O dia mudou desde a última atualização de vendas_produtos_diarias/pares_produtos_diarios
+    analise_pendente = Column(Boolean, default=True, server_default=true(), nullable=False)
+
+class VendaProdutoDiaria(Base):
+    """Vendas por produto e dia (sem cancelados), recalculadas em background para a análise de produtos"""
+    __tablename__ = "vendas_produtos_diarias"
+
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), primary_key=True)
+    data = Column(Date, primary_key=True)
+    produto_id = Column(Integer, primary_key=True)
+    quantidade = Column(Integer, default=0, nullable=False)
+    receita = Column(Float, default=0.0, nullable=False)
+
+class ParProdutosDiario(Base):
+    """Pedidos do dia com os dois produtos (produto_a < produto_b), recalculados em background"""
+    __tablename__ = "pares_produtos_diarios"
+
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), primary_key=True)
+    data = Column(Date, primary_key=True)
+    produto_a = Column(Integer, primary_key=True)
+    produto_b = Column(Integer, primary_key=True)
+    pedidos = Column(Integer, default=0, nullable=False)
+
+class ChaveIdempotencia(Base):
+    """Resposta de uma requisição com Idempotency-Key, gravada na mesma transação do que ela criou"""
+    __tablename__ = "chaves_idempotencia"
+
+    usuario_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    chave = Column(String(255), primary_key=True)
+    hash_requisicao = Column(String(64), nullable=False)
+    resposta = Column(JSON)
+    data_criacao = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expira_em = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import NotificacaoWhatsApp, StatusNotificacao
+from whatsapp import EVOLUTION_TIMEOUT, ClientesWhatsApp, CircuitoAbertoError, clientes_whatsapp
+from metricas import registrar_tarefa
+
+load_dotenv()
+
+logger = logging.getLogger("notificacoes")
+
+# Configurações do worker do outbox
+OUTBOX_HABILITADO = os.getenv("WHATSAPP_OUTBOX_HABILITADO", "true").lower() == "true"
+OUTBOX_INTERVALO = float(os.getenv("WHATSAPP_OUTBOX_INTERVALO", "1"))
+OUTBOX_LOTE = int(os.getenv("WHATSAPP_OUTBOX_LOTE", "50"))
+OUTBOX_MAX_TENTATIVAS = int(os.getenv("WHATSAPP_OUTBOX_MAX_TENTATIVAS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("WHATSAPP_OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("WHATSAPP_OUTBOX_BACKOFF_MAX", "3600"))
+# Tempo que uma mensagem reservada fica invisível para outros workers
+OUTBOX_LEASE = float(os.getenv("WHATSAPP_OUTBOX_LEASE", "60"))
+# Limite de mensagens por segundo por instância da Evolution API (somando todos os workers)
+WHATSAPP_MENSAGENS_POR_SEGUNDO = float(os.getenv("WHATSAPP_MENSAGENS_POR_SEGUNDO", "5"))
+# Processos do servidor (a mesma variável que uvicorn/gunicorn leem para --workers);
+# cada um roda seu OutboxWorker e fica com uma fração do limite
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+def enfileirar_notificacao(
+    db: AsyncSession,
+    empresa_id: int,
+    numero: Optional[str],
+    mensagem: str,
+    pedido_id: Optional[int] = None
+) -> Optional[NotificacaoWhatsApp]:
+    """Grava a mensagem no outbox; ela só existe se a transação do chamador fizer commit"""
+    if not numero:
+        return None
+    notificacao = NotificacaoWhatsApp(
+        empresa_id=empresa_id,
+        pedido_id=pedido_id,
+        numero=numero,
+        mensagem=mensagem
+    )
+    db.add(notificacao)
+    return notificacao
+
+def calcular_tamanho_lote(taxa: float) -> int:
+    """Maior lote que sai dentro do lease: n mensagens esperam ~n/taxa segundos no limitador,
+    mais o timeout do último envio; metade do lease fica de folga"""
+    segundos = (OUTBOX_LEASE - EVOLUTION_TIMEOUT) / 2
+    return max(1, min(OUTBOX_LOTE, int(segundos * taxa)))
+
+def calcular_backoff(tentativas: int) -> float:
+    """Espera exponencial com jitter antes da próxima tentativa"""
+    espera = min(OUTBOX_BACKOFF_BASE * (2 ** (tentativas - 1)), OUTBOX_BACKOFF_MAX)
+    return espera * random.uniform(0.5, 1.0)
+
+class LimitadorTaxa:
+    """Token bucket por instância da Evolution API, local ao worker"""
+
+    def __init__(self, taxa: float, capacidade: Optional[float] = None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(taxa, 1.0)
+        self._baldes: Dict[str, List[float]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def aguardar(self, chave: str):
+        lock = self._locks.setdefault(chave, asyncio.Lock())
+        async with lock:
+            tokens, ultimo = self._baldes.get(chave, [self.capacidade, time.monotonic()])
+            while True:
+                agora = time.monotonic()
+                tokens = min(self.capacidade, tokens + (agora - ultimo) * self.taxa)
+                ultimo = agora
+                if tokens >= 1:
+                    self._baldes[chave] = [tokens - 1, ultimo]
+                    return
+                await asyncio.sleep((1 - tokens) / self.taxa)
+
+class OutboxWorker:
+    """Esvazia o outbox de WhatsApp em background, com retry e dead-letter"""
+
+    def __init__(self, clientes: Optional[ClientesWhatsApp] = None, session_factory=AsyncSessionLocal):
+        self.clientes = clientes or clientes_whatsapp
+        self.session_factory = session_factory
+        taxa = WHATSAPP_MENSAGENS_POR_SEGUNDO / WEB_CONCURRENCY
+        self.limitador = LimitadorTaxa(taxa)
+        # Com o lease vencido no meio do lote, outro worker reservaria as mesmas mensagens e as reenviaria
+        self.tamanho_lote = calcular_tamanho_lote(taxa)
+        self._task: Optional[asyncio.Task] = None
+
+    async def reservar_lote(self) -> List[NotificacaoWhatsApp]:
+        """Reserva mensagens pendentes; SKIP LOCKED permite vários workers em paralelo"""
+        async with self.session_factory() as db:
+            agora = datetime.utcnow()
+            result = await db.execute(
+                select(NotificacaoWhatsApp)
+                .where(NotificacaoWhatsApp.status == StatusNotificacao.PENDENTE)
+                .where(NotificacaoWhatsApp.proxima_tentativa <= agora)
+                .order_by(NotificacaoWhatsApp.proxima_tentativa)
+                .limit(self.tamanho_lote)
+                .with_for_update(skip_locked=True)
+            )
+            notificacoes = result.scalars().all()
+            # Se o worker cair no meio do envio, a mensagem volta para a fila após o lease
+            for notificacao in notificacoes:
+                notificacao.tentativas += 1
+                notificacao.proxima_tentativa = agora + timedelta(seconds=OUTBOX_LEASE)
+            await db.commit()
+            return notificacoes
+
+    async def _enviar(self, notificacao: NotificacaoWhatsApp):
+        """Envia uma mensagem; retorna None em caso de sucesso ou a exceção"""
+        try:
+            cliente = await self.clientes.obter(notificacao.empresa_id)
+            await self.limitador.aguardar(cliente.instance or "padrao")
+            await cliente.enviar_mensagem(notificacao.numero, notificacao.mensagem)
+            return None
+        except Exception as e:
+            return e
+
+    async def processar_lote(self) -> int:
+        notificacoes = await self.reservar_lote()
+        if not notificacoes:
+            return 0
+
+        erros = await asyncio.gather(*(self._enviar(n) for n in notificacoes))
+        await self.registrar_resultados(notificacoes, erros)
+        return len(notificacoes)
+
+    async def registrar_resultados(self, notificacoes: List[NotificacaoWhatsApp], erros: List[Optional[Exception]]):
+        """Grava o resultado de cada envio, só se a reserva ainda for deste worker"""
+        async with self.session_factory() as db:
+            agora = datetime.utcnow()
+            for notificacao, erro in zip(notificacoes, erros):
+                if erro is None:
+                    valores = {"status": StatusNotificacao.ENVIADA, "data_envio": agora, "ultimo_erro": None}
+                elif isinstance(erro, CircuitoAbertoError):
+                    # Não chegou a tentar: devolve a tentativa e espera o circuito reabrir
+                    valores = {
+                        "tentativas": notificacao.tentativas - 1,
+                        "proxima_tentativa": agora + timedelta(seconds=erro.reabre_em),
+                        "ultimo_erro": str(erro),
+                    }
+                elif notificacao.tentativas >= OUTBOX_MAX_TENTATIVAS:
+                    logger.warning("Notificação %s movida para dead-letter: %s", notificacao.id, erro)
+                    valores = {"status": StatusNotificacao.FALHA, "ultimo_erro": f"{type(erro).__name__}: {erro}"}
+                else:
+                    valores = {
+                        "proxima_tentativa": agora + timedelta(seconds=calcular_backoff(notificacao.tentativas)),
+                        "ultimo_erro": f"{type(erro).__name__}: {erro}",
+                    }
+                # tentativas e proxima_tentativa gravadas na reserva identificam o lease: se ele venceu e
+                # outro worker reservou a mensagem, o resultado dele prevalece
+                result = await db.execute(
+                    update(NotificacaoWhatsApp)
+                    .where(NotificacaoWhatsApp.id == notificacao.id)
+                    .where(NotificacaoWhatsApp.status == StatusNotificacao.PENDENTE)
+                    .where(NotificacaoWhatsApp.tentativas == notificacao.tentativas)
+                    .where(NotificacaoWhatsApp.proxima_tentativa == notificacao.proxima_tentativa)
+                    .values(**valores)
+                )
+                if result.rowcount == 0:
+                    logger.warning("Lease da notificação %s venceu antes do fim do envio", notificacao.id)
+            await db.commit()
+
+    async def executar(self):
+        while True:
+            inicio = time.perf_counter()
+            try:
+                processadas = await self.processar_lote()
+                # Só lotes com mensagens: as consultas vazias a cada intervalo não dizem nada
+                if processadas:
+                    registrar_tarefa("whatsapp_outbox", time.perf_counter() - inicio)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                registrar_tarefa("whatsapp_outbox", time.perf_counter() - inicio, "erro")
+                logger.error("Erro no worker de notificações: %s", e)
+                processadas = 0
+            # Lote cheio: provavelmente há mais mensagens, continua sem esperar
+            if processadas < self.tamanho_lote:
+                await asyncio.sleep(OUTBOX_INTERVALO)
+
+    def iniciar(self):
+        if OUTBOX_HABILITADO and self._task is None:
+            self._task = asyncio.create_task(self.executar())
+
+    async def parar(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import sys
 import os
@@ -9,27 +10,29 @@ from jose import jwt
 # Adiciona o diretório pai ao PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import get_db
+from database import get_async_db
 from schemas import UserCreate, User, UserLogin
 from models import User as UserModel
-from auth import get_password_hash, authenticate_user, create_access_token, get_current_user
+from auth import get_password_hash_async, authenticate_user, create_access_token, get_current_user
 
 router = APIRouter(tags=["auth"])
 
 ACCESS_TOKEN_EXPIRE_DAYS = 7  # Token expira em 7 dias
 
 @router.post("/register", response_model=User)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Verifica se já existe um usuário com este email
-    db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
+    result = await db.execute(select(UserModel).where(UserModel.email == user.email))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já cadastrado"
         )
     
-    # Cria o novo usuário
-    hashed_password = get_password_hash(user.password)
+    # Cria o novo usuário (sem segurar a conexão do banco durante o hash)
+    await db.commit()
+    hashed_password = await get_password_hash_async(user.password)
     db_user = UserModel(
         email=user.email,
         hashed_password=hashed_password,
@@ -38,19 +41,19 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
     
     try:
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao criar usuário"
         )
 
 @router.post("/login")
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, user_data.email, user_data.password)
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
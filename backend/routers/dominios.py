@@ -1,21 +1,43 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, List
 import sys
 import os
 import dns.resolver
 import subprocess
 import asyncio
+import time
 from datetime import datetime
 
 # Adiciona o diretório pai ao PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import get_db
+from database import get_async_db
 from auth import get_current_user
-from models import StatusPedido
+from models import Empresa as EmpresaModel
+from metricas import registrar_tarefa
 
-router = APIRouter(prefix="/dominios", tags=["dominios"])
+router = APIRouter()
+
+async def _empresa_do_dominio(db: AsyncSession, dominio: str, current_user) -> EmpresaModel:
+    """Empresa do domínio, se for do usuário.
+
+    Consulta o banco: o índice de tenants de cada worker pode estar até um
+    intervalo de recarga atrasado e não serve para decidir permissão.
+    """
+    result = await db.execute(
+        select(EmpresaModel)
+        .where(EmpresaModel.dominio == dominio.lower())
+        .where(EmpresaModel.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
+    if empresa is None:
+        raise HTTPException(
+            status_code=403,
+            detail="Domínio não pertence ao usuário"
+        )
+    return empresa
 
 async def verificar_dns(dominio: str, ip_servidor: str) -> Dict:
     """Verifica se o domínio está apontando corretamente para o servidor"""
@@ -44,6 +66,8 @@ async def verificar_dns(dominio: str, ip_servidor: str) -> Dict:
 
 async def gerar_ssl_background(dominio: str, email_admin: str):
     """Executa a geração do SSL em background"""
+    inicio = time.perf_counter()
+    resultado = "ok"
     try:
         # Caminho para o script
         script_path = os.path.join(os.getcwd(), 'scripts', 'ssl-cert-manager.sh')
@@ -67,13 +91,16 @@ async def gerar_ssl_background(dominio: str, email_admin: str):
         # Implementar atualização no banco aqui
         
     except Exception as e:
+        resultado = "erro"
         print(f"Erro ao gerar SSL para {dominio}: {str(e)}")
         # Implementar log de erro aqui
+    finally:
+        registrar_tarefa("gerar_ssl", time.perf_counter() - inicio, resultado)
 
 @router.post("/verificar")
 async def verificar_dominio(
     dominio: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Verifica se um domínio está configurado corretamente"""
@@ -87,16 +114,7 @@ async def verificar_dominio(
         )
     
     # Verifica se o domínio pertence ao usuário
-    empresa = db.query(EmpresaModel).filter(
-        EmpresaModel.usuario_id == current_user.id,
-        EmpresaModel.dominio == dominio
-    ).first()
-    
-    if not empresa:
-        raise HTTPException(
-            status_code=403,
-            detail="Domínio não pertence ao usuário"
-        )
+    await _empresa_do_dominio(db, dominio, current_user)
     
     # Verifica DNS
     resultado = await verificar_dns(dominio, IP_SERVIDOR)
@@ -107,21 +125,12 @@ async def verificar_dominio(
 async def gerar_ssl(
     dominio: str,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Inicia o processo de geração de SSL para um domínio"""
     # Verifica se o domínio pertence ao usuário
-    empresa = db.query(EmpresaModel).filter(
-        EmpresaModel.usuario_id == current_user.id,
-        EmpresaModel.dominio == dominio
-    ).first()
-    
-    if not empresa:
-        raise HTTPException(
-            status_code=403,
-            detail="Domínio não pertence ao usuário"
-        )
+    empresa = await _empresa_do_dominio(db, dominio, current_user)
     
     # Verifica DNS primeiro
     resultado_dns = await verificar_dns(dominio, os.getenv("SERVER_IP"))
@@ -139,7 +148,7 @@ async def gerar_ssl(
     # Atualiza status na empresa
     empresa.ssl_status = "gerando"
     empresa.ssl_ultima_atualizacao = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {
         "status": "ok",
@@ -150,20 +159,11 @@ async def gerar_ssl(
 @router.get("/status-ssl/{dominio}")
 async def status_ssl(
     dominio: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Retorna o status atual do SSL de um domínio"""
-    empresa = db.query(EmpresaModel).filter(
-        EmpresaModel.usuario_id == current_user.id,
-        EmpresaModel.dominio == dominio
-    ).first()
-    
-    if not empresa:
-        raise HTTPException(
-            status_code=403,
-            detail="Domínio não pertence ao usuário"
-        )
+    empresa = await _empresa_do_dominio(db, dominio, current_user)
     
     return {
         "status": empresa.ssl_status,
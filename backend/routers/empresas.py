@@ -1,28 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from database import get_db
+from database import get_async_db
 import models
 import schemas
 from .auth import get_current_user
+from auth import Principal, principal_cache
+from whatsapp import clientes_whatsapp
+from tenants import indice_tenants
+from imagens import processar_imagem, remover_variantes, url_padrao
+from metricas import orcamento_consultas
 import os
-import shutil
 from pathlib import Path
 
 router = APIRouter()
 
+# Orçamento de consultas SQL da listagem (2 delas são da autenticação sem cache)
+ORCAMENTO_LISTAR_EMPRESAS = 3
+
 # Criar diretório para logos se não existir
 UPLOAD_DIR = Path("uploads/logos")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# O corpo do upload é lido pela própria rota (limite de tamanho enquanto chega); isto só documenta o campo
+CORPO_LOGO_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["logo"],
+            "properties": {"logo": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
 @router.post("/", response_model=schemas.Empresa)
-def create_empresa(
+async def create_empresa(
     empresa: schemas.EmpresaCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     # Verifica se o CNPJ já existe
-    db_empresa = db.query(models.Empresa).filter(models.Empresa.cnpj == empresa.cnpj).first()
+    result = await db.execute(select(models.Empresa).where(models.Empresa.cnpj == empresa.cnpj))
+    db_empresa = result.scalars().first()
     if db_empresa:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,47 +51,63 @@ def create_empresa(
         )
 
     # Verifica se o slug já existe
-    db_empresa = db.query(models.Empresa).filter(models.Empresa.slug == empresa.slug).first()
+    result = await db.execute(select(models.Empresa).where(models.Empresa.slug == empresa.slug))
+    db_empresa = result.scalars().first()
     if db_empresa:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Slug já está em uso"
         )
 
+    # Verifica se o domínio já existe
+    if empresa.dominio:
+        result = await db.execute(select(models.Empresa).where(models.Empresa.dominio == empresa.dominio))
+        if result.scalars().first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Domínio já está em uso"
+            )
+
     # Cria a empresa vinculada ao usuário atual
     db_empresa = models.Empresa(
         **empresa.model_dump(),
         usuario_id=current_user.id
     )
     db.add(db_empresa)
-    db.commit()
-    db.refresh(db_empresa)
+    await db.commit()
+    await db.refresh(db_empresa)
+    principal_cache.invalidar(usuario_id=current_user.id)
+    indice_tenants.atualizar(db_empresa)
     return db_empresa
 
-@router.get("/", response_model=List[schemas.Empresa])
-def read_empresas(
+@router.get("/", response_model=List[schemas.Empresa], dependencies=[Depends(orcamento_consultas(ORCAMENTO_LISTAR_EMPRESAS))])
+async def read_empresas(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    empresas = db.query(models.Empresa)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.usuario_id == current_user.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    empresas = result.scalars().all()
     return empresas
 
 @router.get("/{empresa_id}", response_model=schemas.Empresa)
-def read_empresa(
+async def read_empresa(
     empresa_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.id == empresa_id)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
     if not empresa:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -79,17 +116,19 @@ def read_empresa(
     return empresa
 
 @router.put("/{empresa_id}", response_model=schemas.Empresa)
-def update_empresa(
+async def update_empresa(
     empresa_id: int,
     empresa: schemas.EmpresaCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     # Busca a empresa existente
-    db_empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.id == empresa_id)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    db_empresa = result.scalars().first()
     
     if not db_empresa:
         raise HTTPException(
@@ -98,10 +137,12 @@ def update_empresa(
         )
 
     # Verifica se o CNPJ já existe (exceto para a própria empresa)
-    cnpj_exists = db.query(models.Empresa)\
-        .filter(models.Empresa.cnpj == empresa.cnpj)\
-        .filter(models.Empresa.id != empresa_id)\
-        .first()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.cnpj == empresa.cnpj)
+        .where(models.Empresa.id != empresa_id)
+    )
+    cnpj_exists = result.scalars().first()
     if cnpj_exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -109,81 +150,166 @@ def update_empresa(
         )
 
     # Verifica se o slug já existe (exceto para a própria empresa)
-    slug_exists = db.query(models.Empresa)\
-        .filter(models.Empresa.slug == empresa.slug)\
-        .filter(models.Empresa.id != empresa_id)\
-        .first()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.slug == empresa.slug)
+        .where(models.Empresa.id != empresa_id)
+    )
+    slug_exists = result.scalars().first()
     if slug_exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Slug já está em uso"
         )
 
+    # Verifica se o domínio já existe (exceto para a própria empresa)
+    if empresa.dominio:
+        result = await db.execute(
+            select(models.Empresa)
+            .where(models.Empresa.dominio == empresa.dominio)
+            .where(models.Empresa.id != empresa_id)
+        )
+        if result.scalars().first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Domínio já está em uso"
+            )
+
     # Atualiza os campos da empresa
     for field, value in empresa.model_dump().items():
         setattr(db_empresa, field, value)
 
-    db.commit()
-    db.refresh(db_empresa)
+    await db.commit()
+    await db.refresh(db_empresa)
+    principal_cache.invalidar(usuario_id=current_user.id)
+    indice_tenants.atualizar(db_empresa)
     return db_empresa
 
-@router.post("/{empresa_id}/logo")
-async def upload_logo(
+def _whatsapp(empresa: models.Empresa) -> schemas.EmpresaWhatsApp:
+    return schemas.EmpresaWhatsApp(
+        instancia=empresa.whatsapp_instancia,
+        api_key_configurada=bool(empresa.whatsapp_api_key)
+    )
+
+@router.get("/{empresa_id}/whatsapp", response_model=schemas.EmpresaWhatsApp)
+async def read_empresa_whatsapp(
     empresa_id: int,
-    logo: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    # Verifica se a empresa existe e pertence ao usuário
-    empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.id == empresa_id)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
-    
+    """Instância da Evolution API usada pela empresa; a chave não é devolvida"""
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
+    if not empresa:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Empresa não encontrada"
+        )
+    return _whatsapp(empresa)
+
+@router.put("/{empresa_id}/whatsapp", response_model=schemas.EmpresaWhatsApp)
+async def update_empresa_whatsapp(
+    empresa_id: int,
+    dados: schemas.EmpresaWhatsAppUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Instância e chave próprias da Evolution API; instancia null volta para a instância global.
+
+    Os outros workers usam as novas credenciais quando o cache deles vence
+    (EVOLUTION_CREDENCIAIS_TTL).
+    """
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
     if not empresa:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empresa não encontrada"
         )
+
+    empresa.whatsapp_instancia = dados.instancia
+    if "api_key" in dados.model_fields_set:
+        empresa.whatsapp_api_key = dados.api_key
+    # Sem instância própria a chave não é usada: não fica guardada
+    if empresa.whatsapp_instancia is None:
+        empresa.whatsapp_api_key = None
+    await db.commit()
+    clientes_whatsapp.invalidar(empresa_id)
+    return _whatsapp(empresa)
+
+@router.post("/{empresa_id}/logo", openapi_extra=CORPO_LOGO_OPENAPI)
+async def upload_logo(
+    empresa_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    # Verifica se a empresa existe e pertence ao usuário
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
     
-    # Verifica se o arquivo é uma imagem
-    if not logo.content_type.startswith("image/"):
+    if not empresa:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Arquivo deve ser uma imagem"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Empresa não encontrada"
         )
     
-    # Cria o nome do arquivo usando o slug da empresa
-    file_extension = logo.filename.split(".")[-1]
-    logo_filename = f"{empresa.slug}.{file_extension}"
-    logo_path = UPLOAD_DIR / logo_filename
+    # Devolve a conexão ao pool enquanto a imagem é recebida e processada
+    await db.commit()
     
-    # Salva o arquivo
-    with logo_path.open("wb") as buffer:
-        shutil.copyfileobj(logo.file, buffer)
+    # Recebe o campo "logo" em blocos (recusa com 413 acima do limite, e 400 se não
+    # for imagem) e gera as variantes fora do event loop (nomes pelo hash do conteúdo)
+    diretorio = UPLOAD_DIR / str(empresa.id)
+    variantes = await processar_imagem(request, "logo", diretorio, f"/uploads/logos/{empresa.id}")
     
-    # Atualiza o caminho da logo no banco
-    empresa.logo_url = f"/uploads/logos/{logo_filename}"
-    db.commit()
+    # Atualiza as URLs da logo no banco
+    variantes_antigas = empresa.logo_variantes
+    empresa.logo_variantes = variantes
+    empresa.logo_url = url_padrao(variantes)
+    await db.commit()
+    indice_tenants.atualizar(empresa)
+    if variantes_antigas:
+        remover_variantes(variantes_antigas, diretorio, manter=variantes)
     
-    return {"message": "Logo atualizada com sucesso", "logo_url": empresa.logo_url}
+    return {
+        "message": "Logo atualizada com sucesso",
+        "logo_url": empresa.logo_url,
+        "variantes": variantes
+    }
 
 @router.delete("/{empresa_id}")
-def delete_empresa(
+async def delete_empresa(
     empresa_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.id == empresa_id)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
+    result = await db.execute(
+        select(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .where(models.Empresa.usuario_id == current_user.id)
+    )
+    empresa = result.scalars().first()
     if not empresa:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Empresa não encontrada"
         )
     
-    db.delete(empresa)
-    db.commit()
+    await db.delete(empresa)
+    await db.commit()
+    clientes_whatsapp.invalidar(empresa_id)
+    principal_cache.invalidar(usuario_id=current_user.id)
+    indice_tenants.remover(empresa_id)
     return {"message": "Empresa excluída com sucesso"}
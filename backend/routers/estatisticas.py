@@ -1,22 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta
+from typing import Optional
+from database import get_async_db
 import models
 from .auth import get_current_user
+from auth import Principal
+from analise_produtos import consultar_analise
 
 router = APIRouter()
 
 @router.get("/dashboard")
 async def get_dashboard_stats(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    # Busca a empresa do usuário
-    empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
+    # Empresa do usuário (já vem no principal em cache)
+    empresa = current_user.empresas[0] if current_user.empresas else None
     
     if not empresa:
         raise HTTPException(
@@ -24,20 +25,21 @@ async def get_dashboard_stats(
             detail="Empresa não encontrada"
         )
     
-    # Total de pedidos
-    total_pedidos = db.query(func.count(models.Pedido.id))\
-        .filter(models.Pedido.empresa_id == empresa.id)\
-        .scalar() or 0
+    # Total de pedidos e valor de vendas (a partir do resumo diário)
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(models.VendaDiaria.total_pedidos), 0),
+            func.coalesce(func.sum(models.VendaDiaria.valor_total), 0)
+        )
+        .where(models.VendaDiaria.empresa_id == empresa.id)
+    )
+    total_pedidos, valor_total_vendas = result.one()
     
     # Total de produtos
-    total_produtos = db.query(func.count(models.Produto.id))\
-        .filter(models.Produto.empresa_id == empresa.id)\
-        .scalar() or 0
-    
-    # Valor total de vendas
-    valor_total_vendas = db.query(func.sum(models.Pedido.valor_total))\
-        .filter(models.Pedido.empresa_id == empresa.id)\
-        .scalar() or 0
+    total_produtos = await db.scalar(
+        select(func.count(models.Produto.id))
+        .where(models.Produto.empresa_id == empresa.id)
+    ) or 0
     
     # Ticket médio
     ticket_medio = valor_total_vendas / total_pedidos if total_pedidos > 0 else 0
@@ -56,13 +58,11 @@ async def get_dashboard_stats(
 @router.get("/vendas-por-dia")
 async def get_vendas_por_dia(
     dias: int = 7,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    # Busca a empresa do usuário
-    empresa = db.query(models.Empresa)\
-        .filter(models.Empresa.usuario_id == current_user.id)\
-        .first()
+    # Empresa do usuário (já vem no principal em cache)
+    empresa = current_user.empresas[0] if current_user.empresas else None
     
     if not empresa:
         raise HTTPException(
@@ -70,37 +70,63 @@ async def get_vendas_por_dia(
             detail="Empresa não encontrada"
         )
     
-    # Data inicial (hoje - dias)
-    data_inicial = datetime.now() - timedelta(days=dias)
+    # Data inicial (hoje - dias), em UTC como as datas dos pedidos
+    hoje = datetime.utcnow().date()
+    data_inicial = hoje - timedelta(days=dias)
     
-    # Busca vendas por dia
-    vendas = db.query(
-        func.date(models.Pedido.data_criacao).label('data'),
-        func.count(models.Pedido.id).label('total_pedidos'),
-        func.sum(models.Pedido.valor_total).label('valor_total')
-    )\
-    .filter(models.Pedido.empresa_id == empresa.id)\
-    .filter(models.Pedido.data_criacao >= data_inicial)\
-    .group_by(func.date(models.Pedido.data_criacao))\
-    .order_by(func.date(models.Pedido.data_criacao))\
-    .all()
+    # Busca vendas por dia no resumo diário
+    result = await db.execute(
+        select(models.VendaDiaria)
+        .where(models.VendaDiaria.empresa_id == empresa.id)
+        .where(models.VendaDiaria.data >= data_inicial)
+    )
+    vendas = {venda.data: venda for venda in result.scalars().all()}
     
-    # Formata o resultado
+    # Formata o resultado, preenchendo os dias sem vendas
     resultado = []
     data_atual = data_inicial
-    while data_atual <= datetime.now():
-        # Procura os dados do dia
-        venda_dia = next(
-            (v for v in vendas if v.data.date() == data_atual.date()),
-            None
-        )
+    while data_atual <= hoje:
+        venda_dia = vendas.get(data_atual)
         
         resultado.append({
-            "data": data_atual.date().isoformat(),
+            "data": data_atual.isoformat(),
             "total_pedidos": venda_dia.total_pedidos if venda_dia else 0,
-            "valor_total": float(venda_dia.valor_total) if venda_dia else 0
+            "valor_total": float(venda_dia.valor_total) if venda_dia else 0,
+            "cancelamentos": venda_dia.cancelamentos if venda_dia else 0
         })
         
         data_atual += timedelta(days=1)
     
     return resultado
+
+@router.get("/produtos")
+async def get_analise_produtos(
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    limite: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Mais vendidos, menos vendidos e produtos comprados juntos no período.
+
+    Lido dos resumos diários por produto e por par, atualizados em background
+    (no máximo ANALISE_MAX_STALENESS segundos atrás dos pedidos).
+    """
+    empresa = current_user.empresas[0] if current_user.empresas else None
+    
+    if not empresa:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Empresa não encontrada"
+        )
+    
+    # Padrão: últimos 30 dias (UTC, como as datas dos pedidos)
+    fim = fim or datetime.utcnow().date()
+    inicio = inicio or fim - timedelta(days=30)
+    if inicio > fim or (fim - inicio).days > 366:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Período inválido (máximo de 366 dias)"
+        )
+    
+    return await consultar_analise(db, empresa.id, inicio, fim, limite)
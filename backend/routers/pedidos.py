@@ -1,99 +1,395 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select, tuple_, update, values, column, Enum, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import base64
+import json
 import sys
 import os
 
 # Adiciona o diretório pai ao PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import get_db
-from schemas import PedidoCreate, Pedido
-from models import Pedido as PedidoModel, ItemPedido, Produto, User
-from auth import get_current_user
+from database import get_async_db
+from schemas import (
+    PedidoCreate, Pedido, ItemPedidoCreate, AtualizacaoStatusLote, ResultadoAtualizacaoStatus
+)
+from models import Pedido as PedidoModel, ItemPedido, Produto, User, StatusPedido
+from auth import EVENTOS_TICKET_TTL, create_stream_ticket, get_current_user, get_current_user_stream
 from whatsapp import EvolutionWhatsAppAPI
+from notificacoes import enfileirar_notificacao
+from vendas_diarias import registrar_pedido, registrar_mudanca_status, registrar_mudancas_status
+from catalogo import incrementar_versao_catalogo
+from eventos import PEDIDOS_POR_EVENTO, barramento_pedidos, publicar_evento
+from exportacao import compactar_gzip, exportar_pedidos
+from idempotencia import RequisicaoIdempotente, respostas_idempotentes
+from metricas import orcamento_consultas
 
-router = APIRouter(prefix="/pedidos", tags=["pedidos"])
-whatsapp = EvolutionWhatsAppAPI()
+router = APIRouter()
 
-@router.post("/", response_model=Pedido)
+# Orçamentos de consultas SQL por requisição (2 delas são da autenticação sem cache)
+ORCAMENTO_CRIAR_PEDIDO = 12
+ORCAMENTO_LISTAR_PEDIDOS = 4
+ORCAMENTO_OBTER_PEDIDO = 4
+
+# Fluxo normal do pedido; só avança (pode pular etapas) ou vai para CANCELADO
+FLUXO_STATUS = [
+    StatusPedido.PENDENTE,
+    StatusPedido.CONFIRMADO,
+    StatusPedido.EM_PREPARO,
+    StatusPedido.PRONTO,
+    StatusPedido.ENTREGUE,
+]
+
+def _transicao_permitida(atual: StatusPedido, novo: StatusPedido) -> bool:
+    if atual in (StatusPedido.ENTREGUE, StatusPedido.CANCELADO):
+        return False
+    if novo == StatusPedido.CANCELADO:
+        return True
+    return FLUXO_STATUS.index(novo) > FLUXO_STATUS.index(atual)
+
+async def _carregar_pedido(db: AsyncSession, pedido_id: int, travar: bool = False):
+    """Busca um pedido já com os itens carregados (sessão async não faz lazy load).
+
+    travar=True trava a linha do pedido (FOR UPDATE) até o fim da transação.
+    """
+    query = (
+        select(PedidoModel)
+        .options(selectinload(PedidoModel.items))
+        .where(PedidoModel.id == pedido_id)
+    )
+    if travar:
+        query = query.with_for_update(of=PedidoModel)
+    result = await db.execute(query)
+    return result.scalars().first()
+
+def _valor_status(valor) -> Optional[str]:
+    return valor.value if isinstance(valor, StatusPedido) else valor
+
+async def _publicar_status(db: AsyncSession, mudancas):
+    """Evento status_atualizado por empresa: [(pedido, status_anterior, novo_status)]"""
+    por_empresa: Dict[int, List[dict]] = {}
+    for pedido, anterior, novo in mudancas:
+        por_empresa.setdefault(pedido.empresa_id, []).append(
+            {"id": pedido.id, "status_anterior": _valor_status(anterior), "status": _valor_status(novo)}
+        )
+    for empresa_id, pedidos in por_empresa.items():
+        for inicio in range(0, len(pedidos), PEDIDOS_POR_EVENTO):
+            await publicar_evento(
+                db, empresa_id, "status_atualizado", {"pedidos": pedidos[inicio:inicio + PEDIDOS_POR_EVENTO]}
+            )
+
+def _codificar_cursor(pedido) -> str:
+    return base64.urlsafe_b64encode(
+        json.dumps([pedido.data_criacao.isoformat(), pedido.id]).encode()
+    ).decode()
+
+def _decodificar_cursor(cursor: str):
+    try:
+        data_criacao, pedido_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(data_criacao), int(pedido_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+async def _reservar_estoque(db: AsyncSession, itens: List[ItemPedidoCreate]) -> Dict:
+    """Confere e dá baixa no estoque de todos os itens do pedido de uma vez.
+
+    Os produtos são travados (FOR UPDATE) em ordem de id numa única consulta,
+    o que evita venda acima do estoque e deadlock entre pedidos concorrentes.
+    A baixa é feita com um único UPDATE para todas as linhas.
+    """
+    # Soma linhas repetidas do mesmo produto
+    quantidades: Dict[int, int] = {}
+    for item in itens:
+        quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+
+    result = await db.execute(
+        select(Produto.id, Produto.nome, Produto.preco, Produto.empresa_id, Produto.quantidade_estoque)
+        .where(Produto.id.in_(quantidades))
+        .where(Produto.ativo.is_(True))
+        .order_by(Produto.id)
+        .with_for_update()
+    )
+    produtos = {produto.id: produto for produto in result.all()}
+
+    nao_encontrados = [produto_id for produto_id in quantidades if produto_id not in produtos]
+    if nao_encontrados:
+        await db.rollback()
+        raise HTTPException(
+            status_code=404,
+            detail={"mensagem": "Produtos não encontrados", "produtos": nao_encontrados}
+        )
+
+    insuficientes = [
+        {
+            "produto_id": produto_id,
+            "nome": produtos[produto_id].nome,
+            "solicitado": quantidade,
+            "disponivel": produtos[produto_id].quantidade_estoque,
+        }
+        for produto_id, quantidade in quantidades.items()
+        if produtos[produto_id].quantidade_estoque < quantidade
+    ]
+    if insuficientes:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail={"mensagem": "Quantidade insuficiente em estoque", "itens": insuficientes}
+        )
+
+    baixas = values(
+        column("produto_id", Integer),
+        column("quantidade", Integer),
+        name="baixas"
+    ).data(list(quantidades.items()))
+    await db.execute(
+        update(Produto)
+        .where(Produto.id == baixas.c.produto_id)
+        .values(quantidade_estoque=Produto.quantidade_estoque - baixas.c.quantidade)
+        .execution_options(synchronize_session=False)
+    )
+    return produtos
+
+@router.post("/", response_model=Pedido, dependencies=[Depends(orcamento_consultas(ORCAMENTO_CRIAR_PEDIDO))])
 async def criar_pedido(
     pedido: PedidoCreate,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    # Verifica estoque e calcula valor total
+    """Cria o pedido. Com Idempotency-Key, repetições da mesma requisição (ex.:
+    retry do checkout em rede móvel) recebem a resposta da primeira, sem
+    nova baixa de estoque, pedido ou notificação.
+    """
+    if idempotency_key is None:
+        return await _criar_pedido(db, pedido, current_user)
+
+    req = RequisicaoIdempotente(current_user.id, idempotency_key, pedido.model_dump(mode="json"))
+    async with respostas_idempotentes.exclusivo(req):
+        resposta = respostas_idempotentes.obter(req)
+        if resposta is None:
+            resposta = await respostas_idempotentes.reservar(db, req)
+        if resposta is not None:
+            return JSONResponse(resposta, headers={"Idempotent-Replayed": "true"})
+        return await _criar_pedido(db, pedido, current_user, req)
+
+async def _criar_pedido(
+    db: AsyncSession,
+    pedido: PedidoCreate,
+    current_user,
+    req: Optional[RequisicaoIdempotente] = None
+):
+    produtos = await _reservar_estoque(db, pedido.itens)
+
+    empresas = {produto.empresa_id for produto in produtos.values()}
+    if len(empresas) != 1:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Todos os produtos do pedido devem ser da mesma empresa"
+        )
+
+    # Calcula o valor total com os preços do banco
     valor_total = 0
     itens_pedido = []
-    
     for item in pedido.itens:
-        produto = db.query(Produto).filter(Produto.id == item.produto_id).first()
-        if not produto:
-            raise HTTPException(status_code=404, detail=f"Produto {item.produto_id} não encontrado")
-        
-        if produto.quantidade_estoque < item.quantidade:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Quantidade insuficiente em estoque para o produto {produto.nome}"
-            )
-        
-        valor_item = produto.preco * item.quantidade
-        valor_total += valor_item
-        
-        # Atualiza estoque
-        produto.quantidade_estoque -= item.quantidade
-        
+        produto = produtos[item.produto_id]
+        valor_total += produto.preco * item.quantidade
         itens_pedido.append(ItemPedido(
             produto_id=item.produto_id,
             quantidade=item.quantidade,
             preco_unitario=produto.preco
         ))
     
-    # Cria o pedido
+    # Cria o pedido na mesma transação da baixa de estoque
     db_pedido = PedidoModel(
         usuario_id=current_user.id,
+        empresa_id=empresas.pop(),
+        cliente_telefone=pedido.cliente_telefone,
         valor_total=valor_total,
         itens=itens_pedido
     )
-    
     db.add(db_pedido)
-    db.commit()
-    db.refresh(db_pedido)
-    
-    # Envia confirmação via WhatsApp
-    try:
-        await whatsapp.enviar_confirmacao_pedido(
-            current_user.telefone,
-            db_pedido.id,
-            valor_total
-        )
-    except Exception as e:
-        print(f"Erro ao enviar mensagem WhatsApp: {e}")
-    
-    return db_pedido
+    await db.flush()
+    await registrar_pedido(db, db_pedido)
+
+    # Confirmação via WhatsApp vai para o outbox, no mesmo commit do pedido
+    enfileirar_notificacao(
+        db,
+        db_pedido.empresa_id,
+        db_pedido.cliente_telefone,
+        EvolutionWhatsAppAPI.mensagem_confirmacao_pedido(db_pedido.id, valor_total),
+        pedido_id=db_pedido.id
+    )
+    await publicar_evento(db, db_pedido.empresa_id, "pedido_criado", {"pedido": {
+        "id": db_pedido.id,
+        "status": _valor_status(db_pedido.status),
+        "valor_total": valor_total,
+        "cliente_telefone": db_pedido.cliente_telefone,
+        "data_criacao": db_pedido.data_criacao.isoformat(),
+    }})
+    # Estoque mudou: invalida o ETag da vitrine (por último, segura a linha da empresa)
+    await incrementar_versao_catalogo(db, db_pedido.empresa_id)
+    if req is None:
+        await db.commit()
+        return await _carregar_pedido(db, db_pedido.id)
+
+    # Resposta gravada junto com o pedido: ou os dois existem, ou nenhum
+    resposta = Pedido.model_validate(db_pedido).model_dump(mode="json")
+    await respostas_idempotentes.gravar(db, req, resposta)
+    await db.commit()
+    respostas_idempotentes.guardar(req, resposta)
+    return resposta
 
-@router.get("/", response_model=List[Pedido])
+@router.get("/", response_model=List[Pedido], dependencies=[Depends(orcamento_consultas(ORCAMENTO_LISTAR_PEDIDOS))])
 async def listar_pedidos(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    status_pedido: Optional[List[StatusPedido]] = Query(None, alias="status"),
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    empresa_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
+    """Pedidos mais recentes primeiro, paginados por cursor em (data_criacao, id).
+
+    O próximo cursor vem no cabeçalho X-Proximo-Cursor. Administradores veem os
+    pedidos das suas empresas; clientes, os próprios. Cada página custa duas
+    consultas: os pedidos e, num único IN, os itens de todos eles.
+    """
+    query = (
+        select(PedidoModel)
+        .options(selectinload(PedidoModel.items).raiseload("*"), raiseload("*"))
+    )
     if current_user.is_admin:
-        pedidos = db.query(PedidoModel).offset(skip).limit(limit).all()
+        if empresa_id is not None and empresa_id not in current_user.empresa_ids:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        empresas = [empresa_id] if empresa_id is not None else current_user.empresa_ids
+        query = query.where(PedidoModel.empresa_id.in_(empresas))
     else:
-        pedidos = db.query(PedidoModel).filter(
-            PedidoModel.usuario_id == current_user.id
-        ).offset(skip).limit(limit).all()
+        query = query.where(PedidoModel.usuario_id == current_user.id)
+        if empresa_id is not None:
+            query = query.where(PedidoModel.empresa_id == empresa_id)
+
+    if status_pedido:
+        query = query.where(PedidoModel.status.in_(status_pedido))
+    # Datas em UTC, fim inclusivo
+    if inicio:
+        query = query.where(PedidoModel.data_criacao >= datetime.combine(inicio, datetime.min.time()))
+    if fim:
+        query = query.where(PedidoModel.data_criacao < datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+    if cursor:
+        query = query.where(tuple_(PedidoModel.data_criacao, PedidoModel.id) < _decodificar_cursor(cursor))
+
+    result = await db.execute(
+        query.order_by(PedidoModel.data_criacao.desc(), PedidoModel.id.desc()).limit(limit + 1)
+    )
+    pedidos = result.scalars().all()
+    if len(pedidos) > limit:
+        pedidos = pedidos[:limit]
+        response.headers["X-Proximo-Cursor"] = _codificar_cursor(pedidos[-1])
     return pedidos
 
-@router.get("/{pedido_id}", response_model=Pedido)
+@router.get("/exportar")
+async def exportar_pedidos_empresa(
+    inicio: Optional[date] = None,
+    fim: Optional[date] = None,
+    empresa_id: Optional[int] = None,
+    formato: str = Query("csv", pattern="^(csv|excel)$"),
+    compactar: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Histórico de pedidos e itens da empresa (com nome e SKU do produto) em streaming.
+
+    Uma linha por item. compactar=true entrega o arquivo em gzip (.csv.gz).
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas administradores podem exportar pedidos"
+        )
+    if empresa_id is None:
+        if not current_user.empresa_ids:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        empresa_id = current_user.empresa_ids[0]
+    elif empresa_id not in current_user.empresa_ids:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    # A exportação usa a própria sessão; a da autenticação não segura conexão durante o download
+    await db.close()
+
+    nome = "-".join(["pedidos", str(empresa_id)] + [str(data) for data in (inicio, fim) if data]) + ".csv"
+    corpo = exportar_pedidos(empresa_id, inicio, fim, formato)
+    media_type = "text/csv; charset=utf-8"
+    if compactar:
+        corpo = compactar_gzip(corpo)
+        nome += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        corpo,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome}"'}
+    )
+
+@router.post("/eventos/ticket")
+async def ticket_eventos(current_user: dict = Depends(get_current_user)):
+    """Ticket para abrir /eventos: o EventSource só leva credenciais na URL, que vai para os
+    logs de acesso; o ticket vale EVENTOS_TICKET_TTL segundos e só para o stream"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas administradores podem acompanhar os pedidos"
+        )
+    return {"ticket": create_stream_ticket(current_user.email), "expira_em": EVENTOS_TICKET_TTL}
+
+@router.get("/eventos")
+async def eventos_pedidos(
+    empresa_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user_stream)
+):
+    """Novos pedidos e mudanças de status em tempo real (Server-Sent Events).
+
+    Eventos: conectado, pedido_criado, status_atualizado e ressincronizar; a
+    cada conectado/ressincronizar o painel recarrega o estado pela API. Como o
+    EventSource do navegador não envia cabeçalhos, o painel pede um ticket em
+    POST /eventos/ticket e o passa em ?ticket=.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas administradores podem acompanhar os pedidos"
+        )
+    if empresa_id is not None and empresa_id not in current_user.empresa_ids:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    if barramento_pedidos.lotado():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Limite de conexões em tempo real atingido",
+            headers={"Retry-After": "30"}
+        )
+    empresas = [empresa_id] if empresa_id is not None else current_user.empresa_ids
+    # A conexão não fica presa ao pool enquanto o stream estiver aberto
+    await db.close()
+    return StreamingResponse(
+        barramento_pedidos.transmitir(empresas),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: o nginx repassa cada evento sem bufferizar
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/{pedido_id}", response_model=Pedido, dependencies=[Depends(orcamento_consultas(ORCAMENTO_OBTER_PEDIDO))])
 async def obter_pedido(
     pedido_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    pedido = db.query(PedidoModel).filter(PedidoModel.id == pedido_id).first()
+    pedido = await _carregar_pedido(db, pedido_id)
     if pedido is None:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
     
@@ -105,11 +401,101 @@ async def obter_pedido(
     
     return pedido
 
+@router.put("/status", response_model=List[ResultadoAtualizacaoStatus])
+async def atualizar_status_pedidos(
+    lote: AtualizacaoStatusLote,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Muda o status de vários pedidos numa transação (ex.: despacho da cozinha).
+
+    Cada pedido recebe seu resultado; os inválidos não impedem os demais. As
+    mudanças válidas são gravadas com um único UPDATE e os clientes recebem uma
+    mensagem por status, mesmo que tenham vários pedidos no lote.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas administradores podem atualizar status de pedidos"
+        )
+
+    pedido_ids = [atualizacao.pedido_id for atualizacao in lote.atualizacoes]
+    # Trava os pedidos em ordem de id (evita deadlock com outros lotes)
+    result = await db.execute(
+        select(
+            PedidoModel.id, PedidoModel.status, PedidoModel.empresa_id,
+            PedidoModel.cliente_telefone, PedidoModel.valor_total, PedidoModel.data_criacao
+        )
+        .where(PedidoModel.id.in_(pedido_ids))
+        .where(PedidoModel.empresa_id.in_(current_user.empresa_ids))
+        .order_by(PedidoModel.id)
+        .with_for_update()
+    )
+    pedidos = {pedido.id: pedido for pedido in result.all()}
+
+    resultados = []
+    mudancas = {}
+    vistos = set()
+    for atualizacao in lote.atualizacoes:
+        pedido = pedidos.get(atualizacao.pedido_id)
+        resultado = ResultadoAtualizacaoStatus(pedido_id=atualizacao.pedido_id, ok=False)
+        resultados.append(resultado)
+        if atualizacao.pedido_id in vistos:
+            resultado.erro = "Pedido repetido no lote"
+            continue
+        vistos.add(atualizacao.pedido_id)
+        if pedido is None:
+            resultado.erro = "Pedido não encontrado"
+            continue
+        resultado.status_anterior = pedido.status
+        if pedido.status == atualizacao.status:
+            resultado.ok = True
+            resultado.status = pedido.status
+            continue
+        if not _transicao_permitida(pedido.status, atualizacao.status):
+            resultado.erro = f"Transição de {pedido.status.value} para {atualizacao.status.value} não permitida"
+            continue
+        resultado.ok = True
+        resultado.status = atualizacao.status
+        mudancas[pedido.id] = (pedido, pedido.status, atualizacao.status)
+
+    if mudancas:
+        novos = values(
+            column("pedido_id", Integer),
+            column("status", Enum(StatusPedido)),
+            name="novos"
+        ).data([(pedido_id, novo) for pedido_id, (_, _, novo) in mudancas.items()])
+        await db.execute(
+            update(PedidoModel)
+            .where(PedidoModel.id == novos.c.pedido_id)
+            .values(status=novos.c.status)
+            .execution_options(synchronize_session=False)
+        )
+        await registrar_mudancas_status(db, mudancas.values())
+        await _publicar_status(db, mudancas.values())
+
+        # Uma mensagem por cliente e status, com todos os pedidos dele no lote
+        avisos: Dict[tuple, List[int]] = {}
+        for pedido, _, novo in mudancas.values():
+            if pedido.cliente_telefone:
+                avisos.setdefault((pedido.empresa_id, pedido.cliente_telefone, novo), []).append(pedido.id)
+        for (empresa_id, telefone, novo), ids in avisos.items():
+            enfileirar_notificacao(
+                db,
+                empresa_id,
+                telefone,
+                EvolutionWhatsAppAPI.mensagem_atualizacao_status_lote(ids, novo.value),
+                pedido_id=ids[0] if len(ids) == 1 else None
+            )
+
+    await db.commit()
+    return resultados
+
 @router.put("/{pedido_id}/status", response_model=Pedido)
 async def atualizar_status_pedido(
     pedido_id: int,
-    novo_status: str,
-    db: Session = Depends(get_db),
+    novo_status: StatusPedido,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -118,23 +504,35 @@ async def atualizar_status_pedido(
             detail="Apenas administradores podem atualizar status de pedidos"
         )
     
-    pedido = db.query(PedidoModel).filter(PedidoModel.id == pedido_id).first()
-    if pedido is None:
+    # Travado até o commit: mudanças simultâneas do mesmo pedido (ex.: dois
+    # cancelamentos) passam uma de cada vez e a segunda vê o status da primeira
+    pedido = await _carregar_pedido(db, pedido_id, travar=True)
+    if pedido is None or pedido.empresa_id not in current_user.empresa_ids:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
     
+    status_anterior = pedido.status
+    if status_anterior == novo_status:
+        await db.commit()
+        return pedido
+    if not _transicao_permitida(status_anterior, novo_status):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Transição de {status_anterior.value} para {novo_status.value} não permitida"
+        )
+
     pedido.status = novo_status
-    db.commit()
-    db.refresh(pedido)
-    
-    # Notifica cliente via WhatsApp
-    try:
-        usuario = pedido.usuario
-        await whatsapp.enviar_atualizacao_status(
-            usuario.telefone,
-            pedido.id,
-            novo_status
+    await registrar_mudanca_status(db, pedido, status_anterior, novo_status)
+    await _publicar_status(db, [(pedido, status_anterior, novo_status)])
+
+    # Notifica cliente via WhatsApp (outbox, no mesmo commit da mudança de status)
+    if pedido.cliente_telefone:
+        enfileirar_notificacao(
+            db,
+            pedido.empresa_id,
+            pedido.cliente_telefone,
+            EvolutionWhatsAppAPI.mensagem_atualizacao_status(pedido.id, novo_status.value),
+            pedido_id=pedido.id
         )
-    except Exception as e:
-        print(f"Erro ao enviar mensagem WhatsApp: {e}")
+    await db.commit()
     
     return pedido
@@ -1,49 +1,174 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import sys
 import os
 
 # Adiciona o diretório pai ao PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import get_db
-from schemas import ProdutoCreate, Produto
+from database import get_async_db
+from schemas import ProdutoCreate, Produto, ProdutoBusca, SugestaoProduto
 from models import Produto as ProdutoModel
 from auth import get_current_user
+from catalogo import incrementar_versao_catalogo, obter_pagina_catalogo, resposta_pagina
+from busca import buscar_produtos, sugerir_produtos
+from importacao import exportar_produtos, importar_produtos, registros_csv, registros_ndjson
 
-router = APIRouter(prefix="/produtos", tags=["produtos"])
+router = APIRouter()
+
+async def _obter_produto_da_empresa(db: AsyncSession, produto_id: int, current_user) -> ProdutoModel:
+    db_produto = await db.get(ProdutoModel, produto_id)
+    if db_produto is None or db_produto.empresa_id not in current_user.empresa_ids:
+        raise HTTPException(status_code=404, detail="Produto não encontrado")
+    return db_produto
+
+async def _verificar_sku(db: AsyncSession, empresa_id: int, sku, produto_id: int = None):
+    if not sku:
+        return
+    query = (
+        select(ProdutoModel.id)
+        .where(ProdutoModel.empresa_id == empresa_id)
+        .where(ProdutoModel.sku == sku)
+    )
+    if produto_id is not None:
+        query = query.where(ProdutoModel.id != produto_id)
+    if await db.scalar(query) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="SKU já cadastrado"
+        )
+
+def _exigir_admin_com_empresa(current_user, acao: str):
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Apenas administradores podem {acao} produtos"
+        )
+    if not current_user.empresas:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cadastre uma empresa antes de criar produtos"
+        )
 
 @router.post("/", response_model=Produto)
 async def criar_produto(
     produto: ProdutoCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
-    if not current_user.is_admin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Apenas administradores podem criar produtos"
-        )
-    
-    db_produto = ProdutoModel(**produto.dict())
+    _exigir_admin_com_empresa(current_user, "criar")
+
+    await _verificar_sku(db, current_user.empresa_ids[0], produto.sku)
+    db_produto = ProdutoModel(**produto.dict(), empresa_id=current_user.empresa_ids[0])
     db.add(db_produto)
-    db.commit()
-    db.refresh(db_produto)
+    await db.flush()
+    await incrementar_versao_catalogo(db, db_produto.empresa_id)
+    await db.commit()
+    await db.refresh(db_produto)
     return db_produto
 
+@router.post("/importar")
+async def importar_catalogo(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Importação em massa do corpo da requisição (text/csv ou application/x-ndjson).
+
+    O arquivo é lido em blocos conforme chega e gravado em lotes; linhas com id
+    (como as de /exportar) atualizam aquele produto e, sem id, produtos com SKU já
+    cadastrado são atualizados. Retorna o relatório com os erros por linha.
+    """
+    _exigir_admin_com_empresa(current_user, "importar")
+    tipo = request.headers.get("content-type", "").split(";")[0].strip()
+    if tipo == "text/csv":
+        registros = registros_csv(request.stream())
+    elif tipo in ("application/x-ndjson", "application/jsonl"):
+        registros = registros_ndjson(request.stream())
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Envie text/csv ou application/x-ndjson"
+        )
+    # Cada lote usa a própria sessão; a da autenticação não segura conexão durante o upload
+    await db.close()
+    return await importar_produtos(current_user.empresa_ids[0], registros)
+
+@router.get("/exportar")
+async def exportar_catalogo(
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Exporta o catálogo da empresa em streaming (mesmo formato aceito na importação)"""
+    _exigir_admin_com_empresa(current_user, "exportar")
+    empresa_id = current_user.empresa_ids[0]
+    # A exportação usa a própria sessão; a da autenticação não segura conexão durante o download
+    await db.close()
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        exportar_produtos(empresa_id, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="produtos-{empresa_id}.{formato}"'}
+    )
+
 @router.get("/", response_model=List[Produto])
 async def listar_produtos(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    produtos = db.query(ProdutoModel).offset(skip).limit(limit).all()
+    result = await db.execute(select(ProdutoModel).offset(skip).limit(limit))
+    produtos = result.scalars().all()
     return produtos
 
+@router.get("/empresa/{empresa_id}", response_model=List[Produto])
+async def listar_produtos_empresa(
+    empresa_id: int,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    em_estoque: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Catálogo da vitrine: produtos ativos da empresa, paginados por cursor.
+
+    O próximo cursor vem no cabeçalho X-Proximo-Cursor. As páginas ficam em
+    memória já serializadas e comprimidas até a versão do catálogo mudar, e o
+    ETag acompanha essa versão (recarregar uma vitrine sem mudanças custa um 304).
+    """
+    pagina = await obter_pagina_catalogo(db, empresa_id, em_estoque, limit, cursor)
+    return resposta_pagina(request, pagina)
+
+@router.get("/empresa/{empresa_id}/busca", response_model=List[ProdutoBusca])
+async def buscar_produtos_empresa(
+    empresa_id: int,
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Busca no catálogo da empresa (português, sem acentos, tolera erros de digitação).
+
+    O campo destaque traz o trecho encontrado com os termos em <mark>.
+    """
+    return await buscar_produtos(db, empresa_id, q, limit)
+
+@router.get("/empresa/{empresa_id}/sugestoes", response_model=List[SugestaoProduto])
+async def sugerir_produtos_empresa(
+    empresa_id: int,
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Autocompletar de nomes de produtos"""
+    return await sugerir_produtos(db, empresa_id, q, limit)
+
 @router.get("/{produto_id}", response_model=Produto)
-async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
-    produto = db.query(ProdutoModel).filter(ProdutoModel.id == produto_id).first()
+async def obter_produto(produto_id: int, db: AsyncSession = Depends(get_async_db)):
+    produto = await db.get(ProdutoModel, produto_id)
     if produto is None:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
     return produto
@@ -52,7 +177,7 @@ async def obter_produto(produto_id: int, db: Session = Depends(get_db)):
 async def atualizar_produto(
     produto_id: int,
     produto: ProdutoCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -60,22 +185,22 @@ async def atualizar_produto(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Apenas administradores podem atualizar produtos"
         )
-    
-    db_produto = db.query(ProdutoModel).filter(ProdutoModel.id == produto_id).first()
-    if db_produto is None:
-        raise HTTPException(status_code=404, detail="Produto não encontrado")
-    
+
+    db_produto = await _obter_produto_da_empresa(db, produto_id, current_user)
+    await _verificar_sku(db, db_produto.empresa_id, produto.sku, produto_id)
+
     for key, value in produto.dict().items():
         setattr(db_produto, key, value)
-    
-    db.commit()
-    db.refresh(db_produto)
+
+    await incrementar_versao_catalogo(db, db_produto.empresa_id)
+    await db.commit()
+    await db.refresh(db_produto)
     return db_produto
 
 @router.delete("/{produto_id}")
 async def deletar_produto(
     produto_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -83,11 +208,10 @@ async def deletar_produto(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Apenas administradores podem deletar produtos"
         )
-    
-    db_produto = db.query(ProdutoModel).filter(ProdutoModel.id == produto_id).first()
-    if db_produto is None:
-        raise HTTPException(status_code=404, detail="Produto não encontrado")
-    
-    db.delete(db_produto)
-    db.commit()
+
+    db_produto = await _obter_produto_da_empresa(db, produto_id, current_user)
+
+    await db.delete(db_produto)
+    await incrementar_versao_catalogo(db, db_produto.empresa_id)
+    await db.commit()
     return {"message": "Produto deletado com sucesso"}
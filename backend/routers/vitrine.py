@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import sys
+import os
+
+# Adiciona o diretório pai ao PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_async_db
+from schemas import Produto, ProdutoBusca, SugestaoProduto
+from catalogo import obter_pagina_catalogo, resposta_pagina
+from busca import buscar_produtos, sugerir_produtos
+from tenants import EmpresaTenant, get_empresa_tenant
+
+router = APIRouter()
+
+@router.get("/")
+async def obter_loja(empresa: EmpresaTenant = Depends(get_empresa_tenant)):
+    """Dados públicos da loja do domínio acessado (sem consulta ao banco)"""
+    return {
+        "id": empresa.id,
+        "nome": empresa.nome,
+        "slug": empresa.slug,
+        "logo_url": empresa.logo_url,
+        "logo_variantes": empresa.logo_variantes
+    }
+
+@router.get("/produtos", response_model=List[Produto])
+async def listar_produtos_loja(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    em_estoque: bool = True,
+    empresa: EmpresaTenant = Depends(get_empresa_tenant),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Catálogo da loja do domínio acessado"""
+    pagina = await obter_pagina_catalogo(db, empresa.id, em_estoque, limit, cursor)
+    return resposta_pagina(request, pagina)
+
+@router.get("/busca", response_model=List[ProdutoBusca])
+async def buscar_produtos_loja(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    empresa: EmpresaTenant = Depends(get_empresa_tenant),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Busca no catálogo da loja do domínio acessado"""
+    return await buscar_produtos(db, empresa.id, q, limit)
+
+@router.get("/sugestoes", response_model=List[SugestaoProduto])
+async def sugerir_produtos_loja(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    empresa: EmpresaTenant = Depends(get_empresa_tenant),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Autocompletar de nomes de produtos da loja"""
+    return await sugerir_produtos(db, empresa.id, q, limit)
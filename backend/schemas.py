@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, constr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field, conint, constr
+from typing import Dict, List, Optional
 from datetime import datetime
 from models import StatusPedido
 
@@ -38,6 +38,7 @@ class EmpresaBase(BaseModel):
     cep: constr(pattern=r'^\d{8}$')
     telefone: constr(pattern=r'^\d{10,11}$')
     logo_url: Optional[str] = None
+    dominio: Optional[constr(pattern=r'^([a-z0-9]([a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}$')] = None
 
 class EmpresaCreate(EmpresaBase):
     pass
@@ -45,13 +46,25 @@ class EmpresaCreate(EmpresaBase):
 class Empresa(EmpresaBase):
     id: int
     usuario_id: int
+    logo_variantes: Optional[Dict[str, Dict[str, str]]] = None
     data_criacao: datetime
     ativo: bool = True
 
     class Config:
         from_attributes = True
 
+class EmpresaWhatsAppUpdate(BaseModel):
+    # Instância própria na Evolution API; sem ela a empresa usa a instância global do .env
+    instancia: Optional[constr(strip_whitespace=True, min_length=1, max_length=100)] = None
+    # Só de escrita (nunca volta nas respostas); fora do corpo, a chave gravada é mantida
+    api_key: Optional[constr(strip_whitespace=True, min_length=1)] = None
+
+class EmpresaWhatsApp(BaseModel):
+    instancia: Optional[str] = None
+    api_key_configurada: bool
+
 class ProdutoBase(BaseModel):
+    sku: Optional[constr(strip_whitespace=True, min_length=1, max_length=64)] = None
     nome: str
     descricao: str
     preco: float
@@ -61,6 +74,11 @@ class ProdutoBase(BaseModel):
 class ProdutoCreate(ProdutoBase):
     pass
 
+class ProdutoImportacao(ProdutoCreate):
+    # Colunas que a exportação também traz: com id, a linha atualiza aquele produto da empresa
+    id: Optional[int] = None
+    ativo: Optional[bool] = None
+
 class Produto(ProdutoBase):
     id: int
     empresa_id: int
@@ -71,9 +89,17 @@ class Produto(ProdutoBase):
     class Config:
         from_attributes = True
 
+class ProdutoBusca(Produto):
+    relevancia: float
+    destaque: str
+
+class SugestaoProduto(BaseModel):
+    id: int
+    nome: str
+
 class ItemPedidoBase(BaseModel):
     produto_id: int
-    quantidade: int
+    quantidade: conint(gt=0)
     preco_unitario: float
 
 class ItemPedidoCreate(ItemPedidoBase):
@@ -90,7 +116,8 @@ class PedidoBase(BaseModel):
     valor_total: float
 
 class PedidoCreate(BaseModel):
-    itens: List[ItemPedidoCreate]
+    itens: List[ItemPedidoCreate] = Field(..., min_length=1)
+    cliente_telefone: Optional[constr(pattern=r'^\d{10,13}$')] = None
 
 class Pedido(PedidoBase):
     id: int
@@ -101,3 +128,17 @@ class Pedido(PedidoBase):
 
     class Config:
         from_attributes = True
+
+class AtualizacaoStatus(BaseModel):
+    pedido_id: int
+    status: StatusPedido
+
+class AtualizacaoStatusLote(BaseModel):
+    atualizacoes: List[AtualizacaoStatus] = Field(..., min_length=1, max_length=500)
+
+class ResultadoAtualizacaoStatus(BaseModel):
+    pedido_id: int
+    ok: bool
+    status_anterior: Optional[StatusPedido] = None
+    status: Optional[StatusPedido] = None
+    erro: Optional[str] = None
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+# Importado primeiro pelo main.py: o relógio do perfil começa aqui
+_INICIO = time.perf_counter()
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+def _idade_processo() -> Optional[float]:
+    """Segundos desde a criação do processo (Linux), para medir o boot do interpretador/uvicorn"""
+    try:
+        with open("/proc/self/stat") as arquivo:
+            campos = arquivo.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as arquivo:
+            uptime = float(arquivo.read().split()[0])
+        return uptime - int(campos[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+def versao_esperada() -> str:
+    """Revisão head das migrações do código (só lê os arquivos, sem banco)"""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_current_head()
+
+async def verificar_esquema(async_engine) -> dict:
+    """Checagem leve de prontidão: uma consulta para conferir a versão do esquema.
+
+    O worker não cria nem altera tabelas; se o banco estiver atrasado, só avisa.
+    """
+    esperada = versao_esperada()
+    try:
+        async with async_engine.connect() as conn:
+            atual = await conn.scalar(text("SELECT version_num FROM alembic_version"))
+    except (DBAPIError, OSError) as e:
+        print(f"Erro ao verificar a versão do esquema: {e}")
+        atual = None
+    if atual != esperada:
+        print(f"Esquema do banco em {atual}, código espera {esperada}: rode 'alembic upgrade head'")
+    return {"versao_banco": atual, "versao_codigo": esperada, "atualizado": atual == esperada}
+
+class PerfilInicializacao:
+    """Tempos de inicialização do worker: imports, montagem do app e startup"""
+
+    def __init__(self):
+        self.idade_processo_no_import = _idade_processo()
+        self.etapas: List[Tuple[str, float]] = []
+        self._ultima_marca = _INICIO
+        self.pronto_em: Optional[float] = None
+        self.esquema: Optional[dict] = None
+
+    def marcar(self, etapa: str):
+        """Registra o tempo gasto desde a marca anterior"""
+        agora = time.perf_counter()
+        self.etapas.append((etapa, agora - self._ultima_marca))
+        self._ultima_marca = agora
+
+    def concluir(self):
+        self.pronto_em = time.perf_counter()
+        resumo = ", ".join(f"{etapa}={segundos * 1000:.0f}ms" for etapa, segundos in self.etapas)
+        print(f"Worker {os.getpid()} pronto em {(self.pronto_em - _INICIO) * 1000:.0f}ms ({resumo})")
+
+    def relatorio(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            # Interpretador + uvicorn até o primeiro import do app
+            "antes_do_app_segundos": self.idade_processo_no_import,
+            "etapas_segundos": {etapa: round(segundos, 4) for etapa, segundos in self.etapas},
+            "total_segundos": round(self.pronto_em - _INICIO, 4) if self.pronto_em else None,
+            "modulos_carregados": len(sys.modules),
+            "esquema": self.esquema,
+        }
+
+perfil_inicializacao = PerfilInicializacao()
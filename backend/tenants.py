@@ -0,0 +1,138 @@
+import asyncio
+import os
+from typing import Dict, Optional
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Empresa
+
+# Domínio base do sistema: <slug>.<TENANT_DOMINIO_BASE> abre a vitrine da empresa
+TENANT_DOMINIO_BASE = os.getenv("TENANT_DOMINIO_BASE", "").lower().strip(".")
+# Intervalo de recarga completa do índice (mudanças feitas em outros workers)
+TENANT_INDICE_INTERVALO = float(os.getenv("TENANT_INDICE_INTERVALO", "60"))
+
+class EmpresaTenant:
+    """Dados públicos da empresa guardados no índice de domínios"""
+
+    __slots__ = ("id", "nome", "slug", "dominio", "logo_url", "logo_variantes", "usuario_id")
+
+    def __init__(self, empresa):
+        self.id = empresa.id
+        self.nome = empresa.nome
+        self.slug = empresa.slug
+        self.dominio = empresa.dominio
+        self.logo_url = empresa.logo_url
+        self.logo_variantes = empresa.logo_variantes
+        self.usuario_id = empresa.usuario_id
+
+class IndiceTenants:
+    """Índice em memória de domínio/slug para empresa, um por worker"""
+
+    def __init__(self):
+        self._por_dominio: Dict[str, EmpresaTenant] = {}
+        self._por_slug: Dict[str, EmpresaTenant] = {}
+        self._por_id: Dict[int, EmpresaTenant] = {}
+        self.carregado = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def carregar(self):
+        """Recarrega o índice inteiro com uma única consulta"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    Empresa.id, Empresa.nome, Empresa.slug, Empresa.dominio,
+                    Empresa.logo_url, Empresa.logo_variantes, Empresa.usuario_id
+                )
+                .where(Empresa.ativo.is_(True))
+            )
+            empresas = [EmpresaTenant(empresa) for empresa in result.all()]
+        self._por_id = {empresa.id: empresa for empresa in empresas}
+        self._por_slug = {empresa.slug: empresa for empresa in empresas if empresa.slug}
+        self._por_dominio = {empresa.dominio: empresa for empresa in empresas if empresa.dominio}
+        self.carregado = True
+
+    def atualizar(self, empresa: Empresa):
+        """Aplica a mudança de uma empresa feita neste worker"""
+        self.remover(empresa.id)
+        if not empresa.ativo:
+            return
+        tenant = EmpresaTenant(empresa)
+        self._por_id[tenant.id] = tenant
+        if tenant.slug:
+            self._por_slug[tenant.slug] = tenant
+        if tenant.dominio:
+            self._por_dominio[tenant.dominio] = tenant
+
+    def remover(self, empresa_id: int):
+        tenant = self._por_id.pop(empresa_id, None)
+        if tenant is None:
+            return
+        if self._por_slug.get(tenant.slug) is tenant:
+            del self._por_slug[tenant.slug]
+        if tenant.dominio and self._por_dominio.get(tenant.dominio) is tenant:
+            del self._por_dominio[tenant.dominio]
+
+    def por_dominio(self, dominio: str) -> Optional[EmpresaTenant]:
+        return self._por_dominio.get(dominio)
+
+    def resolver_host(self, host: str) -> Optional[EmpresaTenant]:
+        """Domínio próprio primeiro; depois <slug>.<domínio base>"""
+        host = host.split(":", 1)[0].lower().strip(".")
+        tenant = self._por_dominio.get(host)
+        if tenant is not None:
+            return tenant
+        if TENANT_DOMINIO_BASE and host.endswith("." + TENANT_DOMINIO_BASE):
+            slug = host[: -len(TENANT_DOMINIO_BASE) - 1]
+            return self._por_slug.get(slug)
+        return None
+
+    async def _recarregar_periodicamente(self):
+        while True:
+            await asyncio.sleep(TENANT_INDICE_INTERVALO)
+            try:
+                await self.carregar()
+            except Exception as e:
+                print(f"Erro ao recarregar índice de domínios: {e}")
+
+    async def iniciar(self):
+        try:
+            await self.carregar()
+        except Exception as e:
+            # Sem banco no boot: o worker sobe e a recarga periódica tenta de novo
+            print(f"Erro ao carregar índice de domínios: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._recarregar_periodicamente())
+
+    async def parar(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+indice_tenants = IndiceTenants()
+
+class TenantMiddleware:
+    """Resolve a empresa pelo cabeçalho Host e guarda em request.state.empresa"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            host = ""
+            for nome, valor in scope["headers"]:
+                if nome == b"host":
+                    host = valor.decode("latin-1")
+                    break
+            scope.setdefault("state", {})["empresa"] = indice_tenants.resolver_host(host)
+        await self.app(scope, receive, send)
+
+def get_empresa_tenant(request: Request) -> EmpresaTenant:
+    """Dependência das rotas públicas da vitrine: empresa do domínio acessado"""
+    empresa = getattr(request.state, "empresa", None)
+    if empresa is None:
+        raise HTTPException(status_code=404, detail="Loja não encontrada para este domínio")
+    return empresa
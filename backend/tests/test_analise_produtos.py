@@ -0,0 +1,52 @@
+"""Atualização dos resumos da análise de produtos com vários workers"""
+import asyncio
+from sqlalchemy import func, select, text
+from database import SessionLocal, async_engine
+from analise_produtos import AtualizadorAnalise, atualizar_pendentes
+from models import VendaDiaria, VendaProdutoDiaria
+
+def _comprar(cliente_http, loja, rodar, pedidos):
+    async def cenario():
+        async with cliente_http(loja["token"]) as cliente:
+            for _ in range(pedidos):
+                itens = [{"produto_id": produto_id, "quantidade": 1, "preco_unitario": 10.0} for produto_id in loja["produto_ids"]]
+                (await cliente.post("/pedidos/", json={"itens": itens})).raise_for_status()
+    rodar(cenario())
+
+def _advisory_locks() -> int:
+    with SessionLocal() as db:
+        return db.scalar(text("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'"))
+
+def test_atualizacoes_simultaneas_recalculam_cada_dia_uma_vez(criar_loja, cliente_http, rodar):
+    loja = criar_loja(produtos=3)
+    _comprar(cliente_http, loja, rodar, 4)
+
+    async def worker():
+        async with async_engine.connect() as conn:
+            return await atualizar_pendentes(conn)
+
+    async def cenario():
+        return await asyncio.gather(*(worker() for _ in range(4)))
+
+    resultados = rodar(cenario())
+
+    assert sum(dias or 0 for dias in resultados) == 1
+    assert _advisory_locks() == 0
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).where(VendaDiaria.analise_pendente.is_(True))) == 0
+        vendas = dict(db.execute(select(VendaProdutoDiaria.produto_id, VendaProdutoDiaria.quantidade)).all())
+    assert vendas == {produto_id: 4 for produto_id in loja["produto_ids"]}
+
+def test_lock_nao_fica_preso_entre_rodadas(criar_loja, cliente_http, rodar):
+    """Com o lock de sessão, um unlock em outra conexão (PgBouncer) deixava o lock preso para sempre"""
+    loja = criar_loja(produtos=2)
+    atualizador = AtualizadorAnalise()
+
+    _comprar(cliente_http, loja, rodar, 1)
+    assert rodar(atualizador.atualizar()) == 1
+    assert _advisory_locks() == 0
+
+    _comprar(cliente_http, loja, rodar, 1)
+    assert rodar(atualizador.atualizar()) == 1
+    with SessionLocal() as db:
+        assert db.scalar(select(func.sum(VendaProdutoDiaria.quantidade))) == 4
@@ -0,0 +1,61 @@
+import asyncio
+from sqlalchemy import func, select
+from database import SessionLocal
+from models import ItemPedido, Pedido, Produto
+
+PEDIDOS_SIMULTANEOS = 300
+
+def _estoque(produto_ids):
+    with SessionLocal() as db:
+        return dict(db.execute(
+            select(Produto.id, Produto.quantidade_estoque).where(Produto.id.in_(produto_ids))
+        ).all())
+
+def _vendido(produto_ids):
+    with SessionLocal() as db:
+        return dict(db.execute(
+            select(ItemPedido.produto_id, func.sum(ItemPedido.quantidade))
+            .where(ItemPedido.produto_id.in_(produto_ids))
+            .group_by(ItemPedido.produto_id)
+        ).all())
+
+async def _disparar(cliente_http, token, carrinhos):
+    async with cliente_http(token) as cliente:
+        respostas = await asyncio.gather(*(
+            cliente.post("/pedidos/", json={"itens": itens}) for itens in carrinhos
+        ))
+    return [resposta.status_code for resposta in respostas], respostas
+
+def test_pedidos_simultaneos_nao_vendem_alem_do_estoque(criar_loja, cliente_http, rodar):
+    loja = criar_loja(produtos=1, estoque=50)
+    produto_id = loja["produto_ids"][0]
+    carrinhos = [[{"produto_id": produto_id, "quantidade": 1, "preco_unitario": 10.0}]] * PEDIDOS_SIMULTANEOS
+
+    status, respostas = rodar(_disparar(cliente_http, loja["token"], carrinhos))
+
+    assert status.count(200) == 50
+    assert status.count(400) == PEDIDOS_SIMULTANEOS - 50
+    recusa = next(r for r in respostas if r.status_code == 400).json()["detail"]
+    assert recusa["itens"] == [{"produto_id": produto_id, "nome": "Produto 0", "solicitado": 1, "disponivel": 0}]
+    assert _estoque([produto_id]) == {produto_id: 0}
+    assert _vendido([produto_id]) == {produto_id: 50}
+
+def test_carrinhos_cruzados_nao_travam_nem_vendem_alem_do_estoque(criar_loja, cliente_http, rodar):
+    """Carrinhos com os mesmos produtos em ordens opostas: sem deadlock (500) e sem venda a mais"""
+    loja = criar_loja(produtos=3, estoque=40)
+    a, b, c = loja["produto_ids"]
+    carrinhos = []
+    for i in range(PEDIDOS_SIMULTANEOS):
+        ordem = [a, b, c] if i % 2 else [c, b, a]
+        carrinhos.append([{"produto_id": produto_id, "quantidade": 1 + i % 2, "preco_unitario": 10.0} for produto_id in ordem])
+
+    status, _ = rodar(_disparar(cliente_http, loja["token"], carrinhos))
+
+    assert set(status) <= {200, 400}
+    estoque = _estoque([a, b, c])
+    vendido = _vendido([a, b, c])
+    for produto_id in (a, b, c):
+        assert estoque[produto_id] >= 0
+        assert estoque[produto_id] + vendido.get(produto_id, 0) == 40
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(Pedido)) == status.count(200)
@@ -0,0 +1,50 @@
+"""Ticket do stream de pedidos: o token de acesso não vai na URL"""
+from fastapi import HTTPException
+from auth import create_stream_ticket, get_current_user_stream
+from database import AsyncSessionLocal
+
+def test_ticket_abre_so_o_stream(criar_loja, cliente_http, rodar):
+    loja = criar_loja()
+
+    async def cenario():
+        async with cliente_http(loja["token"]) as cliente:
+            resposta = await cliente.post("/pedidos/eventos/ticket")
+        resposta.raise_for_status()
+        ticket = resposta.json()["ticket"]
+        async with AsyncSessionLocal() as db:
+            principal = await get_current_user_stream(None, ticket, db)
+        # Vazado de um log de acesso, o ticket não serve para o resto da API
+        async with cliente_http(ticket) as cliente:
+            com_ticket = await cliente.get("/pedidos/")
+        return principal, com_ticket
+
+    principal, com_ticket = rodar(cenario())
+    assert principal.id == loja["usuario_id"]
+    assert com_ticket.status_code == 401
+
+def test_stream_recusa_token_de_acesso_na_url(criar_loja, cliente_http, rodar):
+    loja = criar_loja()
+
+    async def cenario():
+        async with cliente_http() as cliente:
+            return (
+                await cliente.get("/pedidos/eventos", params={"ticket": loja["token"]}),
+                await cliente.get("/pedidos/eventos", params={"token": loja["token"]}),
+            )
+
+    assert [resposta.status_code for resposta in rodar(cenario())] == [401, 401]
+
+def test_ticket_vencido(rodar, monkeypatch):
+    import auth
+
+    monkeypatch.setattr(auth, "EVENTOS_TICKET_TTL", -1)
+    ticket = create_stream_ticket("admin@exemplo.com")
+
+    async def cenario():
+        async with AsyncSessionLocal() as db:
+            try:
+                await get_current_user_stream(None, ticket, db)
+            except HTTPException as e:
+                return e
+
+    assert rodar(cenario()).status_code == 401
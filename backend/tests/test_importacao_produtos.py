@@ -0,0 +1,82 @@
+"""Importação do catálogo: o arquivo de /produtos/exportar volta sem duplicar produtos"""
+import csv
+import io
+import json
+from sqlalchemy import select
+from database import SessionLocal
+from models import Produto
+
+def _produtos(empresa_id):
+    with SessionLocal() as db:
+        return {
+            p.id: p for p in db.scalars(select(Produto).where(Produto.empresa_id == empresa_id).order_by(Produto.id))
+        }
+
+def _exportar_e_importar(cliente_http, loja, rodar, editar=None, formato="csv"):
+    async def cenario():
+        async with cliente_http(loja["token"]) as cliente:
+            exportado = await cliente.get("/produtos/exportar", params={"formato": formato})
+            exportado.raise_for_status()
+            corpo = editar(exportado.text) if editar else exportado.text
+            tipo = "text/csv" if formato == "csv" else "application/x-ndjson"
+            resposta = await cliente.post("/produtos/importar", content=corpo.encode(), headers={"Content-Type": tipo})
+            resposta.raise_for_status()
+            return resposta.json()
+    return rodar(cenario())
+
+def test_reimportar_exportacao_sem_sku_nao_duplica(criar_loja, cliente_http, rodar):
+    # Produtos anteriores à coluna sku: todos com sku NULL
+    loja = criar_loja(produtos=5)
+    empresa_id = loja["empresa_ids"][0]
+
+    for formato in ("csv", "ndjson"):
+        relatorio = _exportar_e_importar(cliente_http, loja, rodar, formato=formato)
+        assert relatorio["inseridos"] == 0
+        assert relatorio["atualizados"] == 5
+        assert relatorio["total_erros"] == 0
+    assert sorted(_produtos(empresa_id)) == sorted(loja["produto_ids"])
+
+def test_linhas_com_id_atualizam_o_produto(criar_loja, cliente_http, rodar):
+    loja = criar_loja(produtos=2)
+    primeiro, segundo = loja["produto_ids"]
+
+    def editar(texto):
+        linhas = list(csv.DictReader(io.StringIO(texto)))
+        linhas[0].update(nome="Renomeado", preco="12.5", ativo="False")
+        linhas[1].update(ativo="")
+        linhas.append({**linhas[1], "id": "", "sku": "NOVO-1", "nome": "Novo"})
+        saida = io.StringIO()
+        escritor = csv.DictWriter(saida, fieldnames=list(linhas[0]))
+        escritor.writeheader()
+        escritor.writerows(linhas)
+        return saida.getvalue()
+
+    relatorio = _exportar_e_importar(cliente_http, loja, rodar, editar)
+
+    assert (relatorio["inseridos"], relatorio["atualizados"], relatorio["total_erros"]) == (1, 2, 0)
+    produtos = _produtos(loja["empresa_ids"][0])
+    assert (produtos[primeiro].nome, produtos[primeiro].preco, produtos[primeiro].ativo) == ("Renomeado", 12.5, False)
+    # Célula ativo vazia mantém o valor atual
+    assert produtos[segundo].ativo is True
+    assert [p.nome for p in produtos.values() if p.sku == "NOVO-1"] == ["Novo"]
+
+def test_id_de_outra_empresa_ou_sku_de_outro_produto_vai_para_o_relatorio(criar_loja, cliente_http, rodar):
+    loja = criar_loja(produtos=2)
+    outra = criar_loja(produtos=1)
+    primeiro, segundo = loja["produto_ids"]
+    with SessionLocal() as db:
+        db.get(Produto, segundo).sku = "SKU-2"
+        db.commit()
+
+    def editar(texto):
+        registros = [json.loads(linha) for linha in texto.splitlines()]
+        registros[0]["sku"] = "SKU-2"
+        registros.append({**registros[1], "id": outra["produto_ids"][0], "nome": "Invasor"})
+        return "".join(json.dumps(registro) + "\n" for registro in registros)
+
+    relatorio = _exportar_e_importar(cliente_http, loja, rodar, editar, formato="ndjson")
+
+    assert relatorio["atualizados"] == 1
+    assert sorted(erro["linha"] for erro in relatorio["erros"]) == [1, 3]
+    assert _produtos(loja["empresa_ids"][0])[primeiro].sku is None
+    assert _produtos(outra["empresa_ids"][0])[outra["produto_ids"][0]].nome == "Produto 0"
@@ -0,0 +1,59 @@
+from routers.pedidos import ORCAMENTO_LISTAR_PEDIDOS, ORCAMENTO_OBTER_PEDIDO
+
+async def _paginas(cliente_http, token, limit, **filtros):
+    """Percorre a listagem pelo cursor; retorna [(ids da página, consultas)]"""
+    paginas = []
+    params = {"limit": limit, **filtros}
+    async with cliente_http(token) as cliente:
+        # Aquece o cache de autenticação: as páginas medidas têm o mesmo custo fixo
+        (await cliente.get("/pedidos/", params={"limit": 1})).raise_for_status()
+        while True:
+            resposta = await cliente.get("/pedidos/", params=params)
+            resposta.raise_for_status()
+            paginas.append(([p["id"] for p in resposta.json()], int(resposta.headers["X-Consultas-SQL"])))
+            cursor = resposta.headers.get("X-Proximo-Cursor")
+            if cursor is None:
+                return paginas
+            params["cursor"] = cursor
+
+def test_consultas_por_pagina_nao_crescem_com_o_tamanho(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=10)
+    criar_pedidos(loja, 120, itens_por_pedido=5)
+
+    consultas = {}
+    for limit in (1, 10, 100):
+        paginas = rodar(_paginas(cliente_http, loja["token"], limit))
+        consultas[limit] = {quantidade for ids, quantidade in paginas if ids}
+
+    # Itens de todos os pedidos da página num único IN: o mesmo número de consultas para 1 ou 100 pedidos
+    assert consultas[1] == consultas[10] == consultas[100]
+    assert max(consultas[100]) <= ORCAMENTO_LISTAR_PEDIDOS
+
+def test_cursor_percorre_todos_os_pedidos_sem_repetir(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=4)
+    pedido_ids = criar_pedidos(loja, 45)
+
+    paginas = rodar(_paginas(cliente_http, loja["token"], 10))
+
+    assert [len(ids) for ids, _ in paginas] == [10, 10, 10, 10, 5]
+    vistos = [pedido_id for ids, _ in paginas for pedido_id in ids]
+    # Mais recentes primeiro; criar_pedidos grava em ordem crescente de data
+    assert vistos == list(reversed(pedido_ids))
+
+def test_obter_pedido_nao_cresce_com_os_itens(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=30)
+    pequeno, = criar_pedidos(loja, 1, itens_por_pedido=1)
+    grande, = criar_pedidos(loja, 1, itens_por_pedido=30)
+
+    async def cenario():
+        async with cliente_http(loja["token"]) as cliente:
+            (await cliente.get(f"/pedidos/{pequeno}")).raise_for_status()
+            consultas = {}
+            for pedido_id in (pequeno, grande):
+                resposta = await cliente.get(f"/pedidos/{pedido_id}")
+                resposta.raise_for_status()
+                consultas[pedido_id] = int(resposta.headers["X-Consultas-SQL"])
+            return consultas
+
+    consultas = rodar(cenario())
+    assert consultas[pequeno] == consultas[grande] <= ORCAMENTO_OBTER_PEDIDO
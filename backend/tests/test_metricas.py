@@ -0,0 +1,17 @@
+"""Rótulo de rota das métricas"""
+from main import app
+from metricas import MetricasMiddleware
+
+def _rota(metodo, caminho):
+    middleware = MetricasMiddleware(app, app.routes)
+    return middleware._rota({"type": "http", "method": metodo, "path": caminho, "root_path": ""})
+
+def test_rota_com_o_metodo_certo_vence_a_declarada_antes():
+    # GET /pedidos/{pedido_id} é declarada antes de PUT /pedidos/status e casa o caminho
+    assert _rota("PUT", "/pedidos/status") == "/pedidos/status"
+    assert _rota("GET", "/pedidos/42") == "/pedidos/{pedido_id}"
+    assert _rota("PUT", "/pedidos/42/status") == "/pedidos/{pedido_id}/status"
+
+def test_metodo_sem_rota_usa_a_correspondencia_parcial():
+    assert _rota("DELETE", "/pedidos/status") == "/pedidos/{pedido_id}"
+    assert _rota("GET", "/nao-existe") == "desconhecida"
@@ -0,0 +1,161 @@
+"""Worker do outbox de WhatsApp contra a EvolutionFalsa do conftest"""
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from database import AsyncSessionLocal, SessionLocal
+from models import NotificacaoWhatsApp, StatusNotificacao
+from notificacoes import OUTBOX_BACKOFF_BASE, OUTBOX_LEASE, OUTBOX_MAX_TENTATIVAS, OutboxWorker, calcular_tamanho_lote
+from whatsapp import EVOLUTION_TIMEOUT, ClientesWhatsApp
+
+def _enfileirar(loja, quantidade, **campos):
+    with SessionLocal() as db:
+        notificacoes = [
+            NotificacaoWhatsApp(
+                empresa_id=loja["empresa_ids"][0], numero=f"55119000000{i:02d}", mensagem=f"Mensagem {i}", **campos
+            )
+            for i in range(quantidade)
+        ]
+        db.add_all(notificacoes)
+        db.commit()
+        return [notificacao.id for notificacao in notificacoes]
+
+def _notificacoes(ids):
+    with SessionLocal() as db:
+        return {
+            n.id: n for n in db.scalars(select(NotificacaoWhatsApp).where(NotificacaoWhatsApp.id.in_(ids)))
+        }
+
+def _liberar_agora(ids):
+    """Simula a passagem do tempo: as mensagens voltam a ficar disponíveis"""
+    with SessionLocal() as db:
+        db.execute(
+            update(NotificacaoWhatsApp)
+            .where(NotificacaoWhatsApp.id.in_(ids))
+            .values(proxima_tentativa=datetime.utcnow() - timedelta(seconds=1))
+        )
+        db.commit()
+
+def _worker():
+    return OutboxWorker(clientes=ClientesWhatsApp(AsyncSessionLocal))
+
+def test_envia_as_pendentes(criar_loja, evolution_falsa, rodar):
+    ids = _enfileirar(criar_loja(), 3)
+
+    assert rodar(_worker().processar_lote()) == 3
+
+    assert sorted(m["message"] for m in evolution_falsa.recebidas) == ["Mensagem 0", "Mensagem 1", "Mensagem 2"]
+    assert {(m["instancia"], m["apikey"]) for m in evolution_falsa.recebidas} == {("instancia-global", "chave-global")}
+    for notificacao in _notificacoes(ids).values():
+        assert notificacao.status == StatusNotificacao.ENVIADA
+        assert notificacao.tentativas == 1
+        assert notificacao.data_envio is not None
+
+def test_falha_agenda_nova_tentativa_com_backoff(criar_loja, evolution_falsa, rodar):
+    notificacao_id, = _enfileirar(criar_loja(), 1)
+    evolution_falsa.respostas = [500]
+    worker = _worker()
+
+    antes = datetime.utcnow()
+    rodar(worker.processar_lote())
+
+    notificacao = _notificacoes([notificacao_id])[notificacao_id]
+    assert notificacao.status == StatusNotificacao.PENDENTE
+    assert notificacao.tentativas == 1
+    assert "500" in notificacao.ultimo_erro
+    espera = (notificacao.proxima_tentativa - antes).total_seconds()
+    assert OUTBOX_BACKOFF_BASE * 0.5 <= espera <= OUTBOX_BACKOFF_BASE + 1
+    # Antes do backoff vencer a mensagem não é reservada de novo
+    assert rodar(worker.processar_lote()) == 0
+
+    _liberar_agora([notificacao_id])
+    assert rodar(worker.processar_lote()) == 1
+
+    notificacao = _notificacoes([notificacao_id])[notificacao_id]
+    assert notificacao.status == StatusNotificacao.ENVIADA
+    assert notificacao.tentativas == 2
+    assert len(evolution_falsa.recebidas) == 2
+
+def test_ultima_tentativa_vai_para_dead_letter(criar_loja, evolution_falsa, rodar):
+    notificacao_id, = _enfileirar(criar_loja(), 1, tentativas=OUTBOX_MAX_TENTATIVAS - 1)
+    evolution_falsa.respostas = [500]
+    worker = _worker()
+
+    rodar(worker.processar_lote())
+
+    notificacao = _notificacoes([notificacao_id])[notificacao_id]
+    assert notificacao.status == StatusNotificacao.FALHA
+    assert notificacao.tentativas == OUTBOX_MAX_TENTATIVAS
+    assert "500" in notificacao.ultimo_erro
+    _liberar_agora([notificacao_id])
+    assert rodar(worker.processar_lote()) == 0
+
+def test_reserva_pula_mensagens_travadas(criar_loja, evolution_falsa, rodar):
+    ids = _enfileirar(criar_loja(), 6)
+
+    with SessionLocal() as outro_worker:
+        # Outro worker no meio da reserva: as linhas dele ficam travadas até o commit
+        travadas = outro_worker.scalars(
+            select(NotificacaoWhatsApp.id).where(NotificacaoWhatsApp.id.in_(ids[:2])).with_for_update()
+        ).all()
+        reservadas = rodar(asyncio.wait_for(_worker().reservar_lote(), timeout=5))
+        outro_worker.rollback()
+
+    assert sorted(n.id for n in reservadas) == ids[2:]
+    assert set(travadas).isdisjoint(n.id for n in reservadas)
+
+def test_dois_workers_enviam_cada_mensagem_uma_vez(criar_loja, evolution_falsa, rodar):
+    ids = _enfileirar(criar_loja(), 20)
+
+    async def cenario():
+        return await asyncio.gather(_worker().processar_lote(), _worker().processar_lote())
+
+    assert sum(rodar(cenario())) == 20
+    assert sorted(m["message"] for m in evolution_falsa.recebidas) == sorted(f"Mensagem {i}" for i in range(20))
+    assert all(n.status == StatusNotificacao.ENVIADA for n in _notificacoes(ids).values())
+
+def test_resultado_de_lease_vencido_nao_sobrescreve(criar_loja, evolution_falsa, rodar):
+    notificacao_id, = _enfileirar(criar_loja(), 1)
+    lento, rapido = _worker(), _worker()
+
+    reservadas = rodar(lento.reservar_lote())
+    # O lease do worker lento vence e outro worker reserva e envia a mesma mensagem
+    _liberar_agora([notificacao_id])
+    assert rodar(rapido.processar_lote()) == 1
+    rodar(lento.registrar_resultados(reservadas, [TimeoutError("timeout")]))
+
+    notificacao = _notificacoes([notificacao_id])[notificacao_id]
+    assert notificacao.status == StatusNotificacao.ENVIADA
+    assert notificacao.tentativas == 2
+    assert notificacao.ultimo_erro is None
+
+def test_lote_cabe_no_lease():
+    for workers in range(1, 33):
+        taxa = 5 / workers
+        lote = calcular_tamanho_lote(taxa)
+        assert lote >= 1
+        assert lote / taxa + EVOLUTION_TIMEOUT <= OUTBOX_LEASE
+
+def test_empresa_com_instancia_propria(criar_loja, cliente_http, evolution_falsa, rodar):
+    loja = criar_loja()
+    url = f"/empresas/{loja['empresa_ids'][0]}/whatsapp"
+
+    async def configurar(corpo):
+        async with cliente_http(loja["token"]) as cliente:
+            resposta = await cliente.put(url, json=corpo)
+            resposta.raise_for_status()
+            return resposta.json(), (await cliente.get(url)).json()
+
+    salvo, lido = rodar(configurar({"instancia": "loja-propria", "api_key": "chave-loja"}))
+    # A chave é só de escrita
+    assert salvo == lido == {"instancia": "loja-propria", "api_key_configurada": True}
+
+    _enfileirar(loja, 1)
+    rodar(_worker().processar_lote())
+    assert [(m["instancia"], m["apikey"]) for m in evolution_falsa.recebidas] == [("loja-propria", "chave-loja")]
+
+    # Sem api_key no corpo a chave gravada é mantida; instancia null volta para a global
+    assert rodar(configurar({"instancia": "renomeada"}))[1] == {"instancia": "renomeada", "api_key_configurada": True}
+    assert rodar(configurar({"instancia": None}))[1] == {"instancia": None, "api_key_configurada": False}
+    _enfileirar(loja, 1)
+    rodar(_worker().processar_lote())
+    assert (evolution_falsa.recebidas[-1]["instancia"], evolution_falsa.recebidas[-1]["apikey"]) == ("instancia-global", "chave-global")
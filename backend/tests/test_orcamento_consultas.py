@@ -0,0 +1,105 @@
+"""Orçamentos de consultas das rotas quentes, medidos no pior caso: usuário fora do cache de autenticação"""
+import pytest
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from metricas import contar_consultas
+from models import Produto
+from routers.empresas import ORCAMENTO_LISTAR_EMPRESAS
+from routers.pedidos import ORCAMENTO_CRIAR_PEDIDO, ORCAMENTO_LISTAR_PEDIDOS, ORCAMENTO_OBTER_PEDIDO
+
+def _consultas(resposta, orcamento: int) -> int:
+    """Consultas da requisição; confere que a rota declarou o orçamento esperado"""
+    resposta.raise_for_status()
+    assert int(resposta.headers["X-Orcamento-Consultas"]) == orcamento
+    return int(resposta.headers["X-Consultas-SQL"])
+
+def _carrinho(loja):
+    return {"itens": [
+        {"produto_id": produto_id, "quantidade": 1, "preco_unitario": 10.0} for produto_id in loja["produto_ids"]
+    ]}
+
+async def _primeira(cliente_http, loja, metodo, url, **kwargs):
+    async with cliente_http(loja["token"]) as cliente:
+        return await cliente.request(metodo, url, **kwargs)
+
+def test_criar_pedido(criar_loja, cliente_http, rodar):
+    consultas = {}
+    for linhas in (1, 25):
+        loja = criar_loja(produtos=linhas)
+        resposta = rodar(_primeira(cliente_http, loja, "POST", "/pedidos/", json=_carrinho(loja)))
+        consultas[linhas] = _consultas(resposta, ORCAMENTO_CRIAR_PEDIDO)
+
+    assert consultas[1] == consultas[25] <= ORCAMENTO_CRIAR_PEDIDO
+
+def test_criar_pedido_com_idempotency_key(criar_loja, cliente_http, rodar):
+    loja = criar_loja(produtos=25)
+
+    async def cenario():
+        async with cliente_http(loja["token"]) as cliente:
+            cabecalhos = {"Idempotency-Key": "checkout-1"}
+            primeira = await cliente.post("/pedidos/", json=_carrinho(loja), headers=cabecalhos)
+            repeticao = await cliente.post("/pedidos/", json=_carrinho(loja), headers=cabecalhos)
+            return primeira, repeticao
+
+    primeira, repeticao = rodar(cenario())
+    assert _consultas(primeira, ORCAMENTO_CRIAR_PEDIDO) <= ORCAMENTO_CRIAR_PEDIDO
+    assert repeticao.headers["Idempotent-Replayed"] == "true"
+    assert _consultas(repeticao, ORCAMENTO_CRIAR_PEDIDO) <= ORCAMENTO_CRIAR_PEDIDO
+
+def test_listar_pedidos(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=10)
+    criar_pedidos(loja, 150, itens_por_pedido=8)
+
+    resposta = rodar(_primeira(cliente_http, loja, "GET", "/pedidos/", params={"limit": 200}))
+
+    assert len(resposta.json()) == 150
+    assert _consultas(resposta, ORCAMENTO_LISTAR_PEDIDOS) <= ORCAMENTO_LISTAR_PEDIDOS
+
+def test_listar_pedidos_com_filtros(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=10)
+    criar_pedidos(loja, 60)
+    params = {"limit": 50, "status": ["PENDENTE", "CONFIRMADO"], "inicio": "2000-01-01", "empresa_id": loja["empresa_ids"][0]}
+
+    resposta = rodar(_primeira(cliente_http, loja, "GET", "/pedidos/", params=params))
+
+    assert len(resposta.json()) == 50
+    assert _consultas(resposta, ORCAMENTO_LISTAR_PEDIDOS) <= ORCAMENTO_LISTAR_PEDIDOS
+
+def test_obter_pedido(criar_loja, criar_pedidos, cliente_http, rodar):
+    loja = criar_loja(produtos=40)
+    pedido_id, = criar_pedidos(loja, 1, itens_por_pedido=40)
+
+    resposta = rodar(_primeira(cliente_http, loja, "GET", f"/pedidos/{pedido_id}"))
+
+    assert len(resposta.json()["itens"]) == 40
+    assert _consultas(resposta, ORCAMENTO_OBTER_PEDIDO) <= ORCAMENTO_OBTER_PEDIDO
+
+def test_read_empresas(criar_loja, cliente_http, rodar):
+    loja = criar_loja(empresas=8)
+
+    resposta = rodar(_primeira(cliente_http, loja, "GET", "/empresas/"))
+
+    assert len(resposta.json()) == 8
+    assert _consultas(resposta, ORCAMENTO_LISTAR_EMPRESAS) <= ORCAMENTO_LISTAR_EMPRESAS
+
+def test_contar_consultas(criar_loja, rodar):
+    produto_ids = criar_loja(produtos=3)["produto_ids"]
+
+    async def por_produto():
+        async with AsyncSessionLocal() as db:
+            for produto_id in produto_ids:
+                await db.scalar(select(Produto.nome).where(Produto.id == produto_id))
+
+    async def de_uma_vez():
+        async with AsyncSessionLocal() as db:
+            await db.scalars(select(Produto.nome).where(Produto.id.in_(produto_ids)))
+
+    with contar_consultas(maximo=1) as consultas:
+        rodar(de_uma_vez())
+    assert consultas.quantidade == 1
+    assert consultas.instrucoes[0].startswith("SELECT produtos.nome FROM produtos WHERE produtos.id IN")
+
+    # N+1: o bloco falha listando o SQL de cada consulta
+    with pytest.raises(AssertionError, match="3 consultas"):
+        with contar_consultas(maximo=1):
+            rodar(por_produto())
@@ -0,0 +1,127 @@
+import argparse
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal
+from models import Pedido, StatusPedido, VendaDiaria
+
+async def _incrementar(
+    db: AsyncSession,
+    empresa_id: int,
+    data: date,
+    total_pedidos: int = 0,
+    valor_total: float = 0.0,
+    cancelamentos: int = 0,
+    valor_cancelado: float = 0.0
+):
+    """Soma os deltas na linha do dia (cria a linha se ainda não existir).
+
+    Marca o dia para a próxima atualização da análise de produtos.
+    """
+    stmt = insert(VendaDiaria).values(
+        empresa_id=empresa_id,
+        data=data,
+        total_pedidos=total_pedidos,
+        valor_total=valor_total,
+        cancelamentos=cancelamentos,
+        valor_cancelado=valor_cancelado
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[VendaDiaria.empresa_id, VendaDiaria.data],
+        set_={
+            "total_pedidos": VendaDiaria.total_pedidos + stmt.excluded.total_pedidos,
+            "valor_total": VendaDiaria.valor_total + stmt.excluded.valor_total,
+            "cancelamentos": VendaDiaria.cancelamentos + stmt.excluded.cancelamentos,
+            "valor_cancelado": VendaDiaria.valor_cancelado + stmt.excluded.valor_cancelado,
+            "analise_pendente": True,
+        }
+    )
+    await db.execute(stmt)
+
+async def registrar_pedido(db: AsyncSession, pedido: Pedido):
+    """Conta um pedido novo no dia em que foi criado (mesma transação do pedido)"""
+    await _incrementar(
+        db,
+        pedido.empresa_id,
+        pedido.data_criacao.date(),
+        total_pedidos=1,
+        valor_total=pedido.valor_total
+    )
+
+async def registrar_mudanca_status(db: AsyncSession, pedido: Pedido, status_anterior: str, status_novo: str):
+    """Ajusta os cancelamentos do dia do pedido quando ele entra ou sai de CANCELADO"""
+    cancelado_antes = status_anterior == StatusPedido.CANCELADO
+    cancelado_agora = status_novo == StatusPedido.CANCELADO
+    if cancelado_antes == cancelado_agora:
+        return
+    sinal = 1 if cancelado_agora else -1
+    await _incrementar(
+        db,
+        pedido.empresa_id,
+        pedido.data_criacao.date(),
+        cancelamentos=sinal,
+        valor_cancelado=sinal * pedido.valor_total
+    )
+
+async def registrar_mudancas_status(db: AsyncSession, mudancas: Iterable[Tuple[Pedido, str, str]]):
+    """Versão em lote de registrar_mudanca_status: um upsert por empresa e dia afetados"""
+    deltas: Dict[Tuple[int, date], list] = {}
+    for pedido, status_anterior, status_novo in mudancas:
+        cancelado_antes = status_anterior == StatusPedido.CANCELADO
+        cancelado_agora = status_novo == StatusPedido.CANCELADO
+        if cancelado_antes == cancelado_agora:
+            continue
+        sinal = 1 if cancelado_agora else -1
+        delta = deltas.setdefault((pedido.empresa_id, pedido.data_criacao.date()), [0, 0.0])
+        delta[0] += sinal
+        delta[1] += sinal * pedido.valor_total
+    for (empresa_id, dia), (cancelamentos, valor_cancelado) in deltas.items():
+        await _incrementar(db, empresa_id, dia, cancelamentos=cancelamentos, valor_cancelado=valor_cancelado)
+
+def backfill(empresa_id: Optional[int] = None):
+    """Recalcula o resumo diário a partir da tabela de pedidos"""
+    db = SessionLocal()
+    try:
+        # Segura os incrementos dos pedidos em andamento até o fim do recálculo
+        db.execute(text("LOCK TABLE vendas_diarias IN EXCLUSIVE MODE"))
+
+        apagar = delete(VendaDiaria)
+        agregado = (
+            select(
+                Pedido.empresa_id,
+                func.date(Pedido.data_criacao),
+                func.count(Pedido.id),
+                func.coalesce(func.sum(Pedido.valor_total), 0),
+                func.count(Pedido.id).filter(Pedido.status == StatusPedido.CANCELADO),
+                func.coalesce(func.sum(Pedido.valor_total).filter(Pedido.status == StatusPedido.CANCELADO), 0),
+            )
+            .where(Pedido.empresa_id.is_not(None))
+            .group_by(Pedido.empresa_id, func.date(Pedido.data_criacao))
+        )
+        if empresa_id is not None:
+            apagar = apagar.where(VendaDiaria.empresa_id == empresa_id)
+            agregado = agregado.where(Pedido.empresa_id == empresa_id)
+
+        db.execute(apagar)
+        result = db.execute(
+            insert(VendaDiaria).from_select(
+                ["empresa_id", "data", "total_pedidos", "valor_total", "cancelamentos", "valor_cancelado"],
+                agregado
+            )
+        )
+        db.commit()
+        print(f"Resumo diário recalculado: {result.rowcount} dias")
+    except Exception as e:
+        db.rollback()
+        print(f"Erro ao recalcular resumo diário: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula a tabela vendas_diarias")
+    parser.add_argument("--empresa", type=int, help="Recalcula apenas uma empresa")
+    args = parser.parse_args()
+    backfill(args.empresa)
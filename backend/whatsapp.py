@@ -1,50 +1,295 @@
 import aiohttp
+import asyncio
 import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Empresa
 
 load_dotenv()
 
-class EvolutionWhatsAppAPI:
+# Configurações do cliente HTTP da Evolution API
+EVOLUTION_TIMEOUT = float(os.getenv("EVOLUTION_TIMEOUT", "10"))
+EVOLUTION_CONEXOES_MAX = int(os.getenv("EVOLUTION_CONEXOES_MAX", "100"))
+EVOLUTION_CONEXOES_POR_HOST = int(os.getenv("EVOLUTION_CONEXOES_POR_HOST", "20"))
+EVOLUTION_KEEPALIVE = float(os.getenv("EVOLUTION_KEEPALIVE", "60"))
+# Circuit breaker por instância
+EVOLUTION_CIRCUITO_FALHAS = int(os.getenv("EVOLUTION_CIRCUITO_FALHAS", "5"))
+EVOLUTION_CIRCUITO_ESPERA = float(os.getenv("EVOLUTION_CIRCUITO_ESPERA", "30"))
+# Tempo que as credenciais de uma empresa ficam em cache
+EVOLUTION_CREDENCIAIS_TTL = float(os.getenv("EVOLUTION_CREDENCIAIS_TTL", "300"))
+
+class CircuitoAbertoError(Exception):
+    """A instância está com o circuito aberto; a mensagem não foi enviada"""
+
+    def __init__(self, instancia: str, reabre_em: float):
+        super().__init__(f"Circuito aberto para a instância {instancia}")
+        self.instancia = instancia
+        self.reabre_em = reabre_em
+
+class CircuitBreaker:
+    """Abre após falhas consecutivas e libera uma tentativa depois da espera"""
+
+    def __init__(self, instancia: str, max_falhas: int = EVOLUTION_CIRCUITO_FALHAS, espera: float = EVOLUTION_CIRCUITO_ESPERA):
+        self.instancia = instancia
+        self.max_falhas = max_falhas
+        self.espera = espera
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._testando = False
+
+    @property
+    def estado(self) -> str:
+        if self.falhas < self.max_falhas:
+            return "fechado"
+        if time.monotonic() < self.aberto_ate:
+            return "aberto"
+        return "meio-aberto"
+
+    def verificar(self) -> bool:
+        """Levanta CircuitoAbertoError se a chamada não pode sair; True se ela é a tentativa de teste"""
+        estado = self.estado
+        if estado == "aberto" or (estado == "meio-aberto" and self._testando):
+            raise CircuitoAbertoError(self.instancia, max(self.aberto_ate - time.monotonic(), 0))
+        if estado == "meio-aberto":
+            # Apenas uma requisição de teste por vez
+            self._testando = True
+            return True
+        return False
+
+    def encerrar_teste(self):
+        """Libera a tentativa de teste que terminou sem sucesso nem falha (ex.: cancelada)"""
+        self._testando = False
+
+    def registrar_sucesso(self):
+        self.falhas = 0
+        self._testando = False
+
+    def registrar_falha(self):
+        self.falhas += 1
+        self._testando = False
+        if self.falhas >= self.max_falhas:
+            self.aberto_ate = time.monotonic() + self.espera
+
+class WhatsAppMetricas:
+    """Reuso de conexões e latência dos envios à Evolution API"""
+
+    # Limites (em segundos) dos buckets do histograma de latência
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
     def __init__(self):
-        self.api_url = os.getenv("EVOLUTION_API_URL")
-        self.instance = os.getenv("EVOLUTION_INSTANCE")
-        self.api_key = os.getenv("EVOLUTION_API_KEY")
+        self.conexoes_novas = 0
+        self.conexoes_reutilizadas = 0
+        self.envios = 0
+        self.erros = 0
+        self.rejeitados_circuito = 0
+        self.latencia_total = 0.0
+        self.latencia_buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def registrar_envio(self, segundos: float, sucesso: bool):
+        self.envios += 1
+        if not sucesso:
+            self.erros += 1
+        self.latencia_total += segundos
+        self.latencia_buckets[bisect_left(self.BUCKETS, segundos)] += 1
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def conexao_criada(session, ctx, params):
+            self.conexoes_novas += 1
+
+        async def conexao_reutilizada(session, ctx, params):
+            self.conexoes_reutilizadas += 1
+
+        trace.on_connection_create_end.append(conexao_criada)
+        trace.on_connection_reuseconn.append(conexao_reutilizada)
+        return trace
+
+    def snapshot(self) -> dict:
+        acumulado = 0
+        histograma = {}
+        for limite, quantidade in zip(self.BUCKETS + ("+Inf",), self.latencia_buckets):
+            acumulado += quantidade
+            histograma[str(limite)] = acumulado
+        return {
+            "conexoes_novas": self.conexoes_novas,
+            "conexoes_reutilizadas": self.conexoes_reutilizadas,
+            "envios": self.envios,
+            "erros": self.erros,
+            "rejeitados_circuito": self.rejeitados_circuito,
+            "latencia_total_segundos": self.latencia_total,
+            "latencia_histograma": histograma,
+        }
+
+metricas = WhatsAppMetricas()
+_sessao: Optional[aiohttp.ClientSession] = None
+_circuitos: Dict[str, CircuitBreaker] = {}
+
+def obter_sessao() -> aiohttp.ClientSession:
+    """Sessão HTTP única por worker, com keep-alive entre as mensagens"""
+    global _sessao
+    if _sessao is None or _sessao.closed:
+        _sessao = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=EVOLUTION_CONEXOES_MAX,
+                limit_per_host=EVOLUTION_CONEXOES_POR_HOST,
+                keepalive_timeout=EVOLUTION_KEEPALIVE,
+                ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=EVOLUTION_TIMEOUT),
+            trace_configs=[metricas.trace_config()]
+        )
+    return _sessao
+
+async def fechar_sessao():
+    global _sessao
+    if _sessao is not None:
+        await _sessao.close()
+        _sessao = None
+
+def obter_circuito(instancia: str) -> CircuitBreaker:
+    if instancia not in _circuitos:
+        _circuitos[instancia] = CircuitBreaker(instancia)
+    return _circuitos[instancia]
+
+def get_whatsapp_stats() -> dict:
+    """Métricas do cliente da Evolution API deste worker"""
+    return {
+        **metricas.snapshot(),
+        "circuitos": {instancia: circuito.estado for instancia, circuito in _circuitos.items()},
+    }
+
+class EvolutionWhatsAppAPI:
+    def __init__(self, instance: Optional[str] = None, api_key: Optional[str] = None, api_url: Optional[str] = None):
+        self.api_url = api_url or os.getenv("EVOLUTION_API_URL")
+        self.instance = instance or os.getenv("EVOLUTION_INSTANCE")
+        self.api_key = api_key or os.getenv("EVOLUTION_API_KEY")
 
     async def enviar_mensagem(self, numero: str, mensagem: str):
         """Envia uma mensagem para um número do WhatsApp usando a Evolution API"""
+        circuito = obter_circuito(self.instance)
+        try:
+            teste = circuito.verificar()
+        except CircuitoAbertoError:
+            metricas.rejeitados_circuito += 1
+            raise
+
         headers = {
             "apikey": self.api_key,
             "Content-Type": "application/json"
         }
-        
+
         payload = {
             "number": numero,
             "message": mensagem
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
+        inicio = time.perf_counter()
+        try:
+            async with obter_sessao().post(
                 f"{self.api_url}/message/text/{self.instance}",
                 headers=headers,
                 json=payload
             ) as response:
-                return await response.json()
+                response.raise_for_status()
+                resultado = await response.json()
+        except Exception:
+            metricas.registrar_envio(time.perf_counter() - inicio, sucesso=False)
+            circuito.registrar_falha()
+            raise
+        finally:
+            # Cancelado no meio do teste (CancelledError não é Exception): sem isto o circuito nunca fecharia
+            if teste:
+                circuito.encerrar_teste()
+        metricas.registrar_envio(time.perf_counter() - inicio, sucesso=True)
+        circuito.registrar_sucesso()
+        return resultado
 
-    async def enviar_confirmacao_pedido(self, numero: str, pedido_id: int, total: float):
-        """Envia uma confirmação de pedido via WhatsApp"""
-        mensagem = (
+    @staticmethod
+    def mensagem_confirmacao_pedido(pedido_id: int, total: float) -> str:
+        """Texto da confirmação de pedido"""
+        return (
             f"🛍️ Pedido #{pedido_id} confirmado!\n\n"
             f"Valor total: R$ {total:.2f}\n\n"
             "Agradecemos sua compra! Em breve você receberá mais informações "
             "sobre o status do seu pedido."
         )
-        return await self.enviar_mensagem(numero, mensagem)
 
-    async def enviar_atualizacao_status(self, numero: str, pedido_id: int, status: str):
-        """Envia uma atualização de status do pedido"""
-        mensagem = (
+    @staticmethod
+    def mensagem_atualizacao_status(pedido_id: int, status: str) -> str:
+        """Texto da atualização de status do pedido"""
+        return (
             f"📦 Atualização do Pedido #{pedido_id}\n\n"
             f"Status atual: {status}\n\n"
             "Para mais informações, acesse nosso sistema."
         )
+
+    @staticmethod
+    def mensagem_atualizacao_status_lote(pedido_ids: List[int], status: str) -> str:
+        """Uma mensagem só para vários pedidos do mesmo cliente que mudaram juntos"""
+        if len(pedido_ids) == 1:
+            return EvolutionWhatsAppAPI.mensagem_atualizacao_status(pedido_ids[0], status)
+        pedidos = ", ".join(f"#{pedido_id}" for pedido_id in pedido_ids)
+        return (
+            f"📦 Atualização dos Pedidos {pedidos}\n\n"
+            f"Status atual: {status}\n\n"
+            "Para mais informações, acesse nosso sistema."
+        )
+
+    async def enviar_confirmacao_pedido(self, numero: str, pedido_id: int, total: float):
+        """Envia uma confirmação de pedido via WhatsApp"""
+        mensagem = self.mensagem_confirmacao_pedido(pedido_id, total)
         return await self.enviar_mensagem(numero, mensagem)
+
+    async def enviar_atualizacao_status(self, numero: str, pedido_id: int, status: str):
+        """Envia uma atualização de status do pedido"""
+        mensagem = self.mensagem_atualizacao_status(pedido_id, status)
+        return await self.enviar_mensagem(numero, mensagem)
+
+class ClientesWhatsApp:
+    """Clientes da Evolution API por empresa, com as credenciais em cache"""
+
+    def __init__(self, session_factory, ttl: float = EVOLUTION_CREDENCIAIS_TTL):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._clientes: Dict[int, Tuple[float, EvolutionWhatsAppAPI]] = {}
+        self._lock = asyncio.Lock()
+
+    async def obter(self, empresa_id: int) -> EvolutionWhatsAppAPI:
+        item = self._clientes.get(empresa_id)
+        if item and item[0] > time.monotonic():
+            return item[1]
+        async with self._lock:
+            item = self._clientes.get(empresa_id)
+            if item and item[0] > time.monotonic():
+                return item[1]
+            cliente = await self._carregar(empresa_id)
+            self._clientes[empresa_id] = (time.monotonic() + self.ttl, cliente)
+            return cliente
+
+    async def _carregar(self, empresa_id: int) -> EvolutionWhatsAppAPI:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(Empresa.whatsapp_instancia, Empresa.whatsapp_api_key)
+                .where(Empresa.id == empresa_id)
+            )
+            credenciais = result.first()
+        # Empresas sem instância própria usam a instância global do .env
+        if credenciais is None or not credenciais.whatsapp_instancia:
+            return EvolutionWhatsAppAPI()
+        return EvolutionWhatsAppAPI(
+            instance=credenciais.whatsapp_instancia,
+            api_key=credenciais.whatsapp_api_key
+        )
+
+    def invalidar(self, empresa_id: Optional[int] = None):
+        if empresa_id is None:
+            self._clientes.clear()
+        else:
+            self._clientes.pop(empresa_id, None)
+
+clientes_whatsapp = ClientesWhatsApp(AsyncSessionLocal)
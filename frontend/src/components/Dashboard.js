@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Grid,
@@ -48,13 +48,79 @@ const Dashboard = () => {
   const [ultimosPedidos, setUltimosPedidos] = useState([]);
   const [vendasPorDia, setVendasPorDia] = useState([]);
 
+  const recarga = useRef(null);
+
   useEffect(() => {
     carregarDados();
+
+    // Atualiza quando chegam pedidos ou mudanças de status, em vez de consultar periodicamente.
+    // O EventSource não envia cabeçalhos: a URL leva um ticket de poucos segundos, não o token de acesso
+    let eventos = null;
+    let consulta = null;
+    let reconexao = null;
+    let encerrado = false;
+    let primeiraConexao = true;
+    const agendarRecarga = () => {
+      // Agrupa rajadas de eventos numa única recarga
+      clearTimeout(recarga.current);
+      recarga.current = setTimeout(() => carregarDados(true), 500);
+    };
+    const consultarPeriodicamente = () => {
+      if (!consulta) {
+        console.warn('Feed de pedidos em tempo real indisponível; atualizando a cada 30s');
+        consulta = setInterval(() => carregarDados(true), 30000);
+      }
+    };
+
+    const conectar = async () => {
+      let ticket;
+      try {
+        ticket = (await api.post('/pedidos/eventos/ticket')).data.ticket;
+      } catch (error) {
+        consultarPeriodicamente();
+        return;
+      }
+      if (encerrado) return;
+      let conectou = false;
+      eventos = new EventSource(
+        `${api.defaults.baseURL}/pedidos/eventos?ticket=${encodeURIComponent(ticket)}`
+      );
+      eventos.addEventListener('conectado', () => {
+        // Reconexão: eventos podem ter se perdido enquanto esteve fora
+        if (!primeiraConexao) agendarRecarga();
+        primeiraConexao = false;
+        conectou = true;
+      });
+      eventos.addEventListener('pedido_criado', agendarRecarga);
+      eventos.addEventListener('status_atualizado', agendarRecarga);
+      eventos.addEventListener('ressincronizar', agendarRecarga);
+
+      // Quedas de rede o EventSource reconecta sozinho, mas com o ticket já vencido a reconexão
+      // recebe 401 e o stream fecha: se ele chegou a conectar, pede outro ticket; resposta de erro
+      // logo na abertura (403, 404, 503) avisa e passa a recarregar periodicamente
+      eventos.onerror = () => {
+        if (eventos.readyState !== EventSource.CLOSED) return;
+        if (conectou) {
+          reconexao = setTimeout(conectar, 1000);
+        } else {
+          consultarPeriodicamente();
+        }
+      };
+    };
+    conectar();
+
+    return () => {
+      encerrado = true;
+      if (eventos) eventos.close();
+      clearTimeout(recarga.current);
+      clearTimeout(reconexao);
+      clearInterval(consulta);
+    };
   }, []);
 
-  const carregarDados = async () => {
+  const carregarDados = async (silencioso = false) => {
     try {
-      setLoading(true);
+      if (!silencioso) setLoading(true);
       const [statsResponse, pedidosResponse, vendasResponse] = await Promise.all([
         api.get('/estatisticas/dashboard'),
         api.get('/pedidos/ultimos'),
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Grid,
@@ -29,21 +29,37 @@ import api from '../../services/api';
 const VitrineProdutos = ({ empresa }) => {
   const [produtos, setProdutos] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [carrinho, setCarrinho] = useState([]);
   const [openCarrinho, setOpenCarrinho] = useState(false);
   const [telefoneCliente, setTelefoneCliente] = useState('');
   const [enviandoPedido, setEnviandoPedido] = useState(false);
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
+  const chavePedido = useRef(null);
 
   useEffect(() => {
     carregarProdutos();
   }, []);
 
+  // Carrinho ou telefone mudou: é outro pedido, com outra Idempotency-Key
+  useEffect(() => {
+    chavePedido.current = null;
+  }, [carrinho, telefoneCliente]);
+
+  const buscarPagina = async (cursor) => {
+    // O backend já filtra os produtos em estoque e pagina por cursor
+    const response = await api.get(`/produtos/empresa/${empresa.id}`, {
+      params: { em_estoque: true, cursor }
+    });
+    setProximoCursor(response.headers['x-proximo-cursor'] || null);
+    return response.data;
+  };
+
   const carregarProdutos = async () => {
     try {
       setLoading(true);
-      const response = await api.get(`/produtos/empresa/${empresa.id}`);
-      setProdutos(response.data.filter(p => p.quantidade_estoque > 0));
+      setProdutos(await buscarPagina());
     } catch (error) {
       setSnackbar({
         open: true,
@@ -55,6 +71,23 @@ const VitrineProdutos = ({ empresa }) => {
     }
   };
 
+  // Próxima página só quando o cliente pede, em vez de baixar o catálogo inteiro na abertura
+  const carregarMais = async () => {
+    try {
+      setCarregandoMais(true);
+      const pagina = await buscarPagina(proximoCursor);
+      setProdutos(prevProdutos => [...prevProdutos, ...pagina]);
+    } catch (error) {
+      setSnackbar({
+        open: true,
+        message: 'Erro ao carregar produtos',
+        severity: 'error'
+      });
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const adicionarAoCarrinho = (produto) => {
     setCarrinho(prevCarrinho => {
       const itemExistente = prevCarrinho.find(item => item.id === produto.id);
@@ -123,7 +156,16 @@ const VitrineProdutos = ({ empresa }) => {
         }))
       };
 
-      await api.post('/pedidos', pedido);
+      // Mesma chave em todas as tentativas deste carrinho: o servidor não duplica o pedido
+      if (!chavePedido.current) {
+        chavePedido.current = window.crypto?.randomUUID
+          ? window.crypto.randomUUID()
+          : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      }
+      await api.post('/pedidos', pedido, {
+        headers: { 'Idempotency-Key': chavePedido.current },
+      });
+      chavePedido.current = null;
       
       // Enviar mensagem via WhatsApp
       const mensagem = formatarMensagemWhatsApp();
@@ -226,6 +268,18 @@ const VitrineProdutos = ({ empresa }) => {
         </Grid>
       )}
 
+      {!loading && proximoCursor && (
+        <Box sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
+          <Button
+            variant="outlined"
+            onClick={carregarMais}
+            disabled={carregandoMais}
+          >
+            {carregandoMais ? 'Carregando...' : 'Carregar mais produtos'}
+          </Button>
+        </Box>
+      )}
+
       {/* Dialog do Carrinho */}
       <Dialog
         open={openCarrinho}